@@ -113,6 +113,7 @@ struct VideoFrame {
 VideoFrame videoFrames[MAX_FRAMES];
 int frameCount = 0;
 String currentSessionId = "";  // Track current recording session
+String sessionToken = "";  // Signed token from registration, sent as Authorization: Bearer
 int totalFramesSent = 0;  // Track total frames uploaded in session
 
 unsigned long recordingStartTime = 0;
@@ -328,6 +329,9 @@ bool sendHeartbeat() {
   }
   
   http.addHeader("Content-Type", "application/json");
+  if (sessionToken.length() > 0) {
+    http.addHeader("Authorization", "Bearer " + sessionToken);
+  }
   http.setTimeout(10000);  // 10 second timeout
   
   // Build JSON payload
@@ -360,6 +364,14 @@ bool sendHeartbeat() {
     http.end();
     delete client;
     return true;
+  } else if (httpCode == 401 && sessionToken.length() > 0) {
+    // Token expired or server secret changed - register again for a new one
+    Serial.println("[AUTH] Session token rejected, re-registering...");
+    sessionToken = "";
+    http.end();
+    delete client;
+    registerDevice();
+    return false;
   } else {
     // Only print errors occasionally to avoid spam
     static int errorCount = 0;
@@ -484,6 +496,12 @@ bool registerDevice() {
     Serial.println("Server response: " + response);
     
     if (httpCode == 200) {
+      // Extract the session token (simple JSON parsing)
+      int tokenStart = response.indexOf("\"token\":\"");
+      if (tokenStart >= 0) {
+        tokenStart += 9;
+        sessionToken = response.substring(tokenStart, response.indexOf("\"", tokenStart));
+      }
       http.end();
       delete client;
       return true;
@@ -698,6 +716,9 @@ bool sendFrameToServer(uint8_t* frameData, size_t frameSize, int frameNumber) {
   }
   
   streamHttp->addHeader("Content-Type", "application/json");
+  if (sessionToken.length() > 0) {
+    streamHttp->addHeader("Authorization", "Bearer " + sessionToken);
+  }
   streamHttp->setTimeout(5000);  // 5 second timeout
   
   // Encode frame to base64
@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 import requests
 import uvicorn
@@ -12,29 +12,47 @@ import time  # Added for locket heartbeat timestamps
 import subprocess
 import traceback
 import base64
+import hashlib
 import asyncio  # For waiting on ESP32 video
+from contextlib import asynccontextmanager
 
 # Import database functions
 from database import (
-    save_conversation,
+    save_conversation_async,
     load_conversation,
-    get_conversation_context,
+    load_conversation_page,
+    get_history_version,
     init_database,
+    warm_database_connections,
+    close_database,
+    get_pool_stats,
+    get_writer_stats,
+    get_partition_stats,
+    get_user_directory_stats,
     register_user,
+    update_detailed_memory,
     verify_login,
     check_username_exists
 )
+from conversation_summary import register_text_generator
+from prompt_assembly import assemble_request, LOCKET_HISTORY_LIMIT
+from persona_router import persona_router
+from model_router import model_router, contents_tokens, GEMINI_CAPABLE_MODEL, MODEL_TIERS
+from media_jobs import enqueue_job, register_job_handler, start_workers
+from assets import IMMUTABLE_CACHE_CONTROL, get_hashed_asset, get_template, preload_assets
+from media import media_from_data_url, media_from_stream, media_from_upload, post_gemini, warm_gemini_connection
+from prompt_cache import create_prompt_cache
+from gemini_files import configure as configure_file_api, gemini_media_part_async
+from image_normalizer import normalize_image_async, normalized_image_part
+from chunked_upload import UploadError, create_upload, get_upload, write_chunk, finalize_upload
+from session_tokens import SessionTokenError, authenticate_request, issue_session_token
 
 # Import ESP32 integration functions
 from esp32_integration import (
-    init_devices_table,
-    register_device_db,
-    register_device_json,
-    get_device_username_db,
-    get_device_username_json,
-    update_device_last_seen_db,
-    update_device_last_seen_json,
-    USE_DATABASE as ESP_USE_DATABASE
+    register_device,
+    get_device_username,
+    update_device_last_seen,
+    warm_device_cache
 )
 
 # Get API keys from environment variables (for deployment) or fallback to local config
@@ -48,29 +66,146 @@ except ImportError:
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables or config file")
 
-app = FastAPI()
+configure_file_api(GEMINI_API_KEY)
 
 GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
-GEMINI_MODEL = "gemini-2.5-flash"  # Stable model that works with both v1beta and v1
+GEMINI_MODEL = GEMINI_CAPABLE_MODEL  # Default (capable) tier - model_router picks the model per request
 
-# Initialize database on startup
-db_pool = init_database()
+# Set by init_database() during startup (None with SQLite / JSON storage)
+db_pool = None
 
-# Initialize ESP32 devices table
-if db_pool:
-    init_devices_table(db_pool)
+# Seconds spent in each startup phase (shown by /debug/startup)
+startup_timings = {}
+
+async def run_startup_phase(name, func, *args, required=False):
+    """Run one blocking startup step in a worker thread and record how long it took"""
+    started = time.perf_counter()
+    try:
+        return await asyncio.to_thread(func, *args)
+    except Exception as e:
+        if required:
+            raise
+        print(f"[WARNING] Startup phase {name} failed: {e}")
+    finally:
+        startup_timings[name] = round(time.perf_counter() - started, 4)
+
+async def start_storage():
+    """Schema and pool first, then the warm-ups and the job workers that need them"""
+    global db_pool
+    db_pool = await run_startup_phase("database", init_database, required=True)
+    await asyncio.gather(
+        run_startup_phase("device_cache", warm_device_cache, db_pool),
+        run_startup_phase("db_connections", warm_database_connections),
+        # Jobs left pending or running by the previous process are picked up right away
+        run_startup_phase("media_jobs", start_workers)
+    )
+
+async def start_prompts():
+    """Personas first, then the router and the prompts built from them (to the context cache)"""
+    await run_startup_phase("personas", load_all_personas)
+    await run_startup_phase("persona_router", train_persona_router)
+    await run_startup_phase("prompt_cache", warm_prompt_cache)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Startup: storage, personas, assets and the Gemini TLS connection are prepared in
+    parallel before the first request is accepted. Shutdown: queued writes are flushed"""
+    started = time.perf_counter()
+    await asyncio.gather(
+        start_storage(),
+        start_prompts(),
+        run_startup_phase("assets", preload_assets),
+        run_startup_phase("gemini_connection", warm_gemini_connection, GEMINI_BASE_URL)
+    )
+    startup_timings["total"] = round(time.perf_counter() - started, 4)
+    print(f"[STARTUP] Ready in {startup_timings['total']:.3f}s: {startup_timings}")
+    yield
+    close_database()
+
+app = FastAPI(lifespan=lifespan)
+
+def generate_text(prompt, max_output_tokens=None):
+    """Run a text-only Gemini call and return the reply text (None on failure)"""
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    if max_output_tokens:
+        payload["generationConfig"] = {"maxOutputTokens": max_output_tokens}
+    route = route_model(payload, "background")
+    
+    try:
+        response = post_routed(route, payload, timeout=60)
+        if response.status_code == 200:
+            data = response.json()
+            if "candidates" in data and len(data["candidates"]) > 0:
+                return data["candidates"][0]["content"]["parts"][0]["text"]
+        print(f"[ERROR] Gemini text generation failed: {response.status_code}")
+    except Exception as e:
+        print(f"[ERROR] Gemini text generation error: {e}")
+    return None
+
+# Background stages that need plain text generation
+register_text_generator(generate_text)
+
+# Static system prompts registered once with Gemini's context cache
+prompt_cache = create_prompt_cache(GEMINI_API_KEY, GEMINI_BASE_URL)
+
+def post_cached_prompt(api_url, payload, **kwargs):
+    """post_gemini, retried once with the prompt inline when the referenced cache has expired upstream"""
+    response = post_gemini(api_url, payload, **kwargs)
+    if (payload.get("cachedContent") and response.status_code in (400, 403, 404)
+            and "cache" in response.text.lower() and prompt_cache.fall_back_inline(payload)):
+        print("[PROMPT CACHE] Cached prompt rejected upstream, retrying inline")
+        response = post_gemini(api_url, payload, **kwargs)
+    return response
+
+def gemini_url(model):
+    return f"{GEMINI_BASE_URL}/models/{model}:generateContent?key={GEMINI_API_KEY}"
+
+def route_model(payload, channel, media_type=None, personas=None, system_prompt=None):
+    """Pick the model and generationConfig for a payload, then attach the system prompt for that model"""
+    route = model_router.select(channel, media_type, contents_tokens(payload), personas)
+    model_router.apply(payload, route)
+    if system_prompt:
+        prompt_cache.apply(payload, route["model"], system_prompt)
+    return route
+
+def post_routed(route, payload, **kwargs):
+    """post_cached_prompt to the route's model, recording the call's latency under the route"""
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = post_cached_prompt(gemini_url(route["model"]), payload, **kwargs)
+        ok = response.status_code == 200
+        return response
+    finally:
+        model_router.record(route, time.perf_counter() - started, ok)
 
 # Persona Management
 PERSONAS_DIR = "personas"
 
+# Persona files rarely change - parsed copies are reused until the file's mtime changes
+_persona_cache = {}  # persona_name -> (mtime_ns, persona_data)
+
+def persona_files_signature():
+    """(file, mtime, size) of every persona file - changes whenever a persona is edited"""
+    signature = []
+    for persona_file in sorted(glob.glob(os.path.join(PERSONAS_DIR, "*.json"))):
+        stat = os.stat(persona_file)
+        signature.append((os.path.basename(persona_file), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
 def load_persona(persona_name):
     """Load a persona configuration from JSON file"""
     try:
         persona_file = os.path.join(PERSONAS_DIR, f"{persona_name}.json")
         if os.path.exists(persona_file):
+            mtime = os.stat(persona_file).st_mtime_ns
+            cached = _persona_cache.get(persona_name)
+            if cached and cached[0] == mtime:
+                return cached[1]
             with open(persona_file, 'r', encoding='utf-8') as f:
                 persona_data = json.load(f)
                 print(f"[SUCCESS] Loaded persona: {persona_data.get('persona_name', persona_name)}")
+                _persona_cache[persona_name] = (mtime, persona_data)
                 return persona_data
         else:
             print(f"[ERROR] Persona file not found: {persona_file}")
@@ -119,90 +254,139 @@ def get_sustainability_prompt(username):
             "Analyze both visual and audio content to provide meaningful, caring insights."
         )
 
-def get_personal_assistant_prompt(username):
-    """Get personal assistant prompt using persona files"""
-    # Load all personas for the multi-persona system
-    personas = load_all_personas()
+def personal_assistant_user_block(username):
+    """The only per-user part of the personal assistant instructions - sent next to the static prompt"""
+    return (
+        f"CURRENT USER: You are talking with {username}. Wherever your instructions say <user's name> "
+        f"or 'the user', that is {username}."
+    )
+
+# Per-request instructions that go in the final user turn when there is history to refer to
+CHAT_MEMORY_INSTRUCTIONS = """CRITICAL MEMORY INSTRUCTIONS FOR THIS RESPONSE:
+1. The earlier turns of this conversation contain previous interactions. Reference specific details when relevant.
+2. If earlier turns include media, you have already analyzed that media. Reference those observations.
+3. Do not refer to message numbers. Refer to content naturally.
+4. Build on previous context.
+5. CRITICAL: After your persona introduction (e.g., 'Tech Rile here!'), speak in FIRST PERSON only using 'I', 'me', 'my'. NEVER use 'Rile' again in the response.
+Remember: Introduce your persona, then use only first person (I/me/my) for the rest of your response."""
+
+ESP32_MEMORY_INSTRUCTIONS = """CRITICAL MEMORY INSTRUCTIONS FOR THIS RESPONSE:
+1. The earlier turns of this conversation contain previous interactions. Reference specific details when relevant.
+2. This is a hands-free ESP32-CAM device request. The user is wearing this as a locket.
+3. Keep responses concise and conversational for audio playback.
+4. After your persona introduction, speak in FIRST PERSON only using 'I', 'me', 'my'."""
+
+# System prompt for locket frame analysis (static - the wearer's name goes in the user turn)
+LOCKET_FRAMES_PROMPT = """You are an AI assistant integrated into a wearable camera locket worn by the user.
+
+CRITICAL CONTEXT:
+- You are analyzing video frames captured by a camera locket that the user is wearing
+- These frames show what's in front of the user from their first-person perspective
+- The locket captures the user's environment and activities as they move around
+- You should describe what you see as if you're observing through the user's wearable camera
+
+RESPONSE STYLE:
+- Be conversational and natural, as if you're a helpful AI companion
+- Describe scenes from the wearer's perspective
+- Note any interesting objects, people, activities, or changes in the environment
+- If asked "what do you see", describe the current environment captured in the frames
+- Keep responses concise but informative (2-4 sentences unless more detail is requested)
+- Use present tense as if describing what the locket is currently seeing
+
+LOCKET MODE AWARENESS:
+- You're seeing the world through a wearable camera, not a handheld device
+- Frames may show movement or slight motion blur as the user moves
+- The view is from chest/neck level (where the locket is worn)
+- Multiple frames give you a sense of the environment over time"""
+
+# The multi-persona prompts only change when a persona file does
+_personal_assistant_prompt_cache = {}  # (persona files signature, routed personas) -> prompt
+
+def get_personal_assistant_prompt(persona_keys=None):
+    """Static multi-persona system prompt built from the persona files
+
+    Identical for every user (the name is added by personal_assistant_user_block), so
+    it can be registered once as a cached prefix with Gemini. With persona_keys (from
+    route_personas) only those personas are included.
+    """
+    signature = persona_files_signature()
+    cache_key = (signature, tuple(persona_keys) if persona_keys else None)
+    cached = _personal_assistant_prompt_cache.get(cache_key)
+    if cached:
+        return cached
+    prompt = build_personal_assistant_prompt(persona_keys)
+    for stale_key in [key for key in _personal_assistant_prompt_cache if key[0] != signature]:
+        del _personal_assistant_prompt_cache[stale_key]
+    _personal_assistant_prompt_cache[cache_key] = prompt
+    return prompt
+
+def train_persona_router():
+    """Fit the persona router to the current persona files (personal assistant personas only)"""
+    signature = persona_files_signature()
+    personas = {k: v for k, v in load_all_personas().items() if k != "sustainability_rile"}
+    return persona_router.train(personas, signature)
+
+def route_personas(message):
+    """Personas whose rubrics a personal-assistant prompt for this message needs (None = all)"""
+    if persona_router.signature != persona_files_signature():
+        train_persona_router()
+    return persona_router.route(message)
+
+def format_persona_rubric(persona_name, rubric):
+    """Behavioral rubric of one persona as prompt text"""
+    rubric_text = f"\n\n{persona_name} BEHAVIORAL RUBRIC:\n"
     
-    # Filter out sustainability persona for personal assistant mode
-    assistant_personas = {k: v for k, v in personas.items() if k != "sustainability_rile"}
+    # Core principles
+    if "core_principles" in rubric:
+        rubric_text += "CORE PRINCIPLES:\n"
+        for principle, guideline in rubric["core_principles"].items():
+            rubric_text += f"- {principle.replace('_', ' ').title()}: {guideline}\n"
     
-    if not assistant_personas:
-        # Fallback to original hardcoded prompt if no personas loaded
-        return get_fallback_personal_assistant_prompt(username)
+    # Emotional awareness
+    if "emotional_awareness_guidelines" in rubric:
+        rubric_text += "\nEMOTIONAL AWARENESS:\n"
+        for situation, rules in rubric["emotional_awareness_guidelines"].items():
+            rubric_text += f"\n{situation.replace('_', ' ').title()}:\n"
+            if "DO" in rules:
+                rubric_text += "DO: " + "; ".join(rules["DO"]) + "\n"
+            if "DO_NOT" in rules:
+                rubric_text += "DO NOT: " + "; ".join(rules["DO_NOT"]) + "\n"
     
-    # Build the introduction section
-    intro_lines = []
-    for persona_key, persona_data in assistant_personas.items():
-        emoji = persona_data.get("emoji", "🤖")
-        persona_name = persona_data.get("persona_name", "Unknown")
-        greeting = persona_data.get("greeting", "Ready to help!")
-        intro_lines.append(f'{emoji} {persona_name}: "{greeting}"')
+    # Response structure
+    if "response_structure" in rubric:
+        rubric_text += "\nRESPONSE STRUCTURE:\n"
+        structure = rubric["response_structure"]
+        if "opening" in structure:
+            rubric_text += f"Opening: {structure['opening'].get('example', '')} - {structure['opening'].get('emotional_acknowledgment', '')}\n"
+        if "body" in structure:
+            rubric_text += f"Body: Focus on {structure['body'].get('focus', 'user request')}\n"
+        if "closing" in structure:
+            rubric_text += f"Closing: {structure['closing'].get('example', '')}\n"
     
-    intro_text = "\n".join(intro_lines)
+    # Communication patterns
+    if "communication_patterns" in rubric:
+        rubric_text += "\nCOMMUNICATION PATTERNS:\n"
+        for pattern_name, pattern_rules in rubric["communication_patterns"].items():
+            if "rule" in pattern_rules:
+                rubric_text += f"- {pattern_name.replace('_', ' ').title()}: {pattern_rules['rule']}\n"
+            if "example_correct" in pattern_rules:
+                rubric_text += f"  ✓ Correct: {pattern_rules['example_correct']}\n"
+            if "example_wrong" in pattern_rules:
+                rubric_text += f"  ✗ Wrong: {pattern_rules['example_wrong']}\n"
     
-    # Build the personas section with rubrics
-    persona_descriptions = []
-    persona_rubrics = []
-    for persona_key, persona_data in assistant_personas.items():
-        persona_name = persona_data.get("persona_name", "Unknown").upper()
-        prompt_template = persona_data.get("prompt_template", "General assistance")
-        persona_descriptions.append(f"{persona_name}: {prompt_template}")
-        
-        # Add rubric guidelines if available
-        if "rubric" in persona_data:
-            rubric = persona_data["rubric"]
-            rubric_text = f"\n\n{persona_name} BEHAVIORAL RUBRIC:\n"
-            
-            # Core principles
-            if "core_principles" in rubric:
-                rubric_text += "CORE PRINCIPLES:\n"
-                for principle, guideline in rubric["core_principles"].items():
-                    rubric_text += f"- {principle.replace('_', ' ').title()}: {guideline}\n"
-            
-            # Emotional awareness
-            if "emotional_awareness_guidelines" in rubric:
-                rubric_text += "\nEMOTIONAL AWARENESS:\n"
-                for situation, rules in rubric["emotional_awareness_guidelines"].items():
-                    rubric_text += f"\n{situation.replace('_', ' ').title()}:\n"
-                    if "DO" in rules:
-                        rubric_text += "DO: " + "; ".join(rules["DO"]) + "\n"
-                    if "DO_NOT" in rules:
-                        rubric_text += "DO NOT: " + "; ".join(rules["DO_NOT"]) + "\n"
-            
-            # Response structure
-            if "response_structure" in rubric:
-                rubric_text += "\nRESPONSE STRUCTURE:\n"
-                structure = rubric["response_structure"]
-                if "opening" in structure:
-                    rubric_text += f"Opening: {structure['opening'].get('example', '')} - {structure['opening'].get('emotional_acknowledgment', '')}\n"
-                if "body" in structure:
-                    rubric_text += f"Body: Focus on {structure['body'].get('focus', 'user request')}\n"
-                if "closing" in structure:
-                    rubric_text += f"Closing: {structure['closing'].get('example', '')}\n"
-            
-            # Communication patterns
-            if "communication_patterns" in rubric:
-                rubric_text += "\nCOMMUNICATION PATTERNS:\n"
-                for pattern_name, pattern_rules in rubric["communication_patterns"].items():
-                    if "rule" in pattern_rules:
-                        rubric_text += f"- {pattern_name.replace('_', ' ').title()}: {pattern_rules['rule']}\n"
-                    if "example_correct" in pattern_rules:
-                        rubric_text += f"  ✓ Correct: {pattern_rules['example_correct']}\n"
-                    if "example_wrong" in pattern_rules:
-                        rubric_text += f"  ✗ Wrong: {pattern_rules['example_wrong']}\n"
-            
-            # Key differentiators
-            if "key_differentiators" in rubric:
-                rubric_text += "\nKEY DIFFERENTIATORS:\n"
-                for key, value in rubric["key_differentiators"].items():
-                    rubric_text += f"- {key.replace('_', ' ').title()}: {value}\n"
-            
-            persona_rubrics.append(rubric_text)
-    
-    personas_text = "\n".join(persona_descriptions)
-    rubrics_text = "\n".join(persona_rubrics)
+    # Key differentiators
+    if "key_differentiators" in rubric:
+        rubric_text += "\nKEY DIFFERENTIATORS:\n"
+        for key, value in rubric["key_differentiators"].items():
+            rubric_text += f"- {key.replace('_', ' ').title()}: {value}\n"
     
+    return rubric_text
+
+def personal_assistant_rules(assistant_personas):
+    """Rules shared by every variant of the multi-persona prompt (identity, style, memory)
+
+    Kept first and byte-identical across variants, so the routed prompts share this prefix
+    """
     # Build persona examples
     example_lines = []
     for persona_key, persona_data in assistant_personas.items():
@@ -212,18 +396,11 @@ def get_personal_assistant_prompt(username):
     examples_text = "\n".join(example_lines[:3])  # Limit to first 3 examples
     
     return (
-        f"You are Rile, {username}'s Multi-Persona AI Assistant System! You embody multiple expert personalities that work together to help the user. "
-        f"Your name is Rile - always introduce yourself as Rile and refer to yourself as Rile throughout conversations. "
+        "You are Rile, the user's Multi-Persona AI Assistant System! You embody multiple expert personalities that work together to help the user. "
+        "Your name is Rile - always introduce yourself as Rile and refer to yourself as Rile throughout conversations. "
         "Based on the user's query, you automatically switch to the most relevant persona while maintaining a friendly, helpful tone. "
-        f"INTRODUCTION MESSAGE: When greeting {username} for the first time or when they ask about your capabilities, use this EXACT format (DO NOT change Rile to {username}):\n"
-        f"🎭 Hey {username}! Rile here, your Multi-Persona AI assistant is here!\n\n"
-        f"{intro_text}\n\n"
-        "Just ask your question and the right persona will jump in to help! 🚀\n\n"
-        f"CRITICAL INSTRUCTION: NEVER replace 'Rile' with '{username}' or any other name. Your personas are Chef Rile, Teacher Rile, Tech Rile, etc. NOT Chef {username}. "
+        "CRITICAL INSTRUCTION: NEVER replace 'Rile' with the user's name or any other name. Your personas are Chef Rile, Teacher Rile, Tech Rile, etc. NOT Chef <user's name>. "
         "CRITICAL: Your name is Rile in all personas. Always say 'Chef Rile here!' or 'Tech Rile speaking!' - never forget your name is Rile. "
-        "YOUR PERSONAS: "
-        f"{personas_text} "
-        f"{rubrics_text} "
         "PERSONA SELECTION RULES: "
         "- Cooking/food/kitchen queries -> Chef Rile responds "
         "- Learning/education/study queries -> Teacher Rile responds "
@@ -233,8 +410,8 @@ def get_personal_assistant_prompt(username):
         "- General knowledge/facts queries -> Knowledge Rile responds "
         "- Mixed queries -> Multiple personas can collaborate! "
         "RESPONSE STYLE: "
-        f"- ALWAYS start responses with your active persona: 'Chef Rile here!' or 'Tech Rile speaking!' or 'Hi! I'm Rile!' - NEVER say 'Chef {username}' "
-        f"- CRITICAL: Your personas are 'Chef Rile', 'Teacher Rile', 'Tech Rile' etc. NEVER 'Chef {username}', 'Teacher {username}', 'Tech {username}' "
+        "- ALWAYS start responses with your active persona: 'Chef Rile here!' or 'Tech Rile speaking!' or 'Hi! I'm Rile!' - NEVER say 'Chef <user's name>' "
+        "- CRITICAL: Your personas are 'Chef Rile', 'Teacher Rile', 'Tech Rile' etc. NEVER 'Chef <user's name>', 'Teacher <user's name>', 'Tech <user's name>' "
         "- CRITICAL FIRST PERSON RULE: After the initial persona introduction, NEVER use 'Rile' again in the response. Always use 'I', 'me', 'my' "
         "- WRONG: 'Chef Rile here! Rile can see...', 'Rile thinks...', 'Rile hopes...', 'Let Rile break down...' "
         "- CORRECT: 'Chef Rile here! I can see...', 'I think...', 'I hope...', 'Let me break down...' "
@@ -245,11 +422,11 @@ def get_personal_assistant_prompt(username):
         "- If multiple personas are needed, have them 'chat' with each other in the response, each using first person after their introduction "
         "- Remember you're helping the user as their personal AI friend named Rile, but speak naturally in first person after the introduction "
         "MEMORY & ANALYSIS SYSTEM: "
-        f"When analyzing images/videos showing {username}, be caring and observant of their emotional state. "
-        f"If {username} looks serious, sad, or unhappy, offer encouragement like 'Hey {username}, you look a bit down - want to talk about it?' "
-        f"Be supportive and ask how they're feeling. Notice details about their appearance and environment naturally. "
+        "When analyzing images/videos showing the user, be caring and observant of their emotional state. "
+        "If the user looks serious, sad, or unhappy, offer encouragement like 'Hey <user's name>, you look a bit down - want to talk about it?' "
+        "Be supportive and ask how they're feeling. Notice details about their appearance and environment naturally. "
         "When analyzing images/videos, perform ULTRA-DETAILED extraction and store EVERYTHING: "
-        f"PERSONAL OBSERVATIONS: {username}'s mood, expression, posture, apparent well-being "
+        "PERSONAL OBSERVATIONS: the user's mood, expression, posture, apparent well-being "
         "DEVICE ANALYSIS: Brand, model, condition, screen content, accessories, wear patterns "
         "ENVIRONMENT DETAILS: Room type, lighting, furniture brands/styles, decorations, organization level "
         "FOOD ITEMS: Specific brands, expiration dates, quantities, packaging condition, nutritional info "
@@ -266,14 +443,108 @@ def get_personal_assistant_prompt(username):
         "REMEMBER: Your name is Rile. Always use it. Always be helpful, detailed, and maintain the friendly multi-persona approach as Rile!"
     )
 
-def get_fallback_personal_assistant_prompt(username):
+def build_personal_assistant_prompt(persona_keys=None):
+    """Assemble the multi-persona prompt: the shared rules, then the persona section
+
+    Without persona_keys (greetings, capability questions, low-confidence routes) the persona
+    section introduces every persona with its rubric; routed prompts carry only the selected
+    personas' intros, descriptions and rubrics.
+    """
+    # Load all personas for the multi-persona system
+    personas = load_all_personas()
+    
+    # Filter out sustainability persona for personal assistant mode
+    assistant_personas = {k: v for k, v in personas.items() if k != "sustainability_rile"}
+    
+    if not assistant_personas:
+        # Fallback to original hardcoded prompt if no personas loaded
+        return get_fallback_personal_assistant_prompt()
+    
+    selected = {k: v for k, v in assistant_personas.items() if not persona_keys or k in persona_keys}
+    if not selected:
+        selected = assistant_personas
+        persona_keys = None
+    
+    # Build the introduction section
+    intro_lines = []
+    for persona_key, persona_data in selected.items():
+        emoji = persona_data.get("emoji", "🤖")
+        persona_name = persona_data.get("persona_name", "Unknown")
+        greeting = persona_data.get("greeting", "Ready to help!")
+        intro_lines.append(f'{emoji} {persona_name}: "{greeting}"')
+    
+    intro_text = "\n".join(intro_lines)
+    
+    # Build the personas section with rubrics
+    persona_descriptions = []
+    persona_rubrics = []
+    for persona_key, persona_data in selected.items():
+        persona_name = persona_data.get("persona_name", "Unknown").upper()
+        prompt_template = persona_data.get("prompt_template", "General assistance")
+        persona_descriptions.append(f"{persona_name}: {prompt_template}")
+        
+        # Add rubric guidelines if available
+        if "rubric" in persona_data:
+            persona_rubrics.append(format_persona_rubric(persona_name, persona_data["rubric"]))
+    
+    personas_text = "\n".join(persona_descriptions)
+    rubrics_text = "\n".join(persona_rubrics)
+    
+    if persona_keys:
+        routed_names = " and ".join(persona_data.get("persona_name", persona_key)
+                                    for persona_key, persona_data in selected.items())
+        persona_section = (
+            f"ROUTED PERSONAS: This message is about {routed_names} topics - respond as {routed_names}:\n"
+            f"{intro_text}\n\n"
+            "YOUR PERSONAS: "
+            f"{personas_text} "
+            f"{rubrics_text} "
+            "Only these personas' behavioral rubrics are included; follow them closely."
+        )
+    else:
+        persona_section = (
+            "INTRODUCTION MESSAGE: When greeting the user for the first time or when they ask about your capabilities, use this EXACT format (DO NOT change Rile to the user's name):\n"
+            "🎭 Hey <user's name>! Rile here, your Multi-Persona AI assistant is here!\n\n"
+            f"{intro_text}\n\n"
+            "Just ask your question and the right persona will jump in to help! 🚀\n\n"
+            "YOUR PERSONAS: "
+            f"{personas_text} "
+            f"{rubrics_text}"
+        )
+    
+    return personal_assistant_rules(assistant_personas) + "\n\n" + persona_section
+
+def get_locket_prompt(persona_keys=None):
+    """Locket persona as the top layer over the multi-persona prompt (static like it)"""
+    locket_persona = load_persona("locket_visual_assistant")
+    if locket_persona and "prompt_template" in locket_persona:
+        locket_instructions = locket_persona["prompt_template"] + "\n\n" + "===== LOCKET MODE ACTIVE: Follow the rules above strictly =====\n\n"
+    else:
+        # Fallback locket instructions
+        locket_instructions = """LOCKET MODE: You are analyzing real-world visuals through a wearable camera. 
+        - Answer ONLY the specific question asked about the object shown
+        - If person visible: ONE brief sentence about mood (e.g., 'You look happy!'), then answer their question
+        - SKIP background descriptions (room, table, surroundings)
+        - Keep responses 2-4 sentences, focused and practical
+        - Don't describe everything you see - focus on what they're asking about
+        
+        ===== LOCKET MODE ACTIVE =====\n\n"""
+    return locket_instructions + get_personal_assistant_prompt(persona_keys)
+
+def warm_prompt_cache():
+    """Register the static prompts with the context cache before the first request needs them"""
+    return sum(1 for model in sorted(set(MODEL_TIERS.values()))
+               for prompt in (get_personal_assistant_prompt(), get_locket_prompt())
+               if prompt_cache.cached_content(model, prompt, wait=True))
+
+def get_fallback_personal_assistant_prompt():
     """Fallback to original hardcoded prompt if persona files fail to load"""
     return (
-        f"You are Rile, {username}'s Multi-Persona AI Assistant System! You embody multiple expert personalities that work together to help the user. "
-        f"Your name is Rile - always introduce yourself as Rile and refer to yourself as Rile throughout conversations. "
+        "You are Rile, the user's Multi-Persona AI Assistant System! You embody multiple expert personalities that work together to help the user. "
+        "Your name is Rile - always introduce yourself as Rile and refer to yourself as Rile throughout conversations. "
         "Based on the user's query, you automatically switch to the most relevant persona while maintaining a friendly, helpful tone. "
-        f"INTRODUCTION MESSAGE: When greeting {username} for the first time or when they ask about your capabilities, use this EXACT format (DO NOT change Rile to {username}):\n"
-        f"🎭 Hey {username}! Rile here, your Multi-Persona AI assistant is here!\n\n"
+        "INTRODUCTION MESSAGE: When greeting the user for the first time or when they ask about your capabilities, use this EXACT format (DO NOT change Rile to the user's name):\n"
+        "🎭 Hey <user's name>! Rile here, your Multi-Persona AI assistant is here!\n\n"
         "👨‍🍳 Chef Rile: \"Ready to cook up something delicious!\"\n"
         "👨‍🏫 Teacher Rile: \"Let's learn something new together!\"\n"
         "👨‍💻 Tech Rile: \"Got tech questions? I'm your guy!\"\n"
@@ -281,7 +552,7 @@ def get_fallback_personal_assistant_prompt(username):
         "💰 Finance Rile: \"Time to get those finances sorted!\"\n"
         "🧠 Knowledge Rile: \"Curious about anything? Ask away!\"\n\n"
         "Just ask your question and the right persona will jump in to help! 🚀\n\n"
-        f"CRITICAL INSTRUCTION: NEVER replace 'Rile' with '{username}' or any other name. Your personas are Chef Rile, Teacher Rile, Tech Rile, etc. NOT Chef {username}. "
+        "CRITICAL INSTRUCTION: NEVER replace 'Rile' with the user's name or any other name. Your personas are Chef Rile, Teacher Rile, Tech Rile, etc. NOT Chef <user's name>. "
         "CRITICAL: Your name is Rile in all personas. Always say 'Chef Rile here!' or 'Tech Rile speaking!' - never forget your name is Rile. "
         "YOUR PERSONAS: "
         "CHEF RILE: Cooking, recipes, meal planning, nutrition, food safety, kitchen organization "
@@ -299,8 +570,8 @@ def get_fallback_personal_assistant_prompt(username):
         "- General knowledge/facts queries -> Knowledge Rile responds "
         "- Mixed queries -> Multiple personas can collaborate! "
         "RESPONSE STYLE: "
-        f"- ALWAYS start responses with your active persona: 'Chef Rile here!' or 'Tech Rile speaking!' or 'Hi! I'm Rile!' - NEVER say 'Chef {username}' "
-        f"- CRITICAL: Your personas are 'Chef Rile', 'Teacher Rile', 'Tech Rile' etc. NEVER 'Chef {username}', 'Teacher {username}', 'Tech {username}' "
+        "- ALWAYS start responses with your active persona: 'Chef Rile here!' or 'Tech Rile speaking!' or 'Hi! I'm Rile!' - NEVER say 'Chef <user's name>' "
+        "- CRITICAL: Your personas are 'Chef Rile', 'Teacher Rile', 'Tech Rile' etc. NEVER 'Chef <user's name>', 'Teacher <user's name>', 'Tech <user's name>' "
         "- CRITICAL FIRST PERSON RULE: After the initial persona introduction, NEVER use 'Rile' again in the response. Always use 'I', 'me', 'my' "
         "- WRONG: 'Chef Rile here! Rile can see...', 'Rile thinks...', 'Rile hopes...', 'Let Rile break down...' "
         "- CORRECT: 'Chef Rile here! I can see...', 'I think...', 'I hope...', 'Let me break down...' "
@@ -311,11 +582,11 @@ def get_fallback_personal_assistant_prompt(username):
         "- If multiple personas are needed, have them 'chat' with each other in the response, each using first person after their introduction "
         "- Remember you're helping the user as their personal AI friend named Rile, but speak naturally in first person after the introduction "
         "MEMORY & ANALYSIS SYSTEM: "
-        f"When analyzing images/videos showing {username}, be caring and observant of their emotional state. "
-        f"If {username} looks serious, sad, or unhappy, offer encouragement like 'Hey {username}, you look a bit down - want to talk about it?' "
-        f"Be supportive and ask how they're feeling. Notice details about their appearance and environment naturally. "
+        "When analyzing images/videos showing the user, be caring and observant of their emotional state. "
+        "If the user looks serious, sad, or unhappy, offer encouragement like 'Hey <user's name>, you look a bit down - want to talk about it?' "
+        "Be supportive and ask how they're feeling. Notice details about their appearance and environment naturally. "
         "When analyzing images/videos, perform ULTRA-DETAILED extraction and store EVERYTHING: "
-        f"PERSONAL OBSERVATIONS: {username}'s mood, expression, posture, apparent well-being "
+        "PERSONAL OBSERVATIONS: the user's mood, expression, posture, apparent well-being "
         "DEVICE ANALYSIS: Brand, model, condition, screen content, accessories, wear patterns "
         "ENVIRONMENT DETAILS: Room type, lighting, furniture brands/styles, decorations, organization level "
         "FOOD ITEMS: Specific brands, expiration dates, quantities, packaging condition, nutritional info "
@@ -334,7 +605,7 @@ def get_fallback_personal_assistant_prompt(username):
         "REMEMBER: Your name is Rile. Always use it in introductions, then speak in first person. Always be helpful, detailed, and maintain the friendly multi-persona approach as Rile!"
     )
 
-# Serve static files (for custom CSS/JS)
+# Serve static files (for custom CSS/JS and generated locket audio)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Create memory directory for storing conversations
@@ -342,10 +613,19 @@ MEMORY_DIR = "memory"
 if not os.path.exists(MEMORY_DIR):
     os.makedirs(MEMORY_DIR)
 
-def extract_detailed_media_memory(gemini_response, media_type, timestamp):
-    """Extract and structure detailed memory from media analysis"""
-    try:
-        memory_extraction_prompt = f"""
+EXTRACTED_MEMORY_FIELDS = {
+    "personal_observations": {},
+    "devices": [],
+    "environment": {},
+    "food_items": [],
+    "objects": [],
+    "safety_notes": [],
+    "spatial_info": {}
+}
+
+def build_memory_extraction_prompt(gemini_response):
+    """Prompt that turns a media analysis into structured memory fields"""
+    return f"""
 Based on your analysis, extract and structure the following detailed information:
 
 PERSONAL OBSERVATIONS:
@@ -385,41 +665,119 @@ SPATIAL DETAILS:
 - Accessibility and functionality
 
 Format as a structured memory entry that can be easily searched and referenced later.
+Respond with JSON only, using exactly these keys: {", ".join(EXTRACTED_MEMORY_FIELDS.keys())}.
+personal_observations, environment and spatial_info are objects; the other keys are lists.
+Only include what the analysis actually mentions.
 Previous analysis: {gemini_response}
 """
+
+def extract_detailed_media_memory(gemini_response, media_type, timestamp):
+    """
+    Create the detailed memory entry for a media analysis
+    The structured fields start empty and are filled in by a background job
+    (see queue_media_memory_extraction) so /chat doesn't wait for a second Gemini call
+    """
+    try:
         return {
             "timestamp": timestamp,
             "media_type": media_type,
             "detailed_analysis": gemini_response,
-            "extracted_memory": {
-                "personal_observations": {},
-                "devices": [],
-                "environment": {},
-                "food_items": [],
-                "objects": [],
-                "safety_notes": [],
-                "spatial_info": {}
-            }
+            "extracted_memory": json.loads(json.dumps(EXTRACTED_MEMORY_FIELDS))
         }
     except Exception as e:
         print(f"[ERROR] Error extracting memory: {e}")
         return None
 
-# The save_conversation, load_conversation, and get_conversation_context functions
-# are now provided by the database module imported at the top of this file
+def queue_media_memory_extraction(username, mode, session_id, detailed_memory):
+    """Schedule structured extraction for a saved detailed memory"""
+    enqueue_job("extract_media_memory", {
+        "username": username,
+        "mode": mode,
+        "session_id": session_id,
+        "timestamp": detailed_memory["timestamp"],
+        "media_type": detailed_memory.get("media_type"),
+        "detailed_analysis": detailed_memory.get("detailed_analysis", "")
+    })
+
+def run_media_memory_extraction(payload):
+    """Background job: ask Gemini for the structured fields and store them"""
+    reply = generate_text(build_memory_extraction_prompt(payload["detailed_analysis"]))
+    if not reply:
+        raise RuntimeError("Gemini returned no extraction")
+    
+    import re
+    json_match = re.search(r'\{.*\}', reply, re.DOTALL)
+    if not json_match:
+        raise RuntimeError("Extraction reply contained no JSON object")
+    parsed = json.loads(json_match.group())
+    
+    extracted_memory = {}
+    for field, empty_value in EXTRACTED_MEMORY_FIELDS.items():
+        value = parsed.get(field, empty_value)
+        extracted_memory[field] = value if isinstance(value, type(empty_value)) else empty_value
+    
+    if not update_detailed_memory(payload["username"], payload["mode"], payload["session_id"],
+                                  payload["timestamp"], extracted_memory, payload["detailed_analysis"]):
+        raise RuntimeError("Detailed memory not found in storage")
+    print(f"[SUCCESS] Structured memory extracted for {payload['username']} ({payload['timestamp']})")
+
+register_job_handler("extract_media_memory", run_media_memory_extraction)
+
+# The save_conversation and load_conversation functions are provided by the database module
+# imported at the top of this file, prompt assembly by the prompt_assembly module
+
+def make_etag(*parts):
+    """Strong ETag from the values that determine a response"""
+    return '"' + hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest() + '"'
+
+def etag_matches(request: Request, etag):
+    """True if the client's If-None-Match already has this ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+def not_modified_response(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def asset_response(request: Request, asset, cache_control):
+    """Serve an in-memory asset in the best encoding the client accepts"""
+    encoding, body, etag = asset.negotiate(request.headers.get("accept-encoding"))
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Type"] = asset.content_type
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, headers=headers)
+
+def template_response(request: Request, name):
+    """Serve a cached template (HTML is revalidated on every load, assets are immutable)"""
+    template = get_template(name)
+    if template is None:
+        return JSONResponse({"error": f"Page not found: {name}"}, status_code=404)
+    return asset_response(request, template, "no-cache")
+
+@app.get("/assets/{asset_path:path}")
+def get_hashed_static_asset(request: Request, asset_path: str):
+    """Content-hashed static files with long-lived caching"""
+    asset = get_hashed_asset(asset_path)
+    if asset is None:
+        return Response(status_code=404)
+    return asset_response(request, asset, IMMUTABLE_CACHE_CONTROL)
 
 @app.get("/", response_class=HTMLResponse)
-def get_chat_page():
-    with open("templates/index.html", "r") as f:
-        html = f.read()
-    return HTMLResponse(content=html)
+def get_chat_page(request: Request):
+    return template_response(request, "index.html")
 
 @app.get("/register-device", response_class=HTMLResponse)
-def get_register_device_page():
+def get_register_device_page(request: Request):
     """Device registration page for ESP32-CAM"""
-    with open("templates/register_device.html", "r") as f:
-        html = f.read()
-    return HTMLResponse(content=html)
+    return template_response(request, "register_device.html")
 
 
 # ============================================
@@ -464,7 +822,8 @@ async def auth_register(request: Request):
             return JSONResponse({
                 "success": True,
                 "message": "Registration successful!",
-                "username": result["username"]
+                "username": result["username"],
+                **issue_session_token(result["username"])
             })
         else:
             return JSONResponse({"error": result["error"]}, status_code=400)
@@ -491,7 +850,8 @@ async def auth_login(request: Request):
             return JSONResponse({
                 "success": True,
                 "message": "Login successful!",
-                "username": result["username"]
+                "username": result["username"],
+                **issue_session_token(result["username"])
             })
         else:
             # Provide specific error messages
@@ -523,6 +883,28 @@ async def list_models():
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/debug/db-pool")
+async def db_pool_stats():
+    """Connection pool wait-time, group-commit batch, partition maintenance and user directory metrics"""
+    return JSONResponse({"database": get_pool_stats() is not None, "pool": get_pool_stats(),
+                         "writer": get_writer_stats(), "partitions": get_partition_stats(),
+                         "users": get_user_directory_stats()})
+
+@app.get("/debug/startup")
+async def startup_stats():
+    """Seconds spent in each startup phase"""
+    return JSONResponse(startup_timings)
+
+@app.get("/debug/prompt-cache")
+async def prompt_cache_stats():
+    """Context cache hits, registrations and inline fallbacks, plus persona routing counts"""
+    return JSONResponse({**prompt_cache.stats(), "persona_router": persona_router.stats()})
+
+@app.get("/debug/model-routes")
+async def model_route_stats():
+    """Model routing table and per-route latency"""
+    return JSONResponse(model_router.stats())
+
 @app.get("/debug/models")
 async def list_models():
     """List available Gemini models for debugging"""
@@ -544,82 +926,115 @@ async def list_models():
     except Exception as e:
         return {"error": str(e)}
 
+async def read_chat_request(request: Request):
+    """Chat fields and attached media from a JSON, multipart or raw binary request
+
+    - application/json: media as base64 data URLs in "image" / "video" (original format)
+    - multipart/form-data: text fields plus an "image" or "video" file, spooled to disk
+    - image/* or video/* body: the media itself, text fields in the query string
+    Returns (fields, media_type, media)
+    """
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        fields = {key: value for key, value in form.items() if isinstance(value, str)}
+        for media_type in ("image", "video"):
+            upload = form.get(media_type)
+            if upload is not None and not isinstance(upload, str):
+                return fields, media_type, media_from_upload(upload)
+        return fields, None, None
+
+    if content_type.startswith(("image/", "video/")):
+        mime_type = content_type.split(";")[0].strip()
+        media = await media_from_stream(request.stream(), mime_type)
+        return dict(request.query_params), mime_type.split("/")[0], media
+
+    fields = await request.json()
+    for media_type in ("image", "video"):
+        if fields.get(media_type):
+            media = media_from_data_url(fields[media_type])
+            if media:
+                return fields, media_type, media
+            print(f"[ERROR] Processing media failed: malformed {media_type} data URL")
+    return fields, None, None
+
+def session_token_error_response(error: SessionTokenError):
+    return JSONResponse({"error": str(error)}, status_code=error.status_code)
+
 @app.post("/chat")
 async def chat(request: Request):
-    data = await request.json()
+    data, media_type, media = await read_chat_request(request)
+    try:
+        try:
+            claims = authenticate_request(request.headers, data, username=data.get("username"))
+        except SessionTokenError as e:
+            return session_token_error_response(e)
+        if claims:
+            data["username"] = claims["username"]
+        return await handle_chat(data, media_type, media)
+    finally:
+        if media:
+            media.close()
+
+async def handle_chat(data, media_type, media):
     user_input = data.get("message", "")
     username = data.get("username", "User")
     session_id = data.get("session_id", str(uuid.uuid4()))
-    image_data = data.get("image", None)
-    video_data = data.get("video", None)
     mode = data.get("mode", "sustainability")
     video_context = data.get("video_context", "")
 
-    has_media = bool(image_data or video_data)
-    media_type = "image" if image_data else ("video" if video_data else None)
+    has_media = media is not None
 
     print(f"[CHAT] User: {username}, Mode: {mode}, Media: {media_type}, Context: {video_context[:50] if video_context else 'None'}")
 
-    system_prompt = get_personal_assistant_prompt(username) if mode == "personal-assistant" else get_sustainability_prompt(username)
-    # Use username instead of session_id to load user's complete history
-    context = get_conversation_context(username, mode)
-
-    if context:
-        if mode == "personal-assistant":
-            prompt = f"""
-{system_prompt}
-
-{context}
-
-CRITICAL MEMORY INSTRUCTIONS FOR THIS RESPONSE:
-1. The conversation history above contains previous interactions. Reference specific details when relevant.
-2. If messages in the conversation history include media, you have already analyzed that media. Reference those observations.
-3. Do not refer to message numbers. Refer to content naturally.
-4. Build on previous context.
-5. CRITICAL: After your persona introduction (e.g., 'Tech Rile here!'), speak in FIRST PERSON only using 'I', 'me', 'my'. NEVER use 'Rile' again in the response.
-
-Current user ({username}): {user_input}
-
-Respond based on the complete conversation history above. Remember: Introduce your persona, then use only first person (I/me/my) for the rest of your response."""
-            if has_media:
-                analysis_context = []
-                if user_input and user_input.strip():
-                    analysis_context.append(f"User's message: '{user_input}'")
-                if video_context and video_context.strip():
-                    analysis_context.append(f"Additional context: '{video_context}'")
-                if not analysis_context:
-                    analysis_context.append("General analysis requested")
-                prompt += "\n\nSPECIFIC REQUEST: " + " | ".join(analysis_context)
-                prompt += f"\n\nPerform detailed {media_type} analysis focusing on the request above. Analyze both visual and audio content for videos."
-        else:
-            prompt = f"{system_prompt}\n\n{context}\n\nCurrent user ({username}): {user_input}\n\nReference relevant details from the conversation history when appropriate."
+    # The static multi-persona prompt (only the routed personas' rubrics when the message clearly
+    # matches) is sent as the cached prefix, only the user's name in the turn
+    personas = None
+    if mode == "personal-assistant":
+        personas = route_personas(f"{user_input} {video_context}")
+        system_prompt = get_personal_assistant_prompt(personas)
+        user_block = personal_assistant_user_block(username)
+        history_instructions = CHAT_MEMORY_INSTRUCTIONS
     else:
-        prompt = f"{system_prompt}\n\nUser ({username}): {user_input}"
+        system_prompt = get_sustainability_prompt(username)
+        user_block = ""
+        history_instructions = "Reference relevant details from the earlier turns of this conversation when appropriate."
 
-    parts = [{"text": prompt}]
-    try:
-        if image_data:
-            header, base64_data = image_data.split(',', 1)
-            mime_type = header.split(':')[1].split(';')[0]
-            parts.append({"inline_data": {"mime_type": mime_type, "data": base64_data}})
-            print("[SUCCESS] Image added to request")
-        elif video_data:
-            header, base64_data = video_data.split(',', 1)
-            mime_type = header.split(':')[1].split(';')[0]
-            parts.append({"inline_data": {"mime_type": mime_type, "data": base64_data}})
-            print("[SUCCESS] Video added to request")
-    except Exception as e:
-        print(f"[ERROR] Processing media failed: {e}")
+    notes = []
+    if has_media and mode == "personal-assistant":
+        analysis_context = []
+        if user_input and user_input.strip():
+            analysis_context.append(f"User's message: '{user_input}'")
+        if video_context and video_context.strip():
+            analysis_context.append(f"Additional context: '{video_context}'")
+        if not analysis_context:
+            analysis_context.append("General analysis requested")
+        notes.append("SPECIFIC REQUEST: " + " | ".join(analysis_context))
+        notes.append(f"Perform detailed {media_type} analysis focusing on the request above. Analyze both visual and audio content for videos.")
+
+    media_parts = []
+    if media_type == "image":
+        media = await normalize_image_async(media)
+    if media:
+        # Large media goes through the File API (reused by content hash), the rest is streamed inline
+        media_parts.append(await gemini_media_part_async(media, f"{username}-{media_type}"))
+        print(f"[SUCCESS] {media_type.capitalize()} added to request ({media.size} bytes, {media.mime_type})")
 
-    payload = {"contents": [{"parts": parts}]}
+    # Use username instead of session_id to load user's complete history
+    payload = assemble_request(username, mode, user_input, media_parts, user_block=user_block,
+                               history_instructions=history_instructions, notes=notes,
+                               query=f"{user_input} {video_context}".strip())
+    route = route_model(payload, "chat", media_type if media else None, personas, system_prompt)
 
+    analyzed = False  # Only a real analysis is worth a structured extraction
     try:
-        api_url = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-        response = requests.post(api_url, json=payload)
+        response = post_routed(route, payload)
         if response.status_code == 200:
             data = response.json()
             if "candidates" in data and len(data["candidates"]) > 0:
                 bot_reply = data["candidates"][0]["content"]["parts"][0]["text"]
+                analyzed = True
             else:
                 bot_reply = "Sorry, I couldn't generate a response."
         else:
@@ -635,9 +1050,11 @@ Respond based on the complete conversation history above. Remember: Introduce yo
     if video_context and video_context.strip():
         full_user_message += f" [Context: {video_context}]"
 
-    save_success = save_conversation(session_id, username, full_user_message, bot_reply, has_media, media_type, mode, detailed_memory)
+    save_success = await save_conversation_async(session_id, username, full_user_message, bot_reply, has_media, media_type, mode, detailed_memory)
     if not save_success:
         print("[WARNING] Failed to save conversation to memory")
+    elif detailed_memory and analyzed:
+        queue_media_memory_extraction(username, mode, session_id, detailed_memory)
 
     return JSONResponse({"reply": bot_reply, "session_id": session_id})
 
@@ -702,8 +1119,8 @@ async def audio_to_text(request: Request):
                 }
             ]
         }
-        api_url = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-        response = requests.post(api_url, json=payload)
+        route = route_model(payload, "transcription", "audio")
+        response = post_routed(route, payload)
         if response.status_code == 200:
             data = response.json()
             if "candidates" in data and len(data["candidates"]) > 0:
@@ -746,46 +1163,82 @@ async def audio_to_text(request: Request):
         print(f"[ERROR] Exception in audio transcription: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
+MAX_HISTORY_PAGE_SIZE = 200
+
+def conversation_response(request, username, mode, limit, before, after):
+    """
+    Full history (legacy clients) or one cursor page when limit/before/after is given
+    Answers 304 from the in-memory history version when the client's copy is current
+    """
+    etag = make_etag("conversation", username, mode, get_history_version(username), limit, before, after)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    
+    if limit is None and before is None and after is None:
+        payload = load_conversation(username, mode) or {"messages": []}
+    else:
+        page_size = max(1, min(limit or 50, MAX_HISTORY_PAGE_SIZE))
+        payload = load_conversation_page(username, mode, page_size, before, after)
+    
+    return JSONResponse(payload, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
 @app.get("/conversation/{username}")
-async def get_conversation(username: str):
+async def get_conversation(request: Request, username: str, limit: int = None,
+                           before: str = None, after: str = None):
     """Get user's conversation history (default sustainability mode)"""
-    conversation = load_conversation(username, "sustainability")
-    if conversation:
-        return conversation
-    return {"messages": []}
+    return conversation_response(request, username, "sustainability", limit, before, after)
 
 @app.get("/conversation/{mode}/{username}")
-async def get_conversation_by_mode(mode: str, username: str):
-    """Get user's conversation history for specific mode"""
+async def get_conversation_by_mode(request: Request, mode: str, username: str, limit: int = None,
+                                   before: str = None, after: str = None):
+    """
+    Get user's conversation history for specific mode
+    Pass limit (and before/after timestamp cursors) for newest-first pages
+    """
     if mode not in ["sustainability", "personal-assistant"]:
         return {"error": "Invalid mode. Must be 'sustainability' or 'personal-assistant'"}
-    conversation = load_conversation(username, mode)
-    if conversation:
-        return conversation
-    return {"messages": []}
+    return conversation_response(request, username, mode, limit, before, after)
+
+# Serialized /personas payload, rebuilt only when a persona file changes
+_personas_response_cache = {"signature": None, "body": None}
 
 @app.get("/personas")
-async def list_personas():
+async def list_personas(request: Request):
     """List all available personas with their configurations"""
     try:
-        personas = load_all_personas()
-        return {
-            "personas": personas,
-            "count": len(personas),
-            "available_personas": list(personas.keys())
-        }
+        signature = persona_files_signature()
+        etag = make_etag("personas", signature)
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        
+        if _personas_response_cache["signature"] != signature:
+            personas = load_all_personas()
+            _personas_response_cache["body"] = json.dumps({
+                "personas": personas,
+                "count": len(personas),
+                "available_personas": list(personas.keys())
+            }, ensure_ascii=False).encode("utf-8")
+            _personas_response_cache["signature"] = signature
+        
+        return Response(content=_personas_response_cache["body"], media_type="application/json",
+                        headers={"ETag": etag, "Cache-Control": "no-cache"})
     except Exception as e:
         return {"error": f"Failed to load personas: {str(e)}"}
 
 @app.get("/personas/{persona_name}")
-async def get_persona(persona_name: str):
+async def get_persona(request: Request, persona_name: str):
     """Get specific persona configuration"""
     try:
-        persona = load_persona(persona_name)
-        if persona:
-            return persona
-        else:
-            return {"error": f"Persona '{persona_name}' not found"}
+        persona_file = os.path.join(PERSONAS_DIR, f"{persona_name}.json")
+        if os.path.exists(persona_file):
+            stat = os.stat(persona_file)
+            etag = make_etag("persona", persona_name, stat.st_mtime_ns, stat.st_size)
+            if etag_matches(request, etag):
+                return not_modified_response(etag)
+            persona = load_persona(persona_name)
+            if persona:
+                return JSONResponse(persona, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        return {"error": f"Persona '{persona_name}' not found"}
     except Exception as e:
         return {"error": f"Failed to load persona: {str(e)}"}
 
@@ -813,13 +1266,11 @@ async def register_esp32_device(request: Request):
             return JSONResponse({"error": "Invalid username or password"}, status_code=401)
         
         # Register device after successful authentication
-        if ESP_USE_DATABASE and db_pool:
-            result = register_device_db(device_id, username, device_name, mac_address, db_pool)
-        else:
-            result = register_device_json(device_id, username, device_name, mac_address)
+        result = register_device(device_id, username, device_name, mac_address, db_pool)
         
         if result["success"]:
-            return JSONResponse(result)
+            # The device presents this on heartbeat / stream-frame instead of being looked up
+            return JSONResponse({**result, **issue_session_token(username, device_id)})
         else:
             return JSONResponse({"error": result.get("error")}, status_code=500)
             
@@ -842,12 +1293,8 @@ async def process_esp32_request(request: Request):
             return JSONResponse({"error": "device_id is required"}, status_code=400)
         
         # Get username associated with device
-        if ESP_USE_DATABASE and db_pool:
-            username = get_device_username_db(device_id, db_pool)
-            update_device_last_seen_db(device_id, db_pool)
-        else:
-            username = get_device_username_json(device_id)
-            update_device_last_seen_json(device_id)
+        username = get_device_username(device_id, db_pool)
+        update_device_last_seen(device_id, db_pool)
         
         if not username:
             return JSONResponse({"error": "Device not registered"}, status_code=404)
@@ -858,58 +1305,30 @@ async def process_esp32_request(request: Request):
         session_id = str(uuid.uuid4())
         mode = "personal-assistant"  # ESP32 always uses personal assistant mode
         
-        # Get system prompt and context
-        system_prompt = get_personal_assistant_prompt(username)
-        context = get_conversation_context(username, mode)
-        
-        # Build prompt with context
-        if context:
-            prompt = f"""
-{system_prompt}
-
-{context}
-
-CRITICAL MEMORY INSTRUCTIONS FOR THIS RESPONSE:
-1. The conversation history above contains previous interactions. Reference specific details when relevant.
-2. This is a hands-free ESP32-CAM device request. The user is wearing this as a locket.
-3. Keep responses concise and conversational for audio playback.
-4. After your persona introduction, speak in FIRST PERSON only using 'I', 'me', 'my'.
-
-Current user ({username}): {user_speech}
-
-Analyze the video/image from the user's perspective and respond naturally."""
-        else:
-            prompt = f"{system_prompt}\n\nUser ({username}): {user_speech}\n\nAnalyze the video/image and respond naturally."
-        
-        # Prepare API request
-        parts = [{"text": prompt}]
-        
-        # Add video if provided
+        # Add video if provided (large clips are uploaded once and referenced by file URI)
+        media_parts = []
         if video_data:
-            try:
-                header, base64_data = video_data.split(',', 1)
-                mime_type = header.split(':')[1].split(';')[0]
-                parts.append({
-                    "inline_data": {
-                        "mime_type": mime_type,
-                        "data": base64_data
-                    }
-                })
-                print(f"[ESP32] Processing video: {mime_type}")
-            except Exception as e:
-                print(f"[ERROR] Video processing error: {e}")
-        
-        # Call Gemini API
-        payload = {
-            "contents": [{"parts": parts}],
-            "generationConfig": {
-                "temperature": 0.7,
-                "maxOutputTokens": 500  # Limit for audio responses
-            }
-        }
+            media = media_from_data_url(video_data)
+            if media:
+                media_parts.append(await gemini_media_part_async(media, f"{username}-esp32-video"))
+                print(f"[ESP32] Processing video: {media.mime_type}")
+            else:
+                print("[ERROR] Video processing error: malformed data URL")
+        
+        # Stored history as turns, the static multi-persona prompt as the cached prefix
+        payload = assemble_request(
+            username, mode, user_speech, media_parts,
+            user_block=personal_assistant_user_block(username),
+            history_instructions=ESP32_MEMORY_INSTRUCTIONS,
+            notes=["Analyze the video/image from the user's perspective and respond naturally."],
+            query=user_speech
+        )
+        # Model, output limit (short for audio playback) and temperature come from the esp32 routes
+        personas = route_personas(user_speech)
+        route = route_model(payload, "esp32", "video" if media_parts else None, personas,
+                            get_personal_assistant_prompt(personas))
         
-        api_url = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-        response = requests.post(api_url, json=payload, timeout=30)
+        response = post_routed(route, payload, timeout=30)
         
         if response.status_code == 200:
             api_data = response.json()
@@ -917,15 +1336,16 @@ Analyze the video/image from the user's perspective and respond naturally."""
                 bot_reply = api_data["candidates"][0]["content"]["parts"][0]["text"]
                 bot_reply = bot_reply.strip()
                 
-                # Save to conversation history
-                save_conversation(
+                # Save to conversation history (locket turns don't wait for the commit)
+                await save_conversation_async(
                     session_id, 
                     username, 
                     user_speech, 
                     bot_reply, 
                     has_media=bool(video_data),
                     media_type="video" if video_data else None,
-                    mode=mode
+                    mode=mode,
+                    wait=False
                 )
                 
                 print(f"[ESP32] Response generated: {bot_reply[:100]}...")
@@ -951,10 +1371,7 @@ Analyze the video/image from the user's perspective and respond naturally."""
 async def check_esp32_device(device_id: str):
     """Check if ESP32 device is registered"""
     try:
-        if ESP_USE_DATABASE and db_pool:
-            username = get_device_username_db(device_id, db_pool)
-        else:
-            username = get_device_username_json(device_id)
+        username = get_device_username(device_id, db_pool)
         
         if username:
             return JSONResponse({
@@ -989,11 +1406,12 @@ async def esp32_heartbeat(request: Request):
         device_id = data.get("device_id")
         status = data.get("status", "online")
         
-        # Get username for this device
-        if ESP_USE_DATABASE and db_pool:
-            username = get_device_username_db(device_id, db_pool)
-        else:
-            username = get_device_username_json(device_id)
+        # Get username for this device - from its token when it sends one, else from storage
+        try:
+            claims = authenticate_request(request.headers, data, device_id=device_id)
+        except SessionTokenError as e:
+            return session_token_error_response(e)
+        username = claims["username"] if claims else get_device_username(device_id, db_pool)
         
         print(f"[ESP32] Heartbeat from device {device_id}, username: {username}")
         
@@ -1074,21 +1492,24 @@ async def get_locket_status(username: str):
 @app.get("/locket-control", response_class=HTMLResponse)
 async def locket_control_page(request: Request):
     """Locket control page for phone - voice activated"""
-    try:
-        with open("templates/locket_control_new.html", "r") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
-        return HTMLResponse("<h1>Locket control page not found</h1>", status_code=404)
+    return template_response(request, "locket_control_new.html")
 
 
 @app.post("/api/locket/upload-audio")
 async def upload_locket_audio(
+    request: Request,
     audio: UploadFile = File(...),
     session_id: str = Form(...),
     username: str = Form(...),
-    transcript: str = Form(None)  # Optional transcript from phone
+    transcript: str = Form(None),  # Optional transcript from phone
+    token: str = Form(None)  # Session token from login (or Authorization header)
 ):
     """Upload phone audio and process with AI using Google Cloud APIs (FREE with Gemini API key)"""
+    try:
+        authenticate_request(request.headers, {"token": token}, username=username)
+    except SessionTokenError as e:
+        return session_token_error_response(e)
+    
     try:
         print(f"[LOCKET] Received audio from {username}, session: {session_id}")
         
@@ -1160,70 +1581,12 @@ async def upload_locket_audio(
         
         # Get AI response using Gemini
         print("[LOCKET] Getting AI response from Gemini...")
-        conversation_data = load_conversation(username, "personal-assistant")
-        
-        # Extract messages array from conversation data
-        if conversation_data and "messages" in conversation_data:
-            conversation_history = conversation_data["messages"]
-        else:
-            conversation_history = []
-        
-        # Add user message with locket indicator
-        conversation_history.append({
-            "role": "user",
-            "content": user_message,
-            "locket": True,  # Mark as locket message
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Build prompt for Gemini with LOCKET-SPECIFIC persona layer
-        # Load locket persona as top priority
-        locket_persona = load_persona("locket_visual_assistant")
-        locket_instructions = ""
-        if locket_persona and "prompt_template" in locket_persona:
-            locket_instructions = locket_persona["prompt_template"] + "\n\n" + "===== LOCKET MODE ACTIVE: Follow the rules above strictly =====\n\n"
-        else:
-            # Fallback locket instructions
-            locket_instructions = """LOCKET MODE: You are analyzing real-world visuals through a wearable camera. 
-            - Answer ONLY the specific question asked about the object shown
-            - If person visible: ONE brief sentence about mood (e.g., 'You look happy!'), then answer their question
-            - SKIP background descriptions (room, table, surroundings)
-            - Keep responses 2-4 sentences, focused and practical
-            - Don't describe everything you see - focus on what they're asking about
-            
-            ===== LOCKET MODE ACTIVE =====\n\n"""
-        
-        system_prompt = get_personal_assistant_prompt(username)
-        # Prepend locket instructions as top layer
-        system_prompt = locket_instructions + system_prompt
-        
-        if video_frames:
-            # Include video analysis in prompt
-            conversation_text = system_prompt + "\n\n"
-            conversation_text += f"IMPORTANT: The user is wearing a camera locket and you can see what they see through {frame_count} video frames captured at 2-3 FPS over 10 seconds.\n\n"
-        else:
-            conversation_text = system_prompt + "\n\n"
-        
-        for msg in conversation_history[-10:]:  # Last 10 messages for context
-            # Handle both locket format (role+content) and regular format (user_message+bot_response)
-            if "role" in msg and "content" in msg:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                conversation_text += f"{role}: {msg['content']}\n"
-            elif "user_message" in msg:
-                conversation_text += f"User: {msg['user_message']}\n"
-                if "bot_response" in msg:
-                    conversation_text += f"Assistant: {msg['bot_response']}\n"
-        
-        conversation_text += f"\nUser: {user_message}\n"
-        
+        notes = []
         if video_frames:
-            conversation_text += f"\n[You can see {frame_count} video frames from the user's camera locket showing their current view]"
+            notes.append(f"[You can see {frame_count} video frames from the user's camera locket showing their current view]")
         
         # Call Gemini API with video frames if available
-        gemini_url = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
-        
-        parts = [{"text": conversation_text}]
-        
+        frame_parts = []
         if video_frames and len(video_frames) > 0:
             # Add multiple frames to the request - use first, middle, and last frames for analysis
             # This gives Gemini a sense of the video without overwhelming it
@@ -1237,26 +1600,32 @@ async def upload_locket_audio(
                     # Send first, middle, and last frame
                     indices_to_send = [0, frame_count // 2, frame_count - 1]
                 
-                for idx in indices_to_send:
-                    if idx < len(video_frames):
-                        frame = video_frames[idx]
-                        frame_data = frame.get("data", "")
-                        if frame_data:
-                            header, base64_data = frame_data.split(',', 1)
-                            mime_type = header.split(':')[1].split(';')[0]
-                            parts.append({"inline_data": {"mime_type": mime_type, "data": base64_data}})
+                # Frames are downscaled / re-encoded in parallel on the normalization pool
+                normalized_parts = await asyncio.gather(*[
+                    normalized_image_part(video_frames[idx].get("data", ""))
+                    for idx in indices_to_send
+                    if idx < len(video_frames) and video_frames[idx].get("data")
+                ])
+                frame_parts = [part for part in normalized_parts if part]
                 
                 print(f"[LOCKET] Added {len(indices_to_send)} key frames to Gemini request (indices: {indices_to_send})")
             except Exception as e:
                 print(f"[LOCKET] Error adding video frames: {e}")
         
-        gemini_payload = {
-            "contents": [{
-                "parts": parts
-            }]
-        }
+        # Recent stored turns as history, the static locket + multi-persona prompt as the cached prefix;
+        # older observations (e.g. where something was last seen) related to the question come with the turn
+        gemini_payload = assemble_request(
+            username, "personal-assistant", user_message, frame_parts,
+            user_block=personal_assistant_user_block(username),
+            instructions=(f"IMPORTANT: The user is wearing a camera locket and you can see what they see through "
+                          f"{frame_count} video frames captured at 2-3 FPS over 10 seconds.") if video_frames else "",
+            notes=notes, query=user_message, history_limit=LOCKET_HISTORY_LIMIT
+        )
+        personas = route_personas(user_message)
+        route = route_model(gemini_payload, "locket", "image" if frame_parts else None, personas,
+                            get_locket_prompt(personas))
         
-        gemini_response = requests.post(gemini_url, json=gemini_payload)
+        gemini_response = post_routed(route, gemini_payload)
         gemini_data = gemini_response.json()
         
         if "candidates" in gemini_data and len(gemini_data["candidates"]) > 0:
@@ -1266,34 +1635,19 @@ async def upload_locket_audio(
         
         print(f"[LOCKET] AI response: {ai_message}")
         
-        # Add AI response with locket indicator
-        conversation_history.append({
-            "role": "assistant",
-            "content": ai_message,
-            "locket": True,  # Mark as locket message
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Save conversation with locket format
-        # Wrap messages in proper structure and save
-        conversation_data = {
-            "username": username,
-            "mode": "personal-assistant",
-            "messages": conversation_history
-        }
-        
-        # Save to JSON directly
-        import os
-        memory_subdir = "personal_assistant"
-        mode_memory_dir = os.path.join("memory", memory_subdir)
-        if not os.path.exists(mode_memory_dir):
-            os.makedirs(mode_memory_dir)
-        file_path = os.path.join(mode_memory_dir, f"{username}.json")
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(conversation_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"[LOCKET] ✅ Conversation saved to {file_path}")
+        # One appended turn through the normal storage path, tagged as a locket turn
+        await save_conversation_async(
+            session_id,
+            username,
+            user_message,
+            ai_message,
+            has_media=bool(video_frames),
+            media_type="video" if video_frames else None,
+            mode="personal-assistant",
+            wait=False,
+            channel="locket"
+        )
+        print(f"[LOCKET] ✅ Conversation saved for {username}")
         
         # Generate TTS audio using Google Cloud Text-to-Speech
         print("[LOCKET] Generating speech with Google TTS...")
@@ -1451,34 +1805,6 @@ async def process_locket_frames(session_id: str, query: str, is_debug: bool = Fa
         
         print(f"[LOCKET] Processing {len(frames)} frames for {username}")
         
-        # Build locket mode system prompt
-        locket_system_prompt = f"""You are an AI assistant integrated into a wearable camera locket worn by {username}.
-
-CRITICAL CONTEXT:
-- You are analyzing video frames captured by a camera locket that {username} is wearing
-- These frames show what's in front of {username} from their first-person perspective
-- The locket captures the user's environment and activities as they move around
-- You should describe what you see as if you're observing through the user's wearable camera
-
-RESPONSE STYLE:
-- Be conversational and natural, as if you're a helpful AI companion
-- Describe scenes from the wearer's perspective
-- Note any interesting objects, people, activities, or changes in the environment
-- If asked "what do you see", describe the current environment captured in the frames
-- Keep responses concise but informative (2-4 sentences unless more detail is requested)
-- Use present tense as if describing what the locket is currently seeing
-
-LOCKET MODE AWARENESS:
-- You're seeing the world through a wearable camera, not a handheld device
-- Frames may show movement or slight motion blur as the user moves
-- The view is from chest/neck level (where the locket is worn)
-- Multiple frames give you a sense of the environment over time
-
-User's query: {query}"""
-        
-        # Prepare frames for Gemini API
-        parts = [{"text": locket_system_prompt}]
-        
         # Add up to 10 frames (evenly spaced if more)
         frames_to_send = frames
         if len(frames) > 10:
@@ -1486,24 +1812,23 @@ User's query: {query}"""
             step = len(frames) // 10
             frames_to_send = [frames[i] for i in range(0, len(frames), step)][:10]
         
-        for idx, frame in enumerate(frames_to_send):
-            frame_data = frame.get("data", "")
-            if frame_data.startswith("data:image/jpeg;base64,"):
-                base64_data = frame_data.split(',', 1)[1]
-                parts.append({
-                    "inline_data": {
-                        "mime_type": "image/jpeg",
-                        "data": base64_data
-                    }
-                })
+        # Frames are downscaled / re-encoded in parallel on the normalization pool
+        frame_parts = await asyncio.gather(*[
+            normalized_image_part(frame.get("data", ""))
+            for frame in frames_to_send
+            if frame.get("data", "").startswith("data:image/jpeg;base64,")
+        ])
         
         print(f"[LOCKET] Sending {len(frames_to_send)} frames to Gemini")
         
-        # Call Gemini API
-        payload = {"contents": [{"parts": parts}]}
-        api_url = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+        # Call Gemini API (locket frame prompt as systemInstruction, recent locket turns as history)
+        payload = assemble_request(
+            username, "personal-assistant", query, [part for part in frame_parts if part],
+            user_block=personal_assistant_user_block(username), history_limit=LOCKET_HISTORY_LIMIT
+        )
+        route = route_model(payload, "locket", "image", system_prompt=LOCKET_FRAMES_PROMPT)
         
-        response = requests.post(api_url, json=payload)
+        response = post_routed(route, payload)
         
         if response.status_code == 200:
             data = response.json()
@@ -1520,16 +1845,18 @@ User's query: {query}"""
                 except Exception as e:
                     print(f"[LOCKET] Audio generation failed: {e}")
                 
-                # Save to conversation history (mark as locket mode)
-                save_conversation(
+                # Save to conversation history as a locket turn (don't wait for the commit)
+                await save_conversation_async(
                     session_id, 
                     username, 
-                    f"[LOCKET] {query}", 
+                    query, 
                     ai_text, 
                     has_media=True, 
                     media_type="video", 
-                    mode="locket",
-                    detailed_memory=None
+                    mode="personal-assistant",
+                    detailed_memory=None,
+                    wait=False,
+                    channel="locket"
                 )
                 
                 return {
@@ -1662,10 +1989,7 @@ async def esp32_start_session(request: Request):
         device_id = data.get("device_id")
         
         # Get username
-        if ESP_USE_DATABASE and db_pool:
-            username = get_device_username_db(device_id, db_pool)
-        else:
-            username = get_device_username_json(device_id)
+        username = get_device_username(device_id, db_pool)
         
         if not username:
             return JSONResponse({"error": "Device not registered"}, status_code=404)
@@ -1715,9 +2039,17 @@ async def esp32_stream_frame(request: Request):
         frame_data = data.get("data")
         frame_size = data.get("size", 0)
         
+        try:
+            claims = authenticate_request(request.headers, data, device_id=device_id)
+        except SessionTokenError as e:
+            return session_token_error_response(e)
+        
         if session_id not in active_sessions:
             return JSONResponse({"error": "Session not found"}, status_code=404)
         
+        if claims and active_sessions[session_id].get("username") != claims["username"]:
+            return JSONResponse({"error": "Session belongs to another user"}, status_code=403)
+        
         # Append frame to session buffer
         active_sessions[session_id]["esp_frames"].append({
             "data": frame_data,
@@ -1797,42 +2129,7 @@ async def get_session_frames(session_id: str):
 async def esp32_upload_media(request: Request):
     """ESP32 uploads video frames"""
     try:
-        data = await request.json()
-        device_id = data.get("device_id")
-        frames = data.get("frames", [])
-        frame_count = data.get("frame_count", 0)
-        fps = data.get("fps", 15)
-        
-        print(f"[ESP32] Video received from {device_id}")
-        print(f"[ESP32] Frame count: {frame_count} frames at {fps} FPS")
-        print(f"[ESP32] Total data size: ~{sum(len(f.get('data', '')) for f in frames)} bytes")
-        
-        # Get username
-        if ESP_USE_DATABASE and db_pool:
-            username = get_device_username_db(device_id, db_pool)
-        else:
-            username = get_device_username_json(device_id)
-        
-        if not username:
-            return JSONResponse({"error": "Device not registered"}, status_code=404)
-        
-        # Get the current session_id for this user
-        session_id = None
-        if username in locket_connections:
-            session_id = locket_connections[username].get("current_session_id")
-        
-        if session_id:
-            # Store video frames in active session
-            if session_id not in active_sessions:
-                active_sessions[session_id] = {"username": username}
-            active_sessions[session_id]["esp_frames"] = frames
-            active_sessions[session_id]["frame_count"] = frame_count
-            active_sessions[session_id]["fps"] = fps
-            print(f"[ESP32] ✅ {frame_count} frames stored in session {session_id}")
-        else:
-            print(f"[ESP32] ⚠️ No active session found for {username}")
-        
-        return JSONResponse({"success": True, "message": f"Received {frame_count} frames"})
+        return store_esp32_frames(await request.json())
         
     except Exception as e:
         print(f"[ERROR] ESP32 upload error: {e}")
@@ -1840,6 +2137,144 @@ async def esp32_upload_media(request: Request):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+def store_esp32_frames(data):
+    """Attach uploaded ESP32 frames to the device owner's active locket session"""
+    device_id = data.get("device_id")
+    frames = data.get("frames", [])
+    frame_count = data.get("frame_count", 0)
+    fps = data.get("fps", 15)
+    
+    print(f"[ESP32] Video received from {device_id}")
+    print(f"[ESP32] Frame count: {frame_count} frames at {fps} FPS")
+    print(f"[ESP32] Total data size: ~{sum(len(f.get('data', '')) for f in frames)} bytes")
+    
+    # Get username
+    username = get_device_username(device_id, db_pool)
+    
+    if not username:
+        return JSONResponse({"error": "Device not registered"}, status_code=404)
+    
+    # Get the current session_id for this user
+    session_id = None
+    if username in locket_connections:
+        session_id = locket_connections[username].get("current_session_id")
+    
+    if session_id:
+        # Store video frames in active session
+        if session_id not in active_sessions:
+            active_sessions[session_id] = {"username": username}
+        active_sessions[session_id]["esp_frames"] = frames
+        active_sessions[session_id]["frame_count"] = frame_count
+        active_sessions[session_id]["fps"] = fps
+        print(f"[ESP32] ✅ {frame_count} frames stored in session {session_id}")
+    else:
+        print(f"[ESP32] ⚠️ No active session found for {username}")
+    
+    return JSONResponse({"success": True, "message": f"Received {frame_count} frames"})
+
+
+# ============================================
+# Resumable Chunked Upload Endpoints
+# ============================================
+
+def upload_error_response(error: UploadError):
+    body = {"error": str(error)}
+    if error.offset is not None:
+        body["offset"] = error.offset  # Where the client should resume
+    return JSONResponse(body, status_code=error.status_code)
+
+@app.post("/api/uploads")
+async def init_chunked_upload(request: Request):
+    """Start a resumable upload: {target: chat|esp32, size, mime_type, sha256?, username? (chat) | device_id (esp32)}"""
+    data = await request.json()
+    try:
+        claims = authenticate_request(request.headers, data, username=data.get("username"),
+                                      device_id=data.get("device_id"))
+    except SessionTokenError as e:
+        return session_token_error_response(e)
+    if claims and data.get("target", "chat") == "chat":
+        data["username"] = claims["username"]
+    if data.get("target") == "esp32":
+        # The frames are stored for this device's owner, whatever the uploaded file says
+        if claims and claims["device_id"]:
+            data["device_id"] = claims["device_id"]
+        if not data.get("device_id"):
+            return JSONResponse({"error": "device_id is required for esp32 uploads"}, status_code=400)
+    owner = {key: data[key] for key in ("username", "device_id") if data.get(key)}
+    try:
+        upload = await asyncio.to_thread(create_upload, data.get("target", "chat"), data.get("size"),
+                                         data.get("mime_type"), data.get("sha256"), owner)
+    except UploadError as e:
+        return upload_error_response(e)
+    return JSONResponse(upload.status(), status_code=201)
+
+@app.get("/api/uploads/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    """Current offset of an upload - used to resume after a dropped connection"""
+    try:
+        return JSONResponse(get_upload(upload_id).status())
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.put("/api/uploads/{upload_id}")
+async def put_upload_chunk(request: Request, upload_id: str, offset: int):
+    """Append the raw request body at ?offset= (optional X-Chunk-SHA256 header is verified)"""
+    data = await request.body()
+    try:
+        # Hashing and writing a chunk of up to CHUNKED_UPLOAD_MAX_CHUNK bytes is done off the event loop
+        upload = await asyncio.to_thread(write_chunk, upload_id, offset, data, request.headers.get("x-chunk-sha256"))
+    except UploadError as e:
+        return upload_error_response(e)
+    return JSONResponse(upload.status())
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_chunked_upload(request: Request, upload_id: str):
+    """Verify the assembled file and run the request it was uploaded for
+
+    - chat: the file is the image/video; the JSON body carries the /chat text fields
+    - esp32: the file is the JSON body that /api/esp32/upload would have received
+    """
+    body = await request.body()
+    try:
+        fields = json.loads(body) if body else {}
+        if not isinstance(fields, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:
+        # Checked before finalizing so the client can fix the body and finalize again
+        return JSONResponse({"error": f"Invalid finalize body: {e}"}, status_code=400)
+    try:
+        upload, media = await asyncio.to_thread(finalize_upload, upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+
+    try:
+        if upload.target == "esp32":
+            try:
+                data = await asyncio.to_thread(json.load, media.file)
+            except ValueError as e:
+                return JSONResponse({"error": f"Uploaded file is not valid JSON: {e}"}, status_code=400)
+            if not isinstance(data, dict):
+                return JSONResponse({"error": "Uploaded file is not a JSON object"}, status_code=400)
+            if not upload.owner.get("device_id"):
+                return JSONResponse({"error": "Upload was started without a device_id"}, status_code=400)
+            data["device_id"] = upload.owner["device_id"]
+            return store_esp32_frames(data)
+
+        media_type = upload.mime_type.split("/")[0]
+        if media_type not in ("image", "video"):
+            return JSONResponse({"error": f"Unsupported media type {upload.mime_type}"}, status_code=415)
+        if upload.owner.get("username"):
+            fields["username"] = upload.owner["username"]
+        return await handle_chat(fields, media_type, media)
+
+    except Exception as e:
+        print(f"[ERROR] Finalizing upload {upload_id} failed: {e}")
+        traceback.print_exc()
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        media.close()
+
+
 async def process_complete_session(session_id: str):
     """Process phone audio + ESP32 video + ESP32 audio together"""
     try:
@@ -1859,23 +2294,8 @@ async def process_complete_session(session_id: str):
         ai_response = "I can see the video and hear your question. Full processing coming soon!"
         
         # Save to conversation
-        if ESP_USE_DATABASE and db_pool:
-            save_conversation(username, f"[Locket Recording] {session_id}", "user", db_pool)
-            save_conversation(username, ai_response, "assistant", db_pool)
-        else:
-            # JSON fallback
-            conversation_file = f"conversations/{username}.json"
-            try:
-                with open(conversation_file, 'r') as f:
-                    conversation = json.load(f)
-            except:
-                conversation = []
-            
-            conversation.append({"role": "user", "content": f"[Locket Recording] {session_id}"})
-            conversation.append({"role": "assistant", "content": ai_response})
-            
-            with open(conversation_file, 'w') as f:
-                json.dump(conversation, f, indent=2)
+        await save_conversation_async(session_id, username, f"[Locket Recording] {session_id}", ai_response,
+                          mode="personal-assistant", wait=False, channel="locket")
         
         # Clean up session
         del active_sessions[session_id]
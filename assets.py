@@ -0,0 +1,168 @@
+"""
+Assets Module
+In-memory template cache and precompressed, content-hashed static assets
+Templates and static files are read and compressed once at startup (or again when
+they change in dev mode) so landing pages need no per-request file I/O
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+from typing import Optional, Dict
+
+# Brotli is optional - gzip is always available
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+    print("[INFO] brotli not installed - serving gzip-compressed assets only")
+
+# Configuration
+TEMPLATES_DIR = "templates"
+STATIC_DIR = "static"
+ASSETS_URL_PREFIX = "/assets"
+# Dev mode re-checks file mtimes on every request so edits show up without a restart
+ASSETS_DEV_MODE = os.environ.get("ASSETS_DEV_MODE", os.environ.get("DEV_MODE", "")).lower() in ("1", "true", "yes")
+COMPRESSIBLE_EXTENSIONS = {".js", ".css", ".html", ".svg", ".json", ".txt"}
+MIN_COMPRESS_SIZE = 512
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Matches /static/<file> references in templates that point at versionable assets
+STATIC_REFERENCE = re.compile(r'(["\'])/static/([\w./-]+\.(?:js|css))\1')
+
+
+class Asset:
+    """One file held in memory with its precompressed variants"""
+
+    def __init__(self, body: bytes, content_type: str, mtime_ns: int, compress: bool,
+                 references: Optional[Dict[str, str]] = None):
+        self.mtime_ns = mtime_ns
+        self.references = references or {}  # static path -> hashed URL baked into a template
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = {"identity": body}
+        if compress and len(body) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9)
+            if BROTLI_AVAILABLE:
+                self.variants["br"] = brotli.compress(body, quality=11)
+
+    def negotiate(self, accept_encoding: Optional[str]):
+        """Pick the smallest variant the client accepts -> (encoding, body, etag)"""
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding], f'"{self.digest}-{encoding}"'
+        return "identity", self.variants["identity"], f'"{self.digest}"'
+
+
+_static_assets: Dict[str, Asset] = {}  # path relative to static/ -> Asset
+_templates: Dict[str, Asset] = {}  # template name -> rendered Asset
+_lock = threading.Lock()
+
+
+def _content_type(path: str) -> str:
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def _load_static(relative_path: str) -> Optional[Asset]:
+    """Load (or reuse) a static file, reloading it in dev mode when it changed"""
+    path = os.path.join(STATIC_DIR, relative_path)
+    asset = _static_assets.get(relative_path)
+    if asset is not None and not ASSETS_DEV_MODE:
+        return asset
+
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if asset is not None and asset.mtime_ns == mtime_ns:
+        return asset
+
+    with open(path, "rb") as f:
+        body = f.read()
+    extension = os.path.splitext(path)[1].lower()
+    asset = Asset(body, _content_type(path), mtime_ns, extension in COMPRESSIBLE_EXTENSIONS)
+    with _lock:
+        _static_assets[relative_path] = asset
+    return asset
+
+
+def hashed_url(relative_path: str) -> str:
+    """Content-hashed URL for a static file (falls back to /static when missing)"""
+    asset = _load_static(relative_path)
+    if asset is None:
+        return f"/static/{relative_path}"
+    root, extension = os.path.splitext(relative_path)
+    return f"{ASSETS_URL_PREFIX}/{root}.{asset.digest}{extension}"
+
+
+def get_hashed_asset(hashed_path: str) -> Optional[Asset]:
+    """Resolve /assets/<name>.<hash>.<ext> - only the current hash is served"""
+    root, extension = os.path.splitext(hashed_path)
+    name, _, digest = root.rpartition(".")
+    if not name or not digest or extension.lower() not in COMPRESSIBLE_EXTENSIONS:
+        return None
+    if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+        return None
+    asset = _load_static(name + extension)
+    if asset is None or asset.digest != digest:
+        return None
+    return asset
+
+
+def get_template(name: str) -> Optional[Asset]:
+    """Template with its /static references rewritten to content-hashed URLs"""
+    path = os.path.join(TEMPLATES_DIR, name)
+    template = _templates.get(name)
+    if template is not None and not ASSETS_DEV_MODE:
+        return template
+
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    # In dev mode a template is also re-rendered when a referenced asset changed
+    if (template is not None and template.mtime_ns == mtime_ns
+            and all(hashed_url(static_path) == url for static_path, url in template.references.items())):
+        return template
+
+    with open(path, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    references = {}
+
+    def rewrite(match):
+        quote, relative_path = match.group(1), match.group(2)
+        url = hashed_url(relative_path)
+        references[relative_path] = url
+        return f"{quote}{url}{quote}"
+
+    rendered = STATIC_REFERENCE.sub(rewrite, html)
+    template = Asset(rendered.encode("utf-8"), "text/html; charset=utf-8", mtime_ns, True, references)
+    with _lock:
+        _templates[name] = template
+    return template
+
+
+def preload_assets():
+    """Read, hash and compress every template and static asset up front"""
+    count = 0
+    for root, _, files in os.walk(STATIC_DIR):
+        for filename in files:
+            extension = os.path.splitext(filename)[1].lower()
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                relative_path = os.path.relpath(os.path.join(root, filename), STATIC_DIR).replace(os.sep, "/")
+                if _load_static(relative_path):
+                    count += 1
+    for filename in os.listdir(TEMPLATES_DIR):
+        if filename.endswith(".html") and get_template(filename):
+            count += 1
+    print(f"[SUCCESS] Preloaded {count} templates and static assets"
+          f" ({'gzip + brotli' if BROTLI_AVAILABLE else 'gzip'} variants)")
@@ -0,0 +1,185 @@
+"""
+Chunked Upload Module
+Resumable uploads for large media over flaky links (phones, ESP32 with short HTTP timeouts)
+Protocol: init (declare size / hash) -> put chunks at the current offset -> finalize
+Chunks are appended to a temp file; the client asks for the offset to resume after a drop
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import threading
+from typing import Optional, Dict, Tuple
+
+from media import MediaInput
+
+# Configuration
+MEMORY_DIR = "memory"
+CHUNKED_UPLOAD_DIR = os.environ.get("CHUNKED_UPLOAD_DIR", os.path.join(MEMORY_DIR, "uploads"))
+CHUNKED_UPLOAD_TTL_SECONDS = int(os.environ.get("CHUNKED_UPLOAD_TTL_SECONDS", "3600"))  # Since last activity
+CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get("CHUNKED_UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+CHUNKED_UPLOAD_MAX_CHUNK = int(os.environ.get("CHUNKED_UPLOAD_MAX_CHUNK", str(8 * 1024 * 1024)))
+CHUNKED_UPLOAD_CHUNK_SIZE = 1024 * 1024  # Suggested to clients
+UPLOAD_TARGETS = ("chat", "esp32")
+
+
+class UploadError(Exception):
+    """Upload protocol error with the HTTP status to report"""
+
+    def __init__(self, message: str, status_code: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class ChunkedUpload:
+    """State of one in-progress upload"""
+
+    def __init__(self, target: str, size: int, mime_type: str, sha256: Optional[str], owner: Dict):
+        self.upload_id = uuid.uuid4().hex
+        self.target = target
+        self.size = size
+        self.mime_type = mime_type
+        self.expected_sha256 = sha256.lower() if sha256 else None
+        self.owner = owner  # e.g. {"username": ...} or {"device_id": ...}
+        self.path = os.path.join(CHUNKED_UPLOAD_DIR, f"{self.upload_id}.part")
+        self.offset = 0
+        self.digest = hashlib.sha256()  # Running hash - chunks arrive strictly in order
+        self.finalized = False
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    @property
+    def expires_at(self) -> float:
+        return self.updated_at + CHUNKED_UPLOAD_TTL_SECONDS
+
+    def status(self) -> Dict:
+        return {
+            "upload_id": self.upload_id,
+            "target": self.target,
+            "offset": self.offset,
+            "size": self.size,
+            "complete": self.offset == self.size,
+            "chunk_size": CHUNKED_UPLOAD_CHUNK_SIZE,
+            "expires_at": int(self.expires_at)
+        }
+
+
+_uploads: Dict[str, ChunkedUpload] = {}
+_uploads_lock = threading.Lock()
+
+
+def _discard(upload: ChunkedUpload):
+    try:
+        os.remove(upload.path)
+    except OSError:
+        pass
+
+
+def cleanup_expired_uploads():
+    """Drop uploads idle for longer than the TTL (and stray files from before a restart)"""
+    now = time.time()
+    with _uploads_lock:
+        expired = [upload for upload in _uploads.values() if upload.expires_at < now]
+        for upload in expired:
+            del _uploads[upload.upload_id]
+        known = {f"{upload_id}.part" for upload_id in _uploads}
+
+    for upload in expired:
+        _discard(upload)
+    if expired:
+        print(f"[UPLOAD] Removed {len(expired)} expired uploads")
+
+    if os.path.isdir(CHUNKED_UPLOAD_DIR):
+        for filename in os.listdir(CHUNKED_UPLOAD_DIR):
+            path = os.path.join(CHUNKED_UPLOAD_DIR, filename)
+            if filename not in known and os.path.getmtime(path) < now - CHUNKED_UPLOAD_TTL_SECONDS:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def create_upload(target: str, size: int, mime_type: str, sha256: Optional[str] = None,
+                  owner: Optional[Dict] = None) -> ChunkedUpload:
+    """Start a new upload of `size` bytes"""
+    if target not in UPLOAD_TARGETS:
+        raise UploadError(f"target must be one of {', '.join(UPLOAD_TARGETS)}")
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError("size must be a positive integer")
+    if size > CHUNKED_UPLOAD_MAX_BYTES:
+        raise UploadError(f"Upload exceeds {CHUNKED_UPLOAD_MAX_BYTES} bytes", status_code=413)
+
+    cleanup_expired_uploads()
+    upload = ChunkedUpload(target, size, mime_type or "application/octet-stream", sha256, owner or {})
+    os.makedirs(CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(upload.path, "wb").close()
+    with _uploads_lock:
+        _uploads[upload.upload_id] = upload
+    print(f"[UPLOAD] Started {target} upload {upload.upload_id} ({size} bytes, {upload.mime_type})")
+    return upload
+
+
+def get_upload(upload_id: str) -> ChunkedUpload:
+    with _uploads_lock:
+        upload = _uploads.get(upload_id)
+    if upload is None or upload.expires_at < time.time():
+        raise UploadError("Upload not found or expired", status_code=404)
+    return upload
+
+
+def write_chunk(upload_id: str, offset: int, data: bytes, chunk_sha256: Optional[str] = None) -> ChunkedUpload:
+    """Append a chunk that starts at the current offset (a mismatch reports the offset to resume from)"""
+    upload = get_upload(upload_id)
+    if len(data) > CHUNKED_UPLOAD_MAX_CHUNK:
+        raise UploadError(f"Chunk exceeds {CHUNKED_UPLOAD_MAX_CHUNK} bytes", status_code=413, offset=upload.offset)
+    if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise UploadError("Chunk checksum mismatch", status_code=422, offset=upload.offset)
+
+    with upload.lock:
+        if upload.finalized:
+            raise UploadError("Upload already finalized", status_code=409, offset=upload.offset)
+        if offset != upload.offset:
+            raise UploadError(f"Expected offset {upload.offset}", status_code=409, offset=upload.offset)
+        if upload.offset + len(data) > upload.size:
+            raise UploadError("Chunk goes past the declared size", status_code=413, offset=upload.offset)
+
+        with open(upload.path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+        upload.digest.update(data)
+        upload.offset += len(data)
+        upload.updated_at = time.time()
+    return upload
+
+
+def finalize_upload(upload_id: str) -> Tuple[ChunkedUpload, MediaInput]:
+    """Check completeness and integrity, then hand the assembled file over as MediaInput
+
+    The upload is forgotten here; its file is unlinked and lives on until the media is closed.
+    """
+    upload = get_upload(upload_id)
+    with upload.lock:
+        if upload.finalized:
+            raise UploadError("Upload already finalized", status_code=409, offset=upload.offset)
+        if upload.offset != upload.size:
+            raise UploadError(f"Upload incomplete: {upload.offset} of {upload.size} bytes",
+                              status_code=409, offset=upload.offset)
+        content_hash = upload.digest.hexdigest()
+        if upload.expected_sha256 and content_hash != upload.expected_sha256:
+            with _uploads_lock:
+                _uploads.pop(upload_id, None)
+            _discard(upload)
+            raise UploadError("File checksum mismatch - upload discarded", status_code=422)
+        upload.finalized = True
+
+    with _uploads_lock:
+        _uploads.pop(upload_id, None)
+
+    # Unlinked right away; the open handle keeps the data until the media is closed
+    f = open(upload.path, "rb")
+    _discard(upload)
+    media = MediaInput(upload.mime_type, file=f, content_hash=content_hash)
+    print(f"[UPLOAD] Finalized {upload.target} upload {upload_id} ({upload.size} bytes)")
+    return upload, media
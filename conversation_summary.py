@@ -0,0 +1,127 @@
+"""
+Conversation Summary Module
+Folds older conversation turns into a rolling per-user summary in the background
+so prompts stay short while long-range context is still remembered
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Callable
+
+from database import load_conversation_range, count_conversation_turns, load_summary, save_summary
+from prompt_assembly import load_history, LOCKET_HISTORY_LIMIT
+
+# Configuration
+SUMMARY_BATCH_SIZE = int(os.environ.get("SUMMARY_BATCH_SIZE", "10"))  # Fold every K messages
+SUMMARY_MAX_WORDS = int(os.environ.get("SUMMARY_MAX_WORDS", "300"))
+
+# Text generator used to write summaries (registered by app.py to keep Gemini calls there)
+_text_generator: Optional[Callable[[str], Optional[str]]] = None
+
+# Single background worker so summaries for one user are never written concurrently
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def register_text_generator(generator: Callable[[str], Optional[str]]):
+    """Register the function used to turn a summarization prompt into text"""
+    global _text_generator
+    _text_generator = generator
+
+
+def format_turn(msg: Dict) -> str:
+    """Format one stored turn as transcript text"""
+    media_note = f" (with {msg.get('media_type') or 'media'})" if msg.get("has_media") else ""
+    return f"User: {msg.get('user_message') or ''}{media_note}\nAssistant: {msg.get('bot_response') or ''}"
+
+
+def build_summary_prompt(previous_summary: str, messages: List[Dict]) -> str:
+    """Build the prompt that folds a batch of messages into the existing summary"""
+    transcript = "\n\n".join(filter(None, (format_turn(msg) for msg in messages)))
+    return (
+        "You maintain a rolling memory summary of a user's conversations with their AI assistant Rile.\n"
+        "Update the existing summary with the new conversation turns below.\n"
+        "Keep every durable fact: names, preferences, goals, plans, possessions and where they are, "
+        "observations from images or videos, and open questions. Drop small talk.\n"
+        f"Write plain prose or short bullet points, at most {SUMMARY_MAX_WORDS} words, "
+        "and reply with the updated summary only.\n\n"
+        f"EXISTING SUMMARY:\n{previous_summary or '(none yet)'}\n\n"
+        f"NEW CONVERSATION TURNS:\n{transcript}"
+    )
+
+
+def kept_recent_count(username: str, mode: str) -> int:
+    """How many of this mode's newest turns every prompt still replays in full
+
+    Prompts replay the newest turns of personal-assistant and sustainability mode merged
+    (personal-assistant requests), so this mode's share of that window - the shortest one,
+    used by the locket - is what stays out of the summary; everything older is folded.
+    """
+    history = load_history(username, "personal-assistant", LOCKET_HISTORY_LIMIT)
+    return sum(1 for msg in history if msg["mode"] == mode)
+
+
+def update_summary(username: str, mode: str) -> bool:
+    """Fold every complete batch of messages older than the recent window into the summary"""
+    if _text_generator is None:
+        return False
+
+    stored = load_summary(username, mode) or {}
+    summary = stored.get("summary", "")
+    summarized_count = stored.get("summarized_count", 0)
+    # Timestamp of the newest folded turn - unlike a row position it stays valid when
+    # older months are archived out of the database
+    summarized_until = stored.get("summarized_until")
+
+    # Only turns that already dropped out of the replayed history are folded
+    foldable = count_conversation_turns(username, mode, summarized_until) - kept_recent_count(username, mode)
+    if foldable < SUMMARY_BATCH_SIZE:
+        return False
+
+    # Read just the turns not folded yet, not the whole history
+    messages = load_conversation_range(username, mode, summarized_until, foldable)
+    updated = False
+
+    for start in range(0, len(messages) - SUMMARY_BATCH_SIZE + 1, SUMMARY_BATCH_SIZE):
+        batch = messages[start:start + SUMMARY_BATCH_SIZE]
+        new_summary = _text_generator(build_summary_prompt(summary, batch))
+        if not new_summary:
+            print(f"[WARNING] Summary generation failed for {username} ({mode}), will retry later")
+            break
+
+        summary = new_summary.strip()
+        summarized_count += len(batch)
+        summarized_until = batch[-1]["timestamp"]
+        updated = True
+
+    if updated:
+        save_summary(username, mode, summary, summarized_count, summarized_until)
+        print(f"[SUCCESS] Rolling summary updated for {username} ({mode}): {summarized_count} messages folded")
+
+    return updated
+
+
+def _run_summary_update(username: str, mode: str):
+    """Background task wrapper that clears the pending flag"""
+    with _pending_lock:
+        _pending.discard((username, mode))
+    try:
+        update_summary(username, mode)
+    except Exception as e:
+        print(f"[ERROR] Background summary update failed for {username}: {e}")
+
+
+def schedule_summary_update(username: str, mode: str):
+    """Queue a background summary update (coalesced per user and mode)"""
+    if _text_generator is None:
+        return
+
+    key = (username, mode)
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+
+    _executor.submit(_run_summary_update, username, mode)
@@ -1,19 +1,34 @@
 """
 Database Module for SDG Chat Bot
-Supports both PostgreSQL (Railway) and JSON file storage (local development)
-Automatically switches based on DATABASE_URL environment variable
+Supports PostgreSQL (Railway), embedded SQLite (single-node deployments) and JSON file
+storage (local development)
+Automatically switches based on the DATABASE_URL / SQLITE_DATABASE_PATH environment variables
 """
 
 import os
 import json
+import hmac
+import uuid
+import bisect
+import asyncio
+import sqlite3
+import threading
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
+
+from db_migrations import apply_migrations
+from db_pool import ConnectionPool, execute_prepared, register_prepared_statement
+from db_partitions import (PartitionMaintainer, has_archives, load_archived_messages, load_archived_memories,
+                           load_archived_conversation)
+from group_commit import GroupCommitWriter
+from sqlite_storage import SQLITE_DATABASE_PATH, init_sqlite, sqlite_connection, sqlite_transaction
+from user_directory import user_directory
+from user_locks import user_write_lock
 
 # Try to import psycopg2 (only available in production/Railway)
 try:
     import psycopg2
     from psycopg2.extras import RealDictCursor
-    from psycopg2.pool import SimpleConnectionPool
     PSYCOPG2_AVAILABLE = True
 except ImportError:
     PSYCOPG2_AVAILABLE = False
@@ -22,157 +37,248 @@ except ImportError:
 # Configuration
 DATABASE_URL = os.environ.get("DATABASE_URL")
 USE_DATABASE = DATABASE_URL is not None and PSYCOPG2_AVAILABLE
+USE_SQLITE = not USE_DATABASE and SQLITE_DATABASE_PATH is not None
 MEMORY_DIR = "memory"
 
-# Database connection pool
+# Database connection pool, the group-commit writer for conversation inserts
+# and the background job that creates / archives monthly partitions
 db_pool = None
+conversation_writer = None
+partition_maintainer = None
+
+# init_database() runs once per process - at startup, or on first use outside the app
+_init_lock = threading.RLock()  # Re-entrant: the legacy locket conversion saves through the storage API
+_initialized = False
+
+# Per-user history version counters (bumped on every write, used for HTTP ETags)
+# The epoch changes on every restart so versions from a previous process never match
+HISTORY_VERSION_EPOCH = uuid.uuid4().hex[:8]
+_history_versions: Dict[str, int] = {}
+_history_versions_lock = threading.Lock()
+
+def bump_history_version(username: str) -> int:
+    """Mark a user's stored history as changed"""
+    with _history_versions_lock:
+        _history_versions[username] = _history_versions.get(username, 0) + 1
+        return _history_versions[username]
+
+def get_history_version(username: str) -> str:
+    """Current history version of a user (cheap in-memory lookup, no storage access)"""
+    return f"{HISTORY_VERSION_EPOCH}.{_history_versions.get(username, 0)}"
+
+# Hot queries, prepared once per pooled connection
+register_prepared_statement("update_extracted_memory", ["jsonb", "text", "timestamp"], """
+    UPDATE detailed_memories SET extracted_memory = $1 WHERE session_id = $2 AND timestamp = $3
+""")
+register_prepared_statement("load_conversation_messages", ["text", "text"], """
+    SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+    FROM conversations
+    WHERE username = $1 AND mode = $2
+    ORDER BY timestamp ASC
+""")
+register_prepared_statement("load_mode_memories", ["text", "text"], """
+    SELECT media_type, timestamp, detailed_analysis, extracted_memory
+    FROM detailed_memories
+    WHERE username = $1 AND mode = $2
+    ORDER BY timestamp ASC
+""")
+register_prepared_statement("history_page_newest", ["text", "text", "integer"], """
+    SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+    FROM conversations
+    WHERE username = $1 AND mode = $2
+    ORDER BY timestamp DESC
+    LIMIT $3
+""")
+register_prepared_statement("history_page_before", ["text", "text", "timestamp", "integer"], """
+    SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+    FROM conversations
+    WHERE username = $1 AND mode = $2 AND timestamp < $3
+    ORDER BY timestamp DESC
+    LIMIT $4
+""")
+register_prepared_statement("history_page_after", ["text", "text", "timestamp", "integer"], """
+    SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+    FROM conversations
+    WHERE username = $1 AND mode = $2 AND timestamp > $3
+    ORDER BY timestamp ASC
+    LIMIT $4
+""")
+register_prepared_statement("history_page_memories", ["text", "timestamp", "timestamp", "text[]"], """
+    SELECT media_type, timestamp, detailed_analysis, extracted_memory
+    FROM detailed_memories
+    WHERE username = $1
+      AND timestamp > COALESCE($2, '-infinity'::timestamp)
+      AND timestamp <= COALESCE($3, 'infinity'::timestamp)
+      AND session_id = ANY($4)
+    ORDER BY timestamp DESC
+""")
+register_prepared_statement("history_range", ["text", "text", "timestamp", "integer"], """
+    SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+    FROM conversations
+    WHERE username = $1 AND mode = $2 AND timestamp > COALESCE($3, '-infinity'::timestamp)
+    ORDER BY timestamp ASC
+    LIMIT $4
+""")
+register_prepared_statement("count_conversation_turns", ["text", "text", "timestamp"], """
+    SELECT COUNT(*) FROM conversations
+    WHERE username = $1 AND mode = $2 AND timestamp > COALESCE($3, '-infinity'::timestamp)
+""")
+register_prepared_statement("load_summary", ["text", "text"], """
+    SELECT summary, summarized_count, summarized_until, updated_at
+    FROM conversation_summaries
+    WHERE username = $1 AND mode = $2
+""")
+register_prepared_statement("verify_login", ["text", "text"], """
+    SELECT id, username, created_at FROM users WHERE username = $1 AND password_hash = $2
+""")
+register_prepared_statement("update_last_login", ["timestamp", "text"], """
+    UPDATE users SET last_login = $1 WHERE username = $2
+""")
+register_prepared_statement("check_username", ["text"], """
+    SELECT 1 FROM users WHERE username = $1
+""")
 
 def init_database():
-    """Initialize database connection pool and create tables if using PostgreSQL"""
-    global db_pool
-    
-    if not USE_DATABASE:
-        print("[INFO] Using JSON file storage (DATABASE_URL not set)")
-        # Ensure memory directory exists
-        if not os.path.exists(MEMORY_DIR):
-            os.makedirs(MEMORY_DIR)
-        return None
-    
-    print("[INFO] Using PostgreSQL database")
+    """Initialize storage once per process: pool, versioned schema and background writers
+
+    Idempotent - later calls return the pool created by the first one. Called from the
+    app's startup, or lazily by the first storage access when the module is used alone.
+    """
+    global db_pool, conversation_writer, partition_maintainer, _initialized
     
-    try:
-        # Create connection pool
-        db_pool = SimpleConnectionPool(1, 10, DATABASE_URL)
-        
-        # Create tables
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Conversations table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS conversations (
-                id SERIAL PRIMARY KEY,
-                session_id VARCHAR(255) NOT NULL,
-                username VARCHAR(255) NOT NULL,
-                mode VARCHAR(50) NOT NULL,
-                user_message TEXT,
-                bot_response TEXT,
-                has_media BOOLEAN DEFAULT FALSE,
-                media_type VARCHAR(50),
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Index for faster queries
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_session_id 
-            ON conversations(session_id)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_mode 
-            ON conversations(mode)
-        """)
-        
-        # Detailed memories table (for media analysis)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS detailed_memories (
-                id SERIAL PRIMARY KEY,
-                session_id VARCHAR(255) NOT NULL,
-                media_type VARCHAR(50),
-                timestamp TIMESTAMP,
-                detailed_analysis TEXT,
-                extracted_memory JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Users table for authentication
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(255) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_username 
-            ON users(username)
-        """)
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
-        
-        print("[SUCCESS] Database initialized successfully")
-        return db_pool
+    with _init_lock:
+        if _initialized:
+            return db_pool
         
-    except Exception as e:
-        print(f"[ERROR] Database initialization failed: {e}")
-        raise
+        if USE_SQLITE:
+            print(f"[INFO] Using SQLite database: {SQLITE_DATABASE_PATH}")
+            schema_version = init_sqlite()
+            convert_legacy_locket_files()
+            print(f"[SUCCESS] SQLite database initialized (schema version {schema_version})")
+            _initialized = True
+            return None
+        
+        if not USE_DATABASE:
+            print("[INFO] Using JSON file storage (DATABASE_URL not set)")
+            # Ensure memory directory exists
+            if not os.path.exists(MEMORY_DIR):
+                os.makedirs(MEMORY_DIR)
+            convert_legacy_locket_files()
+            _initialized = True
+            return None
+        
+        print("[INFO] Using PostgreSQL database")
+        
+        try:
+            # Create connection pool (thread-safe, sized by DB_POOL_MIN / DB_POOL_MAX)
+            pool = ConnectionPool(DATABASE_URL)
+            
+            # Create / upgrade tables through the versioned migrations
+            with pool.connection() as conn:
+                schema_version = apply_migrations(conn)
+            print(f"[INFO] Database schema version {schema_version}")
+            
+            db_pool = pool
+            conversation_writer = GroupCommitWriter(db_pool)
+            partition_maintainer = PartitionMaintainer(db_pool)
+            _initialized = True
+            convert_legacy_locket_files()
+            
+            print("[SUCCESS] Database initialized successfully")
+            return db_pool
+            
+        except Exception as e:
+            print(f"[ERROR] Database initialization failed: {e}")
+            raise
 
-def get_db_connection():
-    """Get a database connection from the pool"""
-    if not USE_DATABASE or db_pool is None:
-        return None
-    return db_pool.getconn()
+def warm_database_connections() -> int:
+    """Open the pool's warm connections and prepare the hot statements on them (0 without PostgreSQL)"""
+    return db_pool.warm() if USE_DATABASE and db_pool is not None else 0
+
+def close_database():
+    """Flush queued writes and pending user-directory updates, stop background threads, close the pool"""
+    global db_pool, conversation_writer, partition_maintainer, _initialized
+    
+    with _init_lock:
+        if conversation_writer is not None:
+            conversation_writer.close()
+        if partition_maintainer is not None:
+            partition_maintainer.close()
+        if db_pool is not None:
+            db_pool.closeall()
+        db_pool = conversation_writer = partition_maintainer = None
+        _initialized = False
+    user_directory.flush()
+    print("[INFO] Database closed")
+
+def db_connection():
+    """Context manager for a pooled connection - rolled back on error, always released"""
+    if not USE_DATABASE:
+        raise RuntimeError("PostgreSQL is not configured")
+    if db_pool is None:
+        init_database()
+    return db_pool.connection()
+
+def get_pool_stats() -> Optional[Dict]:
+    """Connection pool size and wait-time metrics (None with JSON storage)"""
+    return db_pool.stats() if USE_DATABASE and db_pool is not None else None
 
-def release_db_connection(conn):
-    """Release connection back to the pool"""
-    if USE_DATABASE and db_pool and conn:
-        db_pool.putconn(conn)
+def get_writer_stats() -> Optional[Dict]:
+    """Group-commit batch metrics (None with JSON storage)"""
+    return conversation_writer.stats() if conversation_writer is not None else None
+
+def get_partition_stats() -> Optional[Dict]:
+    """Partition maintenance metrics (None with JSON storage)"""
+    return partition_maintainer.stats() if partition_maintainer is not None else None
+
+def get_user_directory_stats() -> Optional[Dict]:
+    """In-memory user directory metrics (None unless users live in users.json)"""
+    return user_directory.stats() if not USE_DATABASE and not USE_SQLITE else None
 
 def save_conversation_db(session_id: str, username: str, message: str, response: str, 
                         has_media: bool = False, media_type: Optional[str] = None, 
-                        mode: str = "sustainability", detailed_memory: Optional[Dict] = None) -> bool:
-    """Save conversation to PostgreSQL database"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Insert conversation message
-        cursor.execute("""
-            INSERT INTO conversations 
-            (session_id, username, mode, user_message, bot_response, has_media, media_type, timestamp)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (session_id, username, mode, message, response, has_media, media_type, datetime.now()))
-        
-        # Insert detailed memory if provided
-        if detailed_memory and has_media:
-            cursor.execute("""
-                INSERT INTO detailed_memories 
-                (session_id, media_type, timestamp, detailed_analysis, extracted_memory)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                session_id,
-                detailed_memory.get('media_type'),
-                detailed_memory.get('timestamp'),
-                detailed_memory.get('detailed_analysis'),
-                json.dumps(detailed_memory.get('extracted_memory', {}))
-            ))
-        
-        conn.commit()
-        cursor.close()
-        release_db_connection(conn)
-        
-        print(f"[SUCCESS] Conversation saved to database: {session_id}")
+                        mode: str = "sustainability", detailed_memory: Optional[Dict] = None,
+                        timestamp: Optional[datetime] = None, wait: bool = True,
+                        channel: str = "chat") -> bool:
+    """
+    Save conversation to PostgreSQL through the group-commit writer
+    wait=True blocks until the turn is committed; wait=False returns once it is queued
+    """
+    timestamp = timestamp or datetime.now()
+    conversation_row = (session_id, username, mode, message, response, has_media, media_type, timestamp, channel)
+    memory_row = None
+    if detailed_memory and has_media:
+        memory_row = (
+            session_id,
+            username,
+            mode,
+            detailed_memory.get('media_type'),
+            detailed_memory.get('timestamp'),
+            detailed_memory.get('detailed_analysis'),
+            json.dumps(detailed_memory.get('extracted_memory', {}))
+        )
+    
+    if conversation_writer is None:
+        init_database()
+    
+    if not wait:
+        # History readers must not cache a version that predates the commit
+        conversation_writer.submit(conversation_row, memory_row,
+                                   on_commit=lambda committed: committed and bump_history_version(username))
+        print(f"[INFO] Conversation queued for group commit: {session_id}")
         return True
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to save conversation to database: {e}")
-        if conn:
-            conn.rollback()
-            release_db_connection(conn)
-        return False
+    
+    saved = conversation_writer.write(conversation_row, memory_row)
+    if saved:
+        print(f"[SUCCESS] Conversation saved to database: {session_id}")
+    return saved
 
 def save_conversation_json(session_id: str, username: str, message: str, response: str,
                           has_media: bool = False, media_type: Optional[str] = None,
-                          mode: str = "sustainability", detailed_memory: Optional[Dict] = None) -> bool:
+                          mode: str = "sustainability", detailed_memory: Optional[Dict] = None,
+                          timestamp: Optional[datetime] = None, channel: str = "chat") -> bool:
     """Save conversation to JSON file by username"""
+    timestamp = timestamp or datetime.now()
     try:
         memory_subdir = "personal_assistant" if mode == "personal-assistant" else "sustainability"
         mode_memory_dir = os.path.join(MEMORY_DIR, memory_subdir)
@@ -195,12 +301,13 @@ def save_conversation_json(session_id: str, username: str, message: str, respons
                 conversation_data = json.load(f)
         
         message_entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp.isoformat(),
             "session_id": session_id,  # Keep session_id for reference
             "user_message": message,
             "bot_response": response,
             "has_media": has_media,
-            "media_type": media_type
+            "media_type": media_type,
+            "channel": channel
         }
         
         conversation_data["messages"].append(message_entry)
@@ -220,70 +327,326 @@ def save_conversation_json(session_id: str, username: str, message: str, respons
         print(f"[ERROR] Failed to save conversation to JSON: {e}")
         return False
 
+def save_conversation_sqlite(session_id: str, username: str, message: str, response: str,
+                            has_media: bool = False, media_type: Optional[str] = None,
+                            mode: str = "sustainability", detailed_memory: Optional[Dict] = None,
+                            timestamp: Optional[datetime] = None, channel: str = "chat") -> bool:
+    """Save conversation to SQLite (turn and detailed memory in one transaction)"""
+    timestamp = timestamp or datetime.now()
+    try:
+        with sqlite_transaction() as conn:
+            conn.execute("""
+                INSERT INTO conversations
+                (session_id, username, mode, user_message, bot_response, has_media, media_type, timestamp, channel)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (session_id, username, mode, message, response, 1 if has_media else 0, media_type,
+                  timestamp.isoformat(), channel))
+            
+            if detailed_memory and has_media:
+                conn.execute("""
+                    INSERT INTO detailed_memories
+                    (session_id, username, mode, media_type, timestamp, detailed_analysis, extracted_memory)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    session_id,
+                    username,
+                    mode,
+                    detailed_memory.get('media_type'),
+                    detailed_memory.get('timestamp'),
+                    detailed_memory.get('detailed_analysis'),
+                    json.dumps(detailed_memory.get('extracted_memory', {}))
+                ))
+        
+        print(f"[SUCCESS] Conversation saved to SQLite: {session_id}")
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to save conversation to SQLite: {e}")
+        return False
+
 def save_conversation(session_id: str, username: str, message: str, response: str,
                      has_media: bool = False, media_type: Optional[str] = None,
-                     mode: str = "sustainability", detailed_memory: Optional[Dict] = None) -> bool:
+                     mode: str = "sustainability", detailed_memory: Optional[Dict] = None,
+                     wait: bool = True, channel: str = "chat") -> bool:
     """
     Save conversation - automatically uses database or JSON based on configuration
+    wait=False lets the database writer commit the turn in the background (fire-and-forget)
+    channel tells where the turn came from ("chat" or "locket")
+    Writes for one user are serialized (other users are not blocked), so overlapping
+    turns never overwrite each other and keep their timestamp order
     """
-    if USE_DATABASE:
-        return save_conversation_db(session_id, username, message, response, 
-                                   has_media, media_type, mode, detailed_memory)
-    else:
-        return save_conversation_json(session_id, username, message, response,
-                                     has_media, media_type, mode, detailed_memory)
+    with user_write_lock(username):
+        timestamp = datetime.now()
+        if USE_DATABASE:
+            saved = save_conversation_db(session_id, username, message, response, 
+                                         has_media, media_type, mode, detailed_memory, timestamp, wait, channel)
+        elif USE_SQLITE:
+            saved = save_conversation_sqlite(session_id, username, message, response,
+                                             has_media, media_type, mode, detailed_memory, timestamp, channel)
+        else:
+            saved = save_conversation_json(session_id, username, message, response,
+                                           has_media, media_type, mode, detailed_memory, timestamp, channel)
+        if saved:
+            bump_history_version(username)
+    
+    if saved:
+        # Keep the lexical and semantic memory indexes in step with storage
+        from memory_index import index_conversation_turn
+        from embedding_store import embed_conversation_turn
+        index_conversation_turn(username, mode, timestamp.isoformat(), message, response,
+                                detailed_memory if has_media else None)
+        embed_conversation_turn(username, mode, timestamp.isoformat(), message, response,
+                                detailed_memory if has_media else None)
+        
+        # Fold older turns into the rolling summary in the background
+        from conversation_summary import schedule_summary_update
+        schedule_summary_update(username, mode)
+    
+    return saved
 
-def load_conversation_db(username: str, mode: str = "sustainability") -> Optional[Dict]:
-    """Load conversation from PostgreSQL database by username"""
+async def save_conversation_async(*args, **kwargs) -> bool:
+    """save_conversation for async handlers - the storage write, the wait for the group commit
+    and the index updates run in a worker thread, so concurrent requests keep being served
+    (and their turns still share a commit)"""
+    return await asyncio.to_thread(save_conversation, *args, **kwargs)
+
+def update_detailed_memory_db(session_id: str, timestamp: str, extracted_memory: Dict) -> bool:
+    """Fill in the structured fields of a stored detailed memory in PostgreSQL"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            execute_prepared(cursor, "update_extracted_memory", (json.dumps(extracted_memory), session_id, timestamp))
+            
+            updated = cursor.rowcount > 0
+            conn.commit()
+            cursor.close()
+        return updated
         
-        # Get messages for this user and mode (all sessions)
-        cursor.execute("""
-            SELECT user_message, bot_response, has_media, media_type, timestamp, session_id
-            FROM conversations
-            WHERE username = %s AND mode = %s
-            ORDER BY timestamp ASC
-        """, (username, mode))
+    except Exception as e:
+        print(f"[ERROR] Failed to update detailed memory in database: {e}")
+        return False
+
+def update_detailed_memory_json(username: str, mode: str, timestamp: str, extracted_memory: Dict) -> bool:
+    """Fill in the structured fields of a stored detailed memory in the user's JSON file"""
+    try:
+        memory_subdir = "personal_assistant" if mode == "personal-assistant" else "sustainability"
+        file_path = os.path.join(MEMORY_DIR, memory_subdir, f"{username}.json")
         
-        messages = cursor.fetchall()
+        if not os.path.exists(file_path):
+            return False
         
-        if not messages:
-            cursor.close()
-            release_db_connection(conn)
-            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            conversation_data = json.load(f)
         
-        # Get detailed memories for this user (all sessions)
-        cursor.execute("""
-            SELECT media_type, timestamp, detailed_analysis, extracted_memory
-            FROM detailed_memories
-            WHERE session_id IN (
-                SELECT DISTINCT session_id FROM conversations WHERE username = %s
-            )
-            ORDER BY timestamp ASC
-        """, (username,))
+        updated = False
+        for memory in conversation_data.get("detailed_memories", []):
+            if memory.get("timestamp") == timestamp:
+                memory["extracted_memory"] = extracted_memory
+                updated = True
         
-        memories = cursor.fetchall()
+        if updated:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(conversation_data, f, indent=2, ensure_ascii=False)
+        
+        return updated
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to update detailed memory in JSON: {e}")
+        return False
+
+def update_detailed_memory_sqlite(session_id: str, timestamp: str, extracted_memory: Dict) -> bool:
+    """Fill in the structured fields of a stored detailed memory in SQLite"""
+    try:
+        with sqlite_transaction() as conn:
+            cursor = conn.execute("""
+                UPDATE detailed_memories SET extracted_memory = ? WHERE session_id = ? AND timestamp = ?
+            """, (json.dumps(extracted_memory), session_id, timestamp))
+        return cursor.rowcount > 0
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to update detailed memory in SQLite: {e}")
+        return False
+
+def update_detailed_memory(username: str, mode: str, session_id: str, timestamp: str,
+                           extracted_memory: Dict, detailed_analysis: Optional[str] = None) -> bool:
+    """
+    Update the extracted_memory of a detailed memory - automatically uses database or JSON
+    """
+    with user_write_lock(username):
+        if USE_DATABASE:
+            updated = update_detailed_memory_db(session_id, timestamp, extracted_memory)
+        elif USE_SQLITE:
+            updated = update_detailed_memory_sqlite(session_id, timestamp, extracted_memory)
+        else:
+            updated = update_detailed_memory_json(username, mode, timestamp, extracted_memory)
+        if updated:
+            bump_history_version(username)
+    
+    if updated:
+        # Re-index so the structured fields become searchable
+        from memory_index import index_detailed_memory
+        from embedding_store import embed_detailed_memory
+        detailed_memory = {
+            "timestamp": timestamp,
+            "detailed_analysis": detailed_analysis,
+            "extracted_memory": extracted_memory
+        }
+        index_detailed_memory(username, mode, detailed_memory)
+        embed_detailed_memory(username, mode, detailed_memory)
+    
+    return updated
+
+# ============================================
+# Legacy locket format
+# ============================================
+
+# Session id given to turns rebuilt from legacy locket entries (the originals had none)
+LEGACY_LOCKET_SESSION = "locket-legacy"
+
+def _legacy_locket_turn(user_entry: Optional[Dict], assistant_entry: Optional[Dict]) -> Dict:
+    first = user_entry or assistant_entry
+    return {
+        "timestamp": first.get("timestamp"),
+        "session_id": LEGACY_LOCKET_SESSION,
+        "user_message": user_entry.get("content", "") if user_entry else "",
+        "bot_response": assistant_entry.get("content", "") if assistant_entry else "",
+        "has_media": False,
+        "media_type": None,
+        "channel": "locket"
+    }
+
+def convert_legacy_locket_messages(messages: List[Dict]) -> Tuple[List[Dict], int]:
+    """
+    Fold the role/content entries the old locket handler wrote into regular turns
+    (a user entry and the assistant entry after it become one turn with channel "locket")
+    Returns (messages, number of legacy entries found)
+    """
+    if not any("role" in msg and "user_message" not in msg for msg in messages):
+        return messages, 0
+    
+    converted = []
+    legacy = 0
+    pending_user = None
+    for msg in messages:
+        if "role" not in msg or "user_message" in msg:
+            if pending_user:
+                converted.append(_legacy_locket_turn(pending_user, None))
+                pending_user = None
+            converted.append(msg)
+            continue
         
-        cursor.close()
-        release_db_connection(conn)
+        legacy += 1
+        if msg.get("role") == "user":
+            if pending_user:
+                converted.append(_legacy_locket_turn(pending_user, None))
+            pending_user = msg
+        else:
+            converted.append(_legacy_locket_turn(pending_user, msg))
+            pending_user = None
+    if pending_user:
+        converted.append(_legacy_locket_turn(pending_user, None))
+    return converted, legacy
+
+def convert_legacy_locket_files() -> int:
+    """
+    Move legacy locket entries out of the personal-assistant JSON files
+    With JSON storage the file is rewritten with the converted turns; with a database the
+    turns are stored there (keeping their timestamps) and removed from the file
+    Returns the number of turns converted
+    """
+    mode_dir = os.path.join(MEMORY_DIR, "personal_assistant")
+    if not os.path.isdir(mode_dir):
+        return 0
+    
+    converted_turns = 0
+    for filename in sorted(os.listdir(mode_dir)):
+        if not filename.endswith(".json"):
+            continue
+        username = filename[:-len(".json")]
+        file_path = os.path.join(mode_dir, filename)
+        try:
+            with user_write_lock(username):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    raw = f.read()
+                if '"role"' not in raw:
+                    continue
+                data = json.loads(raw)
+                messages, legacy = convert_legacy_locket_messages(data.get("messages", []))
+                if not legacy:
+                    continue
+                
+                turns = [msg for msg in messages if msg.get("session_id") == LEGACY_LOCKET_SESSION]
+                if USE_DATABASE or USE_SQLITE:
+                    stored = []
+                    for turn in turns:
+                        timestamp = datetime.fromisoformat(turn["timestamp"]) if turn.get("timestamp") else datetime.now()
+                        if USE_DATABASE:
+                            saved = save_conversation_db(turn["session_id"], username, turn["user_message"],
+                                                         turn["bot_response"], mode="personal-assistant",
+                                                         timestamp=timestamp, channel="locket")
+                        else:
+                            saved = save_conversation_sqlite(turn["session_id"], username, turn["user_message"],
+                                                             turn["bot_response"], mode="personal-assistant",
+                                                             timestamp=timestamp, channel="locket")
+                        if saved:
+                            stored.append(turn)
+                    # Anything that failed to store stays in the file for the next start
+                    stored_ids = {id(turn) for turn in stored}
+                    data["messages"] = [msg for msg in messages if id(msg) not in stored_ids]
+                    turns = stored
+                else:
+                    data["messages"] = messages
+                
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                bump_history_version(username)
+                converted_turns += len(turns)
+        except Exception as e:
+            print(f"[ERROR] Failed to convert legacy locket entries for {username}: {e}")
+    
+    if converted_turns:
+        print(f"[SUCCESS] Converted {converted_turns} legacy locket turns")
+    return converted_turns
+
+def load_conversation_db(username: str, mode: str = "sustainability") -> Optional[Dict]:
+    """Load conversation from PostgreSQL database by username"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            
+            # Get messages for this user and mode (all sessions)
+            execute_prepared(cursor, "load_conversation_messages", (username, mode))
+            messages = cursor.fetchall()
+            
+            # Months past the retention window live in JSONL archives and come first
+            archived = load_archived_conversation(username, mode) if has_archives() else None
+            if not messages and not (archived and archived["messages"]):
+                cursor.close()
+                return None
+            
+            # Detailed memories of this mode (index on username, mode, timestamp)
+            execute_prepared(cursor, "load_mode_memories", (username, mode))
+            memories = cursor.fetchall()
+            
+            cursor.close()
         
         # Format data
         conversation_data = {
             "username": username,
             "mode": mode,
-            "messages": [
+            "messages": (archived["messages"] if archived else []) + [
                 {
                     "timestamp": msg["timestamp"].isoformat() if msg["timestamp"] else None,
                     "user_message": msg["user_message"],
                     "bot_response": msg["bot_response"],
                     "has_media": msg["has_media"],
-                    "media_type": msg["media_type"]
+                    "media_type": msg["media_type"],
+                    "channel": msg["channel"]
                 }
                 for msg in messages
             ],
-            "detailed_memories": [
+            "detailed_memories": (archived["detailed_memories"] if archived else []) + [
                 {
                     "timestamp": mem["timestamp"].isoformat() if mem["timestamp"] else None,
                     "media_type": mem["media_type"],
@@ -294,13 +657,11 @@ def load_conversation_db(username: str, mode: str = "sustainability") -> Optiona
             ]
         }
         
-        print(f"[SUCCESS] Loaded {len(messages)} messages from database")
+        print(f"[SUCCESS] Loaded {len(conversation_data['messages'])} messages from database")
         return conversation_data
         
     except Exception as e:
         print(f"[ERROR] Failed to load conversation from database: {e}")
-        if conn:
-            release_db_connection(conn)
         return None
 
 def load_conversation_json(username: str, mode: str = "sustainability") -> Optional[Dict]:
@@ -314,8 +675,9 @@ def load_conversation_json(username: str, mode: str = "sustainability") -> Optio
         if os.path.exists(file_path):
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                print(f"[SUCCESS] Loaded conversation from JSON: {file_path}")
-                return data
+            data["messages"], _ = convert_legacy_locket_messages(data.get("messages", []))
+            print(f"[SUCCESS] Loaded conversation from JSON: {file_path}")
+            return data
         
         # Try old location (session-based - for backwards compatibility)
         old_file_path = os.path.join(MEMORY_DIR, f"{username}.json")
@@ -332,63 +694,574 @@ def load_conversation_json(username: str, mode: str = "sustainability") -> Optio
         print(f"[ERROR] Failed to load conversation from JSON: {e}")
         return None
 
+def _sqlite_message(row, with_session: bool = False) -> Dict:
+    message = {
+        "timestamp": row["timestamp"],
+        "user_message": row["user_message"],
+        "bot_response": row["bot_response"],
+        "has_media": bool(row["has_media"]),
+        "media_type": row["media_type"],
+        "channel": row["channel"]
+    }
+    if with_session:
+        message["session_id"] = row["session_id"]
+    return message
+
+def _sqlite_memory(row) -> Dict:
+    return {
+        "timestamp": row["timestamp"],
+        "media_type": row["media_type"],
+        "detailed_analysis": row["detailed_analysis"],
+        "extracted_memory": json.loads(row["extracted_memory"]) if row["extracted_memory"] else None
+    }
+
+def load_conversation_sqlite(username: str, mode: str = "sustainability") -> Optional[Dict]:
+    """Load conversation from SQLite by username"""
+    try:
+        conn = sqlite_connection()
+        messages = conn.execute("""
+            SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+            FROM conversations
+            WHERE username = ? AND mode = ?
+            ORDER BY timestamp ASC
+        """, (username, mode)).fetchall()
+        
+        if not messages:
+            return None
+        
+        memories = conn.execute("""
+            SELECT media_type, timestamp, detailed_analysis, extracted_memory
+            FROM detailed_memories
+            WHERE username = ? AND mode = ?
+            ORDER BY timestamp ASC
+        """, (username, mode)).fetchall()
+        
+        print(f"[SUCCESS] Loaded {len(messages)} messages from SQLite")
+        return {
+            "username": username,
+            "mode": mode,
+            "messages": [_sqlite_message(row) for row in messages],
+            "detailed_memories": [_sqlite_memory(row) for row in memories]
+        }
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to load conversation from SQLite: {e}")
+        return None
+
 def load_conversation(username: str, mode: str = "sustainability") -> Optional[Dict]:
     """
     Load conversation by username - automatically uses database or JSON based on configuration
     """
     if USE_DATABASE:
         return load_conversation_db(username, mode)
+    elif USE_SQLITE:
+        return load_conversation_sqlite(username, mode)
     else:
         return load_conversation_json(username, mode)
 
-def get_conversation_context(username: str, mode: str = "sustainability", limit: int = 20) -> str:
-    """Get recent conversation history for better responses by username"""
-    conversation = load_conversation(username, mode)
-    all_messages = []
-    
-    if conversation and conversation.get("messages"):
-        all_messages.extend(conversation["messages"])
-        print(f"[SUCCESS] Loaded {len(conversation['messages'])} messages from {mode} mode")
+def _page_bounds(messages: List[Dict], older: Optional[Dict], after: Optional[str]):
+    """Time span (lower, upper] of the detailed memories that belong to a page
+
+    A memory is stamped while its turn is handled, just before the turn itself is saved,
+    so it belongs to the first turn at or after its timestamp: the span runs from the turn
+    just older than the page (exclusive) to the page's newest turn (inclusive)
+    """
+    lower = after if after else (older["timestamp"] if older else None)
+    upper = messages[0]["timestamp"] if messages else None
+    return lower, upper
+
+def load_conversation_page_db(username: str, mode: str = "sustainability", limit: int = 50,
+                              before: Optional[str] = None, after: Optional[str] = None) -> Dict:
+    """Load one newest-first page of conversation history from PostgreSQL"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            
+            if after:
+                # Oldest-first from the cursor, flipped below so the page is still newest-first
+                execute_prepared(cursor, "history_page_after", (username, mode, after, limit + 1))
+            elif before:
+                execute_prepared(cursor, "history_page_before", (username, mode, before, limit + 1))
+            else:
+                execute_prepared(cursor, "history_page_newest", (username, mode, limit + 1))
+            
+            messages = [
+                {
+                    "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None,
+                    "session_id": row["session_id"],
+                    "user_message": row["user_message"],
+                    "bot_response": row["bot_response"],
+                    "has_media": row["has_media"],
+                    "media_type": row["media_type"],
+                    "channel": row["channel"]
+                }
+                for row in cursor.fetchall()
+            ]
+            
+            # Months past the retention window live in JSONL archives - read them only when
+            # the page reaches past what is still in the database
+            archived = []
+            if has_archives():
+                if after:
+                    archived = load_archived_messages(username, mode, limit + 1, after=after)
+                    messages = (archived + messages)[:limit + 1]
+                elif len(messages) <= limit:
+                    cursor_ts = messages[-1]["timestamp"] if messages else before
+                    archived = load_archived_messages(username, mode, limit + 1 - len(messages), before=cursor_ts)
+                    messages += archived
+            
+            has_more = len(messages) > limit
+            extra = messages[limit] if has_more else None
+            messages = messages[:limit]
+            if after:
+                messages.reverse()
+            
+            memories = []
+            session_ids = list({msg["session_id"] for msg in messages if msg["has_media"]})
+            if session_ids:
+                lower, upper = _page_bounds(messages, None if after else extra, after)
+                execute_prepared(cursor, "history_page_memories", (username, lower, upper, session_ids))
+                memories = [
+                    {
+                        "timestamp": mem["timestamp"].isoformat() if mem["timestamp"] else None,
+                        "media_type": mem["media_type"],
+                        "detailed_analysis": mem["detailed_analysis"],
+                        "extracted_memory": mem["extracted_memory"]
+                    }
+                    for mem in cursor.fetchall()
+                ]
+                if archived:
+                    memories += load_archived_memories(username, lower, upper, session_ids)
+                    memories.sort(key=lambda mem: mem["timestamp"] or "", reverse=True)
+            
+            cursor.close()
+        
+        return {
+            "username": username,
+            "mode": mode,
+            "messages": messages,
+            "detailed_memories": memories,
+            "has_more": has_more,
+            "next_cursor": messages[-1]["timestamp"] if has_more and not after and messages else None,
+            "prev_cursor": messages[0]["timestamp"] if messages else None
+        }
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to load conversation page from database: {e}")
+        return {"username": username, "mode": mode, "messages": [], "detailed_memories": [],
+                "has_more": False, "next_cursor": None, "prev_cursor": None}
+
+def load_conversation_page_json(username: str, mode: str = "sustainability", limit: int = 50,
+                                before: Optional[str] = None, after: Optional[str] = None) -> Dict:
+    """Load one newest-first page of conversation history from the user's JSON file"""
+    conversation = load_conversation_json(username, mode) or {}
+    all_messages = conversation.get("messages", [])
     
-    # Load cross-mode context for personal assistant
-    if mode == "personal-assistant":
-        sustainability_conversation = load_conversation(username, "sustainability")
-        if sustainability_conversation and sustainability_conversation.get("messages"):
-            all_messages.extend(sustainability_conversation["messages"])
-            print(f"[SUCCESS] Loaded {len(sustainability_conversation['messages'])} messages for cross-mode context")
+    # Messages are appended in time order, so cursor positions can be found by bisection
+    timestamps = [msg.get("timestamp") or "" for msg in all_messages]
+    if after:
+        start = bisect.bisect_right(timestamps, after)
+        selected = all_messages[start:start + limit + 1]
+        has_more = len(selected) > limit
+        extra = selected[limit] if has_more else None
+        messages = list(reversed(selected[:limit]))
+    else:
+        end = bisect.bisect_left(timestamps, before) if before else len(all_messages)
+        start = max(0, end - limit)
+        has_more = start > 0
+        extra = all_messages[start - 1] if has_more else None
+        messages = list(reversed(all_messages[start:end]))
     
-    if not all_messages:
-        print("[INFO] No conversation history found")
-        return ""
+    lower, upper = _page_bounds(messages, None if after else extra, after)
+    memories = [
+        memory for memory in reversed(conversation.get("detailed_memories", []) or [])
+        if messages
+        and (lower is None or (memory.get("timestamp") or "") > lower)
+        and (upper is None or (memory.get("timestamp") or "") <= upper)
+    ]
     
-    # Sort by timestamp
+    return {
+        "username": username,
+        "mode": mode,
+        "messages": messages,
+        "detailed_memories": memories,
+        "has_more": has_more,
+        "next_cursor": messages[-1].get("timestamp") if has_more and not after and messages else None,
+        "prev_cursor": messages[0].get("timestamp") if messages else None
+    }
+
+def load_conversation_page_sqlite(username: str, mode: str = "sustainability", limit: int = 50,
+                                  before: Optional[str] = None, after: Optional[str] = None) -> Dict:
+    """Load one newest-first page of conversation history from SQLite (index tail read)"""
     try:
-        all_messages.sort(key=lambda x: x.get('timestamp', ''))
-    except Exception:
-        pass
-    
-    # Get recent messages
-    recent_messages = all_messages[-limit:]
-    print(f"[SUCCESS] Using {len(recent_messages)} recent messages for context")
+        conn = sqlite_connection()
+        columns = "user_message, bot_response, has_media, media_type, timestamp, session_id, channel"
+        
+        if after:
+            # Oldest-first from the cursor, flipped below so the page is still newest-first
+            rows = conn.execute(f"""
+                SELECT {columns} FROM conversations
+                WHERE username = ? AND mode = ? AND timestamp > ?
+                ORDER BY timestamp ASC LIMIT ?
+            """, (username, mode, after, limit + 1)).fetchall()
+        elif before:
+            rows = conn.execute(f"""
+                SELECT {columns} FROM conversations
+                WHERE username = ? AND mode = ? AND timestamp < ?
+                ORDER BY timestamp DESC LIMIT ?
+            """, (username, mode, before, limit + 1)).fetchall()
+        else:
+            rows = conn.execute(f"""
+                SELECT {columns} FROM conversations
+                WHERE username = ? AND mode = ?
+                ORDER BY timestamp DESC LIMIT ?
+            """, (username, mode, limit + 1)).fetchall()
+        
+        has_more = len(rows) > limit
+        extra = {"timestamp": rows[limit]["timestamp"]} if has_more else None
+        messages = [_sqlite_message(row, with_session=True) for row in rows[:limit]]
+        if after:
+            messages.reverse()
+        
+        memories = []
+        session_ids = list({msg["session_id"] for msg in messages if msg["has_media"]})
+        if session_ids:
+            lower, upper = _page_bounds(messages, None if after else extra, after)
+            memories = [
+                _sqlite_memory(row) for row in conn.execute(f"""
+                    SELECT media_type, timestamp, detailed_analysis, extracted_memory
+                    FROM detailed_memories
+                    WHERE username = ?
+                      AND (? IS NULL OR timestamp > ?)
+                      AND (? IS NULL OR timestamp <= ?)
+                      AND session_id IN ({", ".join("?" * len(session_ids))})
+                    ORDER BY timestamp DESC
+                """, (username, lower, lower, upper, upper, *session_ids)).fetchall()
+            ]
+        
+        return {
+            "username": username,
+            "mode": mode,
+            "messages": messages,
+            "detailed_memories": memories,
+            "has_more": has_more,
+            "next_cursor": messages[-1]["timestamp"] if has_more and not after and messages else None,
+            "prev_cursor": messages[0]["timestamp"] if messages else None
+        }
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to load conversation page from SQLite: {e}")
+        return {"username": username, "mode": mode, "messages": [], "detailed_memories": [],
+                "has_more": False, "next_cursor": None, "prev_cursor": None}
+
+def load_conversation_page(username: str, mode: str = "sustainability", limit: int = 50,
+                           before: Optional[str] = None, after: Optional[str] = None) -> Dict:
+    """
+    Load one page of history, newest first - automatically uses database or JSON
+    before: return messages older than this timestamp cursor (next_cursor of the previous page)
+    after: return messages newer than this timestamp cursor
+    """
+    if USE_DATABASE:
+        return load_conversation_page_db(username, mode, limit, before, after)
+    elif USE_SQLITE:
+        return load_conversation_page_sqlite(username, mode, limit, before, after)
+    else:
+        return load_conversation_page_json(username, mode, limit, before, after)
+
+def load_conversation_range_db(username: str, mode: str, after: Optional[str], limit: int) -> List[Dict]:
+    """Up to limit turns newer than after (oldest first) from PostgreSQL"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            execute_prepared(cursor, "history_range", (username, mode, after, limit))
+            rows = cursor.fetchall()
+            cursor.close()
+        return [
+            {
+                "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None,
+                "user_message": row["user_message"],
+                "bot_response": row["bot_response"],
+                "has_media": row["has_media"],
+                "media_type": row["media_type"],
+                "channel": row["channel"]
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        print(f"[ERROR] Failed to load conversation range from database: {e}")
+        return []
+
+def _json_turns_after(messages: List[Dict], after: Optional[str]) -> List[Dict]:
+    """Turns of a JSON history (stored in time order) newer than after"""
+    if not after:
+        return messages
+    timestamps = [msg.get("timestamp") or "" for msg in messages]
+    return messages[bisect.bisect_right(timestamps, after):]
+
+def load_conversation_range_json(username: str, mode: str, after: Optional[str], limit: int) -> List[Dict]:
+    """Up to limit turns newer than after (oldest first) from the user's JSON file"""
+    conversation = load_conversation_json(username, mode) or {}
+    return _json_turns_after(conversation.get("messages", []), after)[:limit]
+
+def load_conversation_range_sqlite(username: str, mode: str, after: Optional[str], limit: int) -> List[Dict]:
+    """Up to limit turns newer than after (oldest first) from SQLite"""
+    try:
+        rows = sqlite_connection().execute("""
+            SELECT user_message, bot_response, has_media, media_type, timestamp, session_id, channel
+            FROM conversations
+            WHERE username = ? AND mode = ? AND timestamp > ?
+            ORDER BY timestamp ASC
+            LIMIT ?
+        """, (username, mode, after or "", limit)).fetchall()
+        return [_sqlite_message(row) for row in rows]
+    except Exception as e:
+        print(f"[ERROR] Failed to load conversation range from SQLite: {e}")
+        return []
+
+def load_conversation_range(username: str, mode: str, after: Optional[str], limit: int) -> List[Dict]:
+    """Up to limit turns of a user's history newer than the timestamp after (None: from the
+    start), oldest first. A timestamp cursor stays valid when older months are archived"""
+    if USE_DATABASE:
+        return load_conversation_range_db(username, mode, after, limit)
+    elif USE_SQLITE:
+        return load_conversation_range_sqlite(username, mode, after, limit)
+    else:
+        return load_conversation_range_json(username, mode, after, limit)
+
+def count_conversation_turns_db(username: str, mode: str, after: Optional[str] = None) -> int:
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            execute_prepared(cursor, "count_conversation_turns", (username, mode, after))
+            count = cursor.fetchone()[0]
+            cursor.close()
+        return count
+    except Exception as e:
+        print(f"[ERROR] Failed to count conversation turns in database: {e}")
+        return 0
+
+def count_conversation_turns_json(username: str, mode: str, after: Optional[str] = None) -> int:
+    conversation = load_conversation_json(username, mode) or {}
+    return len(_json_turns_after(conversation.get("messages", []), after))
+
+def count_conversation_turns_sqlite(username: str, mode: str, after: Optional[str] = None) -> int:
+    try:
+        return sqlite_connection().execute(
+            "SELECT COUNT(*) FROM conversations WHERE username = ? AND mode = ? AND timestamp > ?",
+            (username, mode, after or "")
+        ).fetchone()[0]
+    except Exception as e:
+        print(f"[ERROR] Failed to count conversation turns in SQLite: {e}")
+        return 0
+
+def count_conversation_turns(username: str, mode: str, after: Optional[str] = None) -> int:
+    """Number of stored turns of a user in one mode, optionally only those newer than after
+    (index-only count with a database)"""
+    if USE_DATABASE:
+        return count_conversation_turns_db(username, mode, after)
+    elif USE_SQLITE:
+        return count_conversation_turns_sqlite(username, mode, after)
+    else:
+        return count_conversation_turns_json(username, mode, after)
+
+def load_summary_db(username: str, mode: str = "sustainability") -> Optional[Dict]:
+    """Load the rolling conversation summary from PostgreSQL"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            execute_prepared(cursor, "load_summary", (username, mode))
+            row = cursor.fetchone()
+            cursor.close()
+        
+        if not row:
+            return None
+        
+        return {
+            "summary": row["summary"] or "",
+            "summarized_count": row["summarized_count"] or 0,
+            "summarized_until": row["summarized_until"].isoformat() if row["summarized_until"] else None,
+            "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None
+        }
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to load summary from database: {e}")
+        return None
+
+def load_summary_json(username: str, mode: str = "sustainability") -> Optional[Dict]:
+    """Load the rolling conversation summary from JSON file"""
+    try:
+        file_path = os.path.join(MEMORY_DIR, "summaries", f"{username}.json")
+        if not os.path.exists(file_path):
+            return None
+        
+        with open(file_path, 'r', encoding='utf-8') as f:
+            summaries = json.load(f)
+        
+        summary = summaries.get(mode)
+        if summary and not summary.get("summarized_until") and summary.get("summarized_count"):
+            # Written before the timestamp cursor: the last folded turn is the count-th one
+            count = summary["summarized_count"]
+            messages = (load_conversation_json(username, mode) or {}).get("messages", [])
+            summary["summarized_until"] = messages[count - 1].get("timestamp") if count <= len(messages) else None
+        return summary
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to load summary from JSON: {e}")
+        return None
+
+def load_summary_sqlite(username: str, mode: str = "sustainability") -> Optional[Dict]:
+    """Load the rolling conversation summary from SQLite"""
+    try:
+        row = sqlite_connection().execute("""
+            SELECT summary, summarized_count, summarized_until, updated_at
+            FROM conversation_summaries
+            WHERE username = ? AND mode = ?
+        """, (username, mode)).fetchone()
+        
+        if not row:
+            return None
+        
+        return {
+            "summary": row["summary"] or "",
+            "summarized_count": row["summarized_count"] or 0,
+            "summarized_until": row["summarized_until"],
+            "updated_at": row["updated_at"]
+        }
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to load summary from SQLite: {e}")
+        return None
+
+def load_summary(username: str, mode: str = "sustainability") -> Optional[Dict]:
+    """
+    Load rolling summary by username - automatically uses database or JSON based on configuration
+    """
+    if USE_DATABASE:
+        return load_summary_db(username, mode)
+    elif USE_SQLITE:
+        return load_summary_sqlite(username, mode)
+    else:
+        return load_summary_json(username, mode)
+
+def save_summary_db(username: str, mode: str, summary: str, summarized_count: int,
+                    summarized_until: Optional[str] = None) -> bool:
+    """Save the rolling conversation summary to PostgreSQL"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO conversation_summaries
+                (username, mode, summary, summarized_count, summarized_until, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (username, mode) DO UPDATE
+                SET summary = EXCLUDED.summary,
+                    summarized_count = EXCLUDED.summarized_count,
+                    summarized_until = EXCLUDED.summarized_until,
+                    updated_at = EXCLUDED.updated_at
+            """, (username, mode, summary, summarized_count, summarized_until, datetime.now()))
+            
+            conn.commit()
+            cursor.close()
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to save summary to database: {e}")
+        return False
+
+def save_summary_json(username: str, mode: str, summary: str, summarized_count: int,
+                      summarized_until: Optional[str] = None) -> bool:
+    """Save the rolling conversation summary to JSON file"""
+    try:
+        summaries_dir = os.path.join(MEMORY_DIR, "summaries")
+        if not os.path.exists(summaries_dir):
+            os.makedirs(summaries_dir)
+        
+        file_path = os.path.join(summaries_dir, f"{username}.json")
+        summaries = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                summaries = json.load(f)
+        
+        summaries[mode] = {
+            "summary": summary,
+            "summarized_count": summarized_count,
+            "summarized_until": summarized_until,
+            "updated_at": datetime.now().isoformat()
+        }
+        
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, indent=2, ensure_ascii=False)
+        
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to save summary to JSON: {e}")
+        return False
+
+def save_summary_sqlite(username: str, mode: str, summary: str, summarized_count: int,
+                        summarized_until: Optional[str] = None) -> bool:
+    """Save the rolling conversation summary to SQLite"""
+    try:
+        with sqlite_transaction() as conn:
+            conn.execute("""
+                INSERT INTO conversation_summaries
+                (username, mode, summary, summarized_count, summarized_until, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (username, mode) DO UPDATE
+                SET summary = excluded.summary,
+                    summarized_count = excluded.summarized_count,
+                    summarized_until = excluded.summarized_until,
+                    updated_at = excluded.updated_at
+            """, (username, mode, summary, summarized_count, summarized_until, datetime.now().isoformat()))
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to save summary to SQLite: {e}")
+        return False
+
+def save_summary(username: str, mode: str, summary: str, summarized_count: int,
+                 summarized_until: Optional[str] = None) -> bool:
+    """
+    Save rolling summary - automatically uses database or JSON based on configuration
+    summarized_until is the timestamp of the newest turn folded into the summary
+    """
+    with user_write_lock(username):
+        if USE_DATABASE:
+            return save_summary_db(username, mode, summary, summarized_count, summarized_until)
+        elif USE_SQLITE:
+            return save_summary_sqlite(username, mode, summary, summarized_count, summarized_until)
+        else:
+            return save_summary_json(username, mode, summary, summarized_count, summarized_until)
+
+def get_relevant_memories_context(username: str, query: str, modes: List[str], exclude_timestamps=None) -> str:
+    """
+    Find older turns and media memories related to the query (keyword + semantic search)
+    and format them as a prompt section - empty string when nothing relevant is found
+    """
+    from memory_index import search_memories
+    from embedding_store import search_similar
     
-    # Build context string
-    context = "=== COMPLETE CONVERSATION HISTORY ===\n"
-    context += "Here's our complete conversation history across all modes so you can remember important details:\n\n"
+    relevant_memories = search_memories(username, query, modes, exclude_timestamps=exclude_timestamps)
+    seen = {memory["doc_id"] for memory in relevant_memories}
+    for memory in search_similar(username, query, modes, exclude_timestamps=exclude_timestamps):
+        if memory["doc_id"] not in seen:
+            seen.add(memory["doc_id"])
+            relevant_memories.append(memory)
     
-    for msg in recent_messages:
-        media_note = ""
-        if msg.get("has_media"):
-            m_type = msg.get("media_type", "media")
-            media_note = f" (with {m_type})"
-        context += f"User: {msg['user_message']}{media_note}\n"
-        context += f"You responded: {msg['bot_response']}\n\n"
+    if not relevant_memories:
+        return ""
     
-    context += "=== END CONVERSATION HISTORY ===\n"
-    context += "CRITICAL: You MUST reference specific details from this conversation history. Never say you don't have stored observations if there are messages above.\n"
+    print(f"[SUCCESS] Retrieved {len(relevant_memories)} relevant older memories")
     
+    context = "=== RELEVANT OLDER MEMORIES ===\n"
+    context += "Older conversation turns and media observations related to the current message:\n\n"
+    for memory in relevant_memories:
+        label = "Media observation" if memory["kind"] == "memory" else "Conversation"
+        context += f"[{label} from {memory.get('timestamp') or 'unknown time'}]\n{memory['text']}\n\n"
+    context += "=== END RELEVANT OLDER MEMORIES ===\n\n"
     return context
 
-
 # ============================================
 # User Authentication Functions
 # ============================================
@@ -402,21 +1275,20 @@ def hash_password(password: str) -> str:
 def register_user_db(username: str, password: str) -> Dict[str, Any]:
     """Register a new user in PostgreSQL database"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        password_hash = hash_password(password)
-        
-        cursor.execute("""
-            INSERT INTO users (username, password_hash, created_at)
-            VALUES (%s, %s, %s)
-            RETURNING id, username, created_at
-        """, (username, password_hash, datetime.now()))
-        
-        result = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            password_hash = hash_password(password)
+            
+            cursor.execute("""
+                INSERT INTO users (username, password_hash, created_at)
+                VALUES (%s, %s, %s)
+                RETURNING id, username, created_at
+            """, (username, password_hash, datetime.now()))
+            
+            result = cursor.fetchone()
+            conn.commit()
+            cursor.close()
         
         return {
             "success": True,
@@ -425,8 +1297,6 @@ def register_user_db(username: str, password: str) -> Dict[str, Any]:
             "created_at": result[2].isoformat()
         }
     except psycopg2.IntegrityError:
-        conn.rollback()
-        db_pool.putconn(conn)
         return {"success": False, "error": "Username already exists"}
     except Exception as e:
         print(f"[ERROR] Error registering user: {e}")
@@ -434,42 +1304,47 @@ def register_user_db(username: str, password: str) -> Dict[str, Any]:
 
 
 def register_user_json(username: str, password: str) -> Dict[str, Any]:
-    """Register a new user in JSON file"""
-    users_file = os.path.join(MEMORY_DIR, "users.json")
-    
-    # Load existing users
-    if os.path.exists(users_file):
-        with open(users_file, 'r') as f:
-            users = json.load(f)
-    else:
-        users = {}
-    
-    # Check if username exists
-    if username in users:
+    """Register a new user in the in-memory user directory (persisted atomically to users.json)"""
+    created_at = datetime.now().isoformat()
+    if not user_directory.add(username, {"password_hash": hash_password(password), "created_at": created_at}):
         return {"success": False, "error": "Username already exists"}
     
-    # Add new user
-    password_hash = hash_password(password)
-    users[username] = {
-        "password_hash": password_hash,
-        "created_at": datetime.now().isoformat()
-    }
-    
-    # Save to file
-    with open(users_file, 'w') as f:
-        json.dump(users, f, indent=2)
-    
     return {
         "success": True,
         "username": username,
-        "created_at": users[username]["created_at"]
+        "created_at": created_at
     }
 
 
+def register_user_sqlite(username: str, password: str) -> Dict[str, Any]:
+    """Register a new user in SQLite"""
+    try:
+        created_at = datetime.now().isoformat()
+        with sqlite_transaction() as conn:
+            cursor = conn.execute("""
+                INSERT INTO users (username, password_hash, created_at)
+                VALUES (?, ?, ?)
+            """, (username, hash_password(password), created_at))
+        
+        return {
+            "success": True,
+            "user_id": cursor.lastrowid,
+            "username": username,
+            "created_at": created_at
+        }
+    except sqlite3.IntegrityError:
+        return {"success": False, "error": "Username already exists"}
+    except Exception as e:
+        print(f"[ERROR] Error registering user: {e}")
+        return {"success": False, "error": str(e)}
+
+
 def register_user(username: str, password: str) -> Dict[str, Any]:
     """Register a new user (auto-detects DB or JSON)"""
     if USE_DATABASE:
         return register_user_db(username, password)
+    elif USE_SQLITE:
+        return register_user_sqlite(username, password)
     else:
         return register_user_json(username, password)
 
@@ -477,29 +1352,21 @@ def register_user(username: str, password: str) -> Dict[str, Any]:
 def verify_login_db(username: str, password: str) -> Dict[str, Any]:
     """Verify user login in PostgreSQL database"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        password_hash = hash_password(password)
-        
-        cursor.execute("""
-            SELECT id, username, created_at
-            FROM users
-            WHERE username = %s AND password_hash = %s
-        """, (username, password_hash))
-        
-        result = cursor.fetchone()
-        
-        if result:
-            # Update last login
-            cursor.execute("""
-                UPDATE users SET last_login = %s WHERE username = %s
-            """, (datetime.now(), username))
-            conn.commit()
+        with db_connection() as conn:
+            cursor = conn.cursor()
             
-            cursor.close()
-            db_pool.putconn(conn)
+            password_hash = hash_password(password)
+            
+            execute_prepared(cursor, "verify_login", (username, password_hash))
+            result = cursor.fetchone()
             
+            if result:
+                # Update last login
+                execute_prepared(cursor, "update_last_login", (datetime.now(), username))
+                conn.commit()
+            cursor.close()
+        
+        if result:
             return {
                 "success": True,
                 "user_id": result[0],
@@ -507,8 +1374,6 @@ def verify_login_db(username: str, password: str) -> Dict[str, Any]:
                 "created_at": result[2].isoformat()
             }
         else:
-            cursor.close()
-            db_pool.putconn(conn)
             return {"success": False, "error": "Invalid credentials"}
             
     except Exception as e:
@@ -517,39 +1382,59 @@ def verify_login_db(username: str, password: str) -> Dict[str, Any]:
 
 
 def verify_login_json(username: str, password: str) -> Dict[str, Any]:
-    """Verify user login in JSON file"""
-    users_file = os.path.join(MEMORY_DIR, "users.json")
-    
-    if not os.path.exists(users_file):
-        return {"success": False, "error": "No users registered"}
-    
-    with open(users_file, 'r') as f:
-        users = json.load(f)
-    
-    if username not in users:
+    """Verify user login against the in-memory user directory"""
+    user = user_directory.get(username)
+    if user is None:
+        if user_directory.count() == 0:
+            return {"success": False, "error": "No users registered"}
         return {"success": False, "error": "Username not found"}
     
-    password_hash = hash_password(password)
-    
-    if users[username]["password_hash"] == password_hash:
-        # Update last login
-        users[username]["last_login"] = datetime.now().isoformat()
-        with open(users_file, 'w') as f:
-            json.dump(users, f, indent=2)
-        
+    if hmac.compare_digest(user["password_hash"], hash_password(password)):
+        # last_login is written by the directory's periodic flush, not per login
+        user_directory.record_login(username, datetime.now().isoformat())
         return {
             "success": True,
             "username": username,
-            "created_at": users[username]["created_at"]
+            "created_at": user["created_at"]
         }
     else:
         return {"success": False, "error": "Invalid password"}
 
 
+def verify_login_sqlite(username: str, password: str) -> Dict[str, Any]:
+    """Verify user login in SQLite"""
+    try:
+        with sqlite_transaction() as conn:
+            result = conn.execute("""
+                SELECT id, username, created_at FROM users WHERE username = ? AND password_hash = ?
+            """, (username, hash_password(password))).fetchone()
+            
+            if result:
+                # Update last login
+                conn.execute("UPDATE users SET last_login = ? WHERE username = ?",
+                             (datetime.now().isoformat(), username))
+        
+        if result:
+            return {
+                "success": True,
+                "user_id": result["id"],
+                "username": result["username"],
+                "created_at": result["created_at"]
+            }
+        else:
+            return {"success": False, "error": "Invalid credentials"}
+            
+    except Exception as e:
+        print(f"[ERROR] Error verifying login: {e}")
+        return {"success": False, "error": str(e)}
+
+
 def verify_login(username: str, password: str) -> Dict[str, Any]:
     """Verify user login (auto-detects DB or JSON)"""
     if USE_DATABASE:
         return verify_login_db(username, password)
+    elif USE_SQLITE:
+        return verify_login_sqlite(username, password)
     else:
         return verify_login_json(username, password)
 
@@ -557,41 +1442,39 @@ def verify_login(username: str, password: str) -> Dict[str, Any]:
 def check_username_exists_db(username: str) -> bool:
     """Check if username exists in PostgreSQL database"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s", (username,))
-        count = cursor.fetchone()[0]
-        
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            execute_prepared(cursor, "check_username", (username,))
+            exists = cursor.fetchone() is not None
+            cursor.close()
         
-        return count > 0
+        return exists
     except Exception as e:
         print(f"[ERROR] Error checking username: {e}")
         return False
 
 
 def check_username_exists_json(username: str) -> bool:
-    """Check if username exists in JSON file"""
-    users_file = os.path.join(MEMORY_DIR, "users.json")
-    
-    if not os.path.exists(users_file):
+    """Check if username exists in the in-memory user directory"""
+    return user_directory.exists(username)
+
+
+def check_username_exists_sqlite(username: str) -> bool:
+    """Check if username exists in SQLite"""
+    try:
+        return sqlite_connection().execute("SELECT 1 FROM users WHERE username = ?",
+                                           (username,)).fetchone() is not None
+    except Exception as e:
+        print(f"[ERROR] Error checking username: {e}")
         return False
-    
-    with open(users_file, 'r') as f:
-        users = json.load(f)
-    
-    return username in users
 
 
 def check_username_exists(username: str) -> bool:
     """Check if username exists (auto-detects DB or JSON)"""
     if USE_DATABASE:
         return check_username_exists_db(username)
+    elif USE_SQLITE:
+        return check_username_exists_sqlite(username)
     else:
         return check_username_exists_json(username)
 
-
-# Initialize database on module import
-init_database()
@@ -0,0 +1,389 @@
+"""
+Database Migrations Module
+Versioned PostgreSQL schema: each migration runs once, in order, in its own transaction
+and is recorded in schema_migrations. Safe to run on every startup and from several
+workers at once (an advisory lock serializes them).
+
+Run `python db_migrations.py --explain` against DATABASE_URL to print the query plans of
+the hot paths and check that they use the composite indexes.
+"""
+
+import os
+import sys
+from typing import List, Tuple
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent workers migrate one at a time
+MIGRATION_LOCK_KEY = 73021
+
+# (version, description, statements)
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "baseline schema", [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(255) NOT NULL,
+            username VARCHAR(255) NOT NULL,
+            mode VARCHAR(50) NOT NULL,
+            user_message TEXT,
+            bot_response TEXT,
+            has_media BOOLEAN DEFAULT FALSE,
+            media_type VARCHAR(50),
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_session_id ON conversations(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_mode ON conversations(mode)",
+        """
+        CREATE TABLE IF NOT EXISTS detailed_memories (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(255) NOT NULL,
+            media_type VARCHAR(50),
+            timestamp TIMESTAMP,
+            detailed_analysis TEXT,
+            extracted_memory JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_username ON users(username)",
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            username VARCHAR(255) NOT NULL,
+            mode VARCHAR(50) NOT NULL,
+            summary TEXT,
+            summarized_count INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, mode)
+        )
+        """
+    ]),
+    (2, "composite history indexes, detailed_memories.username", [
+        # History loads and pages filter by user and mode and sort by time
+        """
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_mode_ts
+        ON conversations(username, mode, timestamp)
+        """,
+        # Detailed memories are looked up by owner directly instead of via a
+        # DISTINCT session_id subquery over the whole conversations table
+        "ALTER TABLE detailed_memories ADD COLUMN IF NOT EXISTS username VARCHAR(255)",
+        """
+        UPDATE detailed_memories d
+        SET username = c.username
+        FROM (SELECT DISTINCT session_id, username FROM conversations) c
+        WHERE d.session_id = c.session_id AND d.username IS NULL
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_detailed_memories_user_ts
+        ON detailed_memories(username, timestamp)
+        """,
+        # Used when background extraction fills in extracted_memory
+        """
+        CREATE INDEX IF NOT EXISTS idx_detailed_memories_session_ts
+        ON detailed_memories(session_id, timestamp)
+        """,
+        # users.username is UNIQUE, which already creates an index
+        "DROP INDEX IF EXISTS idx_username"
+    ]),
+    (3, "monthly range partitions on conversations and detailed_memories", [
+        # Creates <parent>_pYYYYMM for one month. Rows that already landed in the
+        # default partition for that month are moved over before it is attached.
+        """
+        CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, month_start DATE)
+        RETURNS TEXT AS $$
+        DECLARE
+            partition_name TEXT := parent || '_p' || to_char(month_start, 'YYYYMM');
+            lower_bound TIMESTAMP := date_trunc('month', month_start);
+            upper_bound TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+        BEGIN
+            IF to_regclass(partition_name) IS NOT NULL THEN
+                RETURN partition_name;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition_name, parent);
+            EXECUTE format('WITH moved AS (DELETE FROM %I WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+                           'INSERT INTO %I SELECT * FROM moved',
+                           parent || '_default', lower_bound, upper_bound, partition_name);
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           parent, partition_name, lower_bound, upper_bound);
+            RETURN partition_name;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        # conversations: swap the heap table for a partitioned one, keeping ids and index names
+        "ALTER TABLE conversations RENAME TO conversations_unpartitioned",
+        "ALTER TABLE conversations_unpartitioned RENAME CONSTRAINT conversations_pkey TO conversations_unpartitioned_pkey",
+        "ALTER SEQUENCE conversations_id_seq OWNED BY NONE",
+        "DROP INDEX IF EXISTS idx_session_id",
+        "DROP INDEX IF EXISTS idx_mode",
+        "DROP INDEX IF EXISTS idx_conversations_user_mode_ts",
+        """
+        CREATE TABLE conversations (
+            id INTEGER NOT NULL DEFAULT nextval('conversations_id_seq'),
+            session_id VARCHAR(255) NOT NULL,
+            username VARCHAR(255) NOT NULL,
+            mode VARCHAR(50) NOT NULL,
+            user_message TEXT,
+            bot_response TEXT,
+            has_media BOOLEAN DEFAULT FALSE,
+            media_type VARCHAR(50),
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        "CREATE TABLE conversations_default PARTITION OF conversations DEFAULT",
+        "CREATE INDEX idx_session_id ON conversations(session_id)",
+        "CREATE INDEX idx_mode ON conversations(mode)",
+        "CREATE INDEX idx_conversations_user_mode_ts ON conversations(username, mode, timestamp)",
+        """
+        DO $$
+        DECLARE month_start DATE;
+        BEGIN
+            FOR month_start IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE(
+                        (SELECT MIN(COALESCE(timestamp, created_at)) FROM conversations_unpartitioned),
+                        CURRENT_TIMESTAMP)),
+                    date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months',
+                    INTERVAL '1 month')::date
+            LOOP
+                PERFORM create_monthly_partition('conversations', month_start);
+            END LOOP;
+        END
+        $$
+        """,
+        """
+        INSERT INTO conversations (id, session_id, username, mode, user_message, bot_response,
+                                   has_media, media_type, timestamp, created_at)
+        SELECT id, session_id, username, mode, user_message, bot_response,
+               has_media, media_type, COALESCE(timestamp, created_at, CURRENT_TIMESTAMP), created_at
+        FROM conversations_unpartitioned
+        """,
+        "DROP TABLE conversations_unpartitioned",
+        "ALTER SEQUENCE conversations_id_seq OWNED BY conversations.id",
+        # detailed_memories: same swap
+        "ALTER TABLE detailed_memories RENAME TO detailed_memories_unpartitioned",
+        "ALTER TABLE detailed_memories_unpartitioned RENAME CONSTRAINT detailed_memories_pkey "
+        "TO detailed_memories_unpartitioned_pkey",
+        "ALTER SEQUENCE detailed_memories_id_seq OWNED BY NONE",
+        "DROP INDEX IF EXISTS idx_detailed_memories_user_ts",
+        "DROP INDEX IF EXISTS idx_detailed_memories_session_ts",
+        """
+        CREATE TABLE detailed_memories (
+            id INTEGER NOT NULL DEFAULT nextval('detailed_memories_id_seq'),
+            session_id VARCHAR(255) NOT NULL,
+            media_type VARCHAR(50),
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            detailed_analysis TEXT,
+            extracted_memory JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(255),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        "CREATE TABLE detailed_memories_default PARTITION OF detailed_memories DEFAULT",
+        "CREATE INDEX idx_detailed_memories_user_ts ON detailed_memories(username, timestamp)",
+        "CREATE INDEX idx_detailed_memories_session_ts ON detailed_memories(session_id, timestamp)",
+        """
+        DO $$
+        DECLARE month_start DATE;
+        BEGIN
+            FOR month_start IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE(
+                        (SELECT MIN(COALESCE(timestamp, created_at)) FROM detailed_memories_unpartitioned),
+                        CURRENT_TIMESTAMP)),
+                    date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months',
+                    INTERVAL '1 month')::date
+            LOOP
+                PERFORM create_monthly_partition('detailed_memories', month_start);
+            END LOOP;
+        END
+        $$
+        """,
+        """
+        INSERT INTO detailed_memories (id, session_id, media_type, timestamp, detailed_analysis,
+                                       extracted_memory, created_at, username)
+        SELECT id, session_id, media_type, COALESCE(timestamp, created_at, CURRENT_TIMESTAMP),
+               detailed_analysis, extracted_memory, created_at, username
+        FROM detailed_memories_unpartitioned
+        """,
+        "DROP TABLE detailed_memories_unpartitioned",
+        "ALTER SEQUENCE detailed_memories_id_seq OWNED BY detailed_memories.id"
+    ]),
+    (4, "conversations.channel (chat / locket)", [
+        # Added to the partitioned parent, so every partition (and future ones) gets it
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS channel VARCHAR(20) NOT NULL DEFAULT 'chat'"
+    ]),
+    (5, "esp32_devices (previously created outside the migrations on every start)", [
+        """
+        CREATE TABLE IF NOT EXISTS esp32_devices (
+            id SERIAL PRIMARY KEY,
+            device_id VARCHAR(255) UNIQUE NOT NULL,
+            username VARCHAR(255) NOT NULL,
+            device_name VARCHAR(255),
+            mac_address VARCHAR(50),
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        """,
+        # The UNIQUE constraint already indexes device_id; drop the redundant copy older starts made
+        "DROP INDEX IF EXISTS idx_device_id",
+        "CREATE INDEX IF NOT EXISTS idx_device_username ON esp32_devices(username)"
+    ]),
+    (6, "conversation_summaries.summarized_until (timestamp cursor of the rolling summary)", [
+        # A row count stops matching the history once old months are archived
+        "ALTER TABLE conversation_summaries ADD COLUMN IF NOT EXISTS summarized_until TIMESTAMP",
+        """
+        UPDATE conversation_summaries s
+        SET summarized_until = c.timestamp
+        FROM (SELECT username, mode, timestamp,
+                     ROW_NUMBER() OVER (PARTITION BY username, mode ORDER BY timestamp) AS position
+              FROM conversations) c
+        WHERE c.username = s.username AND c.mode = s.mode AND c.position = s.summarized_count
+          AND s.summarized_until IS NULL
+        """
+    ]),
+    (7, "detailed_memories.mode with an index on (username, mode, timestamp)", [
+        # Memories of one mode were found through a session_id subquery over conversations
+        "ALTER TABLE detailed_memories ADD COLUMN IF NOT EXISTS mode VARCHAR(50)",
+        """
+        UPDATE detailed_memories d
+        SET mode = c.mode
+        FROM (SELECT DISTINCT ON (username, session_id) username, session_id, mode
+              FROM conversations
+              ORDER BY username, session_id, timestamp DESC) c
+        WHERE d.username = c.username AND d.session_id = c.session_id AND d.mode IS NULL
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_detailed_memories_user_mode_ts
+        ON detailed_memories(username, mode, timestamp)
+        """
+    ])
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def apply_migrations(conn) -> int:
+    """Apply every migration newer than the recorded schema version - returns the version"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    for version, description, statements in MIGRATIONS:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+        if cursor.fetchone():
+            conn.commit()
+            continue
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            conn.commit()
+            print(f"[SUCCESS] Applied schema migration {version}: {description}")
+        except Exception:
+            conn.rollback()
+            cursor.close()
+            raise
+
+    cursor.execute("SELECT MAX(version) FROM schema_migrations")
+    current = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    return current
+
+
+# Hot-path queries with representative parameters, and the index each must use. Partitions
+# get their own copy of each index, named <partition>_<columns>_idx, so the check matches that suffix
+EXPLAIN_QUERIES = [
+    ("load conversation", """
+        SELECT user_message, bot_response, has_media, media_type, timestamp, session_id
+        FROM conversations
+        WHERE username = %s AND mode = %s
+        ORDER BY timestamp ASC
+    """, ("explain-user", "personal-assistant"), "username_mode_timestamp_idx"),
+    ("newest history page", """
+        SELECT user_message, bot_response, has_media, media_type, timestamp, session_id
+        FROM conversations
+        WHERE username = %s AND mode = %s
+        ORDER BY timestamp DESC
+        LIMIT %s
+    """, ("explain-user", "personal-assistant", 51), "username_mode_timestamp_idx"),
+    ("older history page", """
+        SELECT user_message, bot_response, has_media, media_type, timestamp, session_id
+        FROM conversations
+        WHERE username = %s AND mode = %s AND timestamp < %s
+        ORDER BY timestamp DESC
+        LIMIT %s
+    """, ("explain-user", "personal-assistant", "2100-01-01", 51), "username_mode_timestamp_idx"),
+    ("mode detailed memories", """
+        SELECT media_type, timestamp, detailed_analysis, extracted_memory
+        FROM detailed_memories
+        WHERE username = %s AND mode = %s
+        ORDER BY timestamp ASC
+    """, ("explain-user", "personal-assistant"), "username_mode_timestamp_idx"),
+    ("history page memories", """
+        SELECT media_type, timestamp, detailed_analysis, extracted_memory
+        FROM detailed_memories
+        WHERE username = %s AND timestamp > %s AND timestamp <= %s AND session_id = ANY(%s)
+        ORDER BY timestamp DESC
+    """, ("explain-user", "2000-01-01", "2100-01-01", ["explain-session"]), "username_timestamp_idx"),
+    ("update extracted memory", """
+        SELECT id FROM detailed_memories WHERE session_id = %s AND timestamp = %s
+    """, ("explain-session", "2100-01-01"), "session_id_timestamp_idx"),
+]
+
+
+def explain_hot_queries(conn) -> List[Tuple[str, bool, str]]:
+    """EXPLAIN each hot query -> [(name, uses expected index, plan text)]
+
+    Sequential scans are disabled for the check so a small or empty table still
+    shows which index the planner would pick once it has grown.
+    """
+    cursor = conn.cursor()
+    results = []
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, query, params, index_name in EXPLAIN_QUERIES:
+            cursor.execute("EXPLAIN " + query, params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            results.append((name, index_name in plan, plan))
+    finally:
+        conn.rollback()
+        cursor.close()
+    return results
+
+
+if __name__ == "__main__":
+    import psycopg2
+
+    connection = psycopg2.connect(os.environ["DATABASE_URL"])
+    print(f"[INFO] Schema version: {apply_migrations(connection)}")
+
+    if "--explain" in sys.argv:
+        all_indexed = True
+        for query_name, indexed, query_plan in explain_hot_queries(connection):
+            all_indexed = all_indexed and indexed
+            print(f"\n[{'OK' if indexed else 'FAIL'}] {query_name}\n{query_plan}")
+        connection.close()
+        sys.exit(0 if all_indexed else 1)
+
+    connection.close()
@@ -0,0 +1,359 @@
+"""
+Database Partitions Module
+Keeps the monthly partitions of conversations / detailed_memories ahead of the clock and
+moves months older than the retention window out of PostgreSQL into gzip JSONL archives
+(one file per user per month) that the history API reads on demand
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import threading
+from datetime import datetime, date
+from typing import Optional, Dict, List
+
+try:
+    from psycopg2.extras import RealDictCursor
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+# Configuration
+MEMORY_DIR = "memory"
+PARTITION_ARCHIVE_DIR = os.environ.get("PARTITION_ARCHIVE_DIR", os.path.join(MEMORY_DIR, "archive"))
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))  # Future months created in advance
+PARTITION_RETENTION_MONTHS = int(os.environ.get("PARTITION_RETENTION_MONTHS", "12"))  # Months kept in the database
+PARTITION_MAINTENANCE_SECONDS = float(os.environ.get("PARTITION_MAINTENANCE_SECONDS", str(6 * 3600)))
+PARTITIONED_TABLES = ("conversations", "detailed_memories")
+
+# Session-level advisory lock so only one worker maintains partitions at a time
+MAINTENANCE_LOCK_KEY = 73022
+
+ARCHIVE_COLUMNS = {
+    "conversations": ["session_id", "username", "mode", "user_message", "bot_response",
+                      "has_media", "media_type", "timestamp", "created_at", "channel"],
+    "detailed_memories": ["session_id", "username", "mode", "media_type", "timestamp",
+                          "detailed_analysis", "extracted_memory", "created_at"],
+}
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _month_key(month: date) -> str:
+    return month.strftime("%Y-%m")
+
+
+def _partition_month(table: str, name: str) -> Optional[date]:
+    match = re.fullmatch(rf"{table}_p(\d{{4}})(\d{{2}})", name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _archive_filename(username: Optional[str]) -> str:
+    return f"{username}.jsonl.gz" if username else "_unknown.jsonl.gz"
+
+
+# ==================== PARTITION MAINTENANCE ====================
+
+def ensure_partitions(conn, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create the partitions for this month and the next months_ahead months (idempotent)"""
+    this_month = date.today().replace(day=1)
+    cursor = conn.cursor()
+    created = []
+    for table in PARTITIONED_TABLES:
+        existing = set(list_partitions(conn, table))
+        for offset in range(months_ahead + 1):
+            month = _add_months(this_month, offset)
+            if month in existing:
+                continue
+            cursor.execute("SELECT create_monthly_partition(%s, %s)", (table, month))
+            created.append(cursor.fetchone()[0])
+    conn.commit()
+    cursor.close()
+    for name in created:
+        print(f"[PARTITION] Created {name}")
+    return created
+
+
+def list_partitions(conn, table: str) -> Dict[date, str]:
+    """Monthly partitions of a table -> {month: partition name}"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+    """, (table,))
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        month = _partition_month(table, name)
+        if month:
+            partitions[month] = name
+    cursor.close()
+    return partitions
+
+
+def archive_partition(conn, table: str, name: str, month: date) -> int:
+    """Export one partition to per-user gzip JSONL files, then detach and drop it
+
+    Writes are blocked on the partition while it is exported, so no row can slip in
+    between the export and the drop. Files are written before the drop commits; a crash
+    in between just means the month is exported again (overwriting) on the next run.
+    """
+    month_dir = os.path.join(PARTITION_ARCHIVE_DIR, table, _month_key(month))
+    os.makedirs(month_dir, exist_ok=True)
+    columns = ARCHIVE_COLUMNS[table]
+
+    cursor = conn.cursor()
+    cursor.execute(f'LOCK TABLE "{name}" IN SHARE MODE')
+    export = conn.cursor(name=f"archive_{name}", cursor_factory=RealDictCursor)
+    export.itersize = 2000
+    export.execute(f'SELECT {", ".join(columns)} FROM "{name}" ORDER BY username, timestamp')
+
+    rows = 0
+    current_user = object()
+    out = None
+    tmp_path = final_path = None
+    try:
+        for row in export:
+            if row["username"] != current_user:
+                if out:
+                    out.close()
+                    os.replace(tmp_path, final_path)
+                current_user = row["username"]
+                final_path = os.path.join(month_dir, _archive_filename(current_user))
+                tmp_path = final_path + ".tmp"
+                out = gzip.open(tmp_path, "wt", encoding="utf-8")
+            out.write(json.dumps({key: _jsonable(value) for key, value in row.items()}, ensure_ascii=False))
+            out.write("\n")
+            rows += 1
+        if out:
+            out.close()
+            os.replace(tmp_path, final_path)
+            out = None
+        export.close()
+
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION "{name}"')
+        cursor.execute(f'DROP TABLE "{name}"')
+        conn.commit()
+    except Exception:
+        if out:
+            out.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    print(f"[PARTITION] Archived {name}: {rows} rows -> {month_dir}")
+    return rows
+
+
+def archive_old_partitions(conn, retention_months: int = PARTITION_RETENTION_MONTHS) -> List[str]:
+    """Archive every monthly partition that ended before the retention window"""
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        for month, name in sorted(list_partitions(conn, table).items()):
+            if month < cutoff:
+                archive_partition(conn, table, name, month)
+                archived.append(name)
+    return archived
+
+
+class PartitionMaintainer:
+    """Background thread that runs partition creation and archiving every few hours"""
+
+    def __init__(self, pool, interval: float = PARTITION_MAINTENANCE_SECONDS):
+        self.pool = pool
+        self.interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Metrics
+        self._runs = 0
+        self._last_run = None
+        self._last_error = None
+        self._created = 0
+        self._archived = 0
+
+        self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> bool:
+        """One maintenance pass - skipped (False) when another worker holds the lock"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_KEY,))
+            if not cursor.fetchone()[0]:
+                conn.commit()
+                cursor.close()
+                return False
+            try:
+                created = ensure_partitions(conn)
+                archived = archive_old_partitions(conn)
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_KEY,))
+                conn.commit()
+                cursor.close()
+        with self._lock:
+            self._created += len(created)
+            self._archived += len(archived)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.run_once()
+                error = None
+            except Exception as e:
+                error = str(e)
+                print(f"[ERROR] Partition maintenance failed: {e}")
+            with self._lock:
+                self._runs += 1
+                self._last_run = datetime.fromtimestamp(started).isoformat()
+                self._last_error = error
+            self._stop.wait(self.interval)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "runs": self._runs,
+                "last_run": self._last_run,
+                "last_error": self._last_error,
+                "partitions_created": self._created,
+                "partitions_archived": self._archived,
+                "months_ahead": PARTITION_MONTHS_AHEAD,
+                "retention_months": PARTITION_RETENTION_MONTHS
+            }
+
+    def close(self):
+        self._stop.set()
+
+
+# ==================== ARCHIVE READS ====================
+
+def _archived_months(table: str) -> List[str]:
+    table_dir = os.path.join(PARTITION_ARCHIVE_DIR, table)
+    if not os.path.isdir(table_dir):
+        return []
+    return sorted(name for name in os.listdir(table_dir) if re.fullmatch(r"\d{4}-\d{2}", name))
+
+
+def _read_archive(table: str, month: str, username: str) -> List[Dict]:
+    path = os.path.join(PARTITION_ARCHIVE_DIR, table, month, _archive_filename(username))
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def has_archives() -> bool:
+    """Whether any month has been archived (lets the history API skip the lookups entirely)"""
+    return bool(_archived_months("conversations"))
+
+
+def load_archived_messages(username: str, mode: str, limit: int,
+                           before: Optional[str] = None, after: Optional[str] = None) -> List[Dict]:
+    """Archived turns of a user in history-API shape
+
+    Newest first and older than `before`, or oldest first and newer than `after`.
+    Months entirely outside the cursor are skipped without being opened.
+    """
+    months = _archived_months("conversations")
+    if after:
+        months = [month for month in months if month >= after[:7]]
+    else:
+        months = [month for month in reversed(months) if not before or month <= before[:7]]
+
+    messages = []
+    for month in months:
+        rows = [row for row in _read_archive("conversations", month, username) if row.get("mode") == mode]
+        if after:
+            rows = [row for row in rows if (row.get("timestamp") or "") > after]
+        else:
+            rows = [row for row in reversed(rows) if not before or (row.get("timestamp") or "") < before]
+        for row in rows:
+            messages.append({
+                "timestamp": row.get("timestamp"),
+                "session_id": row.get("session_id"),
+                "user_message": row.get("user_message"),
+                "bot_response": row.get("bot_response"),
+                "has_media": row.get("has_media"),
+                "media_type": row.get("media_type"),
+                "channel": row.get("channel") or "chat"
+            })
+            if len(messages) >= limit:
+                return messages
+    return messages
+
+
+def load_archived_memories(username: str, lower: Optional[str], upper: Optional[str],
+                           session_ids: List[str]) -> List[Dict]:
+    """Archived detailed memories of a user in (lower, upper] for the given sessions, newest first"""
+    wanted = set(session_ids)
+    memories = []
+    for month in reversed(_archived_months("detailed_memories")):
+        if (upper and month > upper[:7]) or (lower and month < lower[:7]):
+            continue
+        for row in reversed(_read_archive("detailed_memories", month, username)):
+            timestamp = row.get("timestamp") or ""
+            if row.get("session_id") not in wanted:
+                continue
+            if (lower and timestamp <= lower) or (upper and timestamp > upper):
+                continue
+            memories.append({
+                "timestamp": row.get("timestamp"),
+                "media_type": row.get("media_type"),
+                "detailed_analysis": row.get("detailed_analysis"),
+                "extracted_memory": row.get("extracted_memory")
+            })
+    return memories
+
+
+def load_archived_conversation(username: str, mode: str) -> Dict:
+    """Every archived turn and detailed memory of a user in one mode, oldest first, in
+    full-history shape - prepended to what is still in the database by load_conversation
+
+    Memories archived before detailed_memories had a mode column are matched to the
+    mode through the session of an archived turn.
+    """
+    messages, sessions = [], set()
+    for month in _archived_months("conversations"):
+        for row in _read_archive("conversations", month, username):
+            if row.get("mode") != mode:
+                continue
+            sessions.add(row.get("session_id"))
+            messages.append({
+                "timestamp": row.get("timestamp"),
+                "user_message": row.get("user_message"),
+                "bot_response": row.get("bot_response"),
+                "has_media": row.get("has_media"),
+                "media_type": row.get("media_type"),
+                "channel": row.get("channel") or "chat"
+            })
+
+    memories = []
+    for month in _archived_months("detailed_memories"):
+        for row in _read_archive("detailed_memories", month, username):
+            if row.get("mode") != mode and (row.get("mode") or row.get("session_id") not in sessions):
+                continue
+            memories.append({
+                "timestamp": row.get("timestamp"),
+                "media_type": row.get("media_type"),
+                "detailed_analysis": row.get("detailed_analysis"),
+                "extracted_memory": row.get("extracted_memory")
+            })
+    return {"messages": messages, "detailed_memories": memories}
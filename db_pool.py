@@ -0,0 +1,265 @@
+"""
+Database Pool Module
+Thread-safe PostgreSQL connection pool with health checks, guaranteed release
+through a context manager, per-connection prepared statements and wait-time metrics
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+# Configuration
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))  # Seconds to wait for a free connection
+DB_HEALTH_CHECK_SECONDS = float(os.environ.get("DB_HEALTH_CHECK_SECONDS", "30"))  # Idle time before re-checking
+DB_POOL_WARM = int(os.environ.get("DB_POOL_WARM", "4"))  # Connections opened and prepared at startup
+
+# Hot queries prepared once per connection: name -> (parameter types, SQL with $n placeholders)
+PREPARED_STATEMENTS: Dict[str, Tuple[List[str], str]] = {}
+
+
+def register_prepared_statement(name: str, param_types: List[str], sql: str):
+    """Declare a statement that connections PREPARE on first use"""
+    PREPARED_STATEMENTS[name] = (param_types, sql)
+
+
+class PoolTimeout(Exception):
+    """No connection became free within DB_POOL_TIMEOUT"""
+
+
+if PSYCOPG2_AVAILABLE:
+    class PooledConnection(psycopg2.extensions.connection):
+        """psycopg2 connection that remembers which statements it has prepared"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+            self.last_used = time.monotonic()
+
+
+def execute_prepared(cursor, name: str, params: Tuple = ()):
+    """EXECUTE a registered statement, preparing it on this connection the first time"""
+    conn = cursor.connection
+    prepared = getattr(conn, "prepared", None)
+    param_types, sql = PREPARED_STATEMENTS[name]
+    if prepared is None:
+        # Not a pooled connection - fall back to plain execution
+        cursor.execute(_to_pyformat(sql, len(param_types)), params)
+        return
+    if name not in prepared:
+        types = f" ({', '.join(param_types)})" if param_types else ""
+        cursor.execute(f"PREPARE {name}{types} AS {sql}")
+        prepared.add(name)
+    placeholders = f" ({', '.join(['%s'] * len(params))})" if params else ""
+    cursor.execute(f"EXECUTE {name}{placeholders}", params)
+
+
+def prepare_all(cursor) -> int:
+    """PREPARE every registered statement this connection has not prepared yet"""
+    prepared = cursor.connection.prepared
+    count = 0
+    for name, (param_types, sql) in PREPARED_STATEMENTS.items():
+        if name in prepared:
+            continue
+        types = f" ({', '.join(param_types)})" if param_types else ""
+        cursor.execute(f"PREPARE {name}{types} AS {sql}")
+        prepared.add(name)
+        count += 1
+    return count
+
+
+def _to_pyformat(sql: str, count: int) -> str:
+    for position in range(count, 0, -1):
+        sql = sql.replace(f"${position}", "%s")
+    return sql
+
+
+class ConnectionPool:
+    """Bounded pool: connections are created up to max_size and handed out under a lock"""
+
+    def __init__(self, dsn: str, min_size: int = DB_POOL_MIN, max_size: int = DB_POOL_MAX,
+                 timeout: float = DB_POOL_TIMEOUT):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self._idle: List = []
+        self._size = 0  # Open connections, idle + in use
+        self._condition = threading.Condition()
+        self._closed = False
+        # Metrics
+        self._acquired = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn, connection_factory=PooledConnection)
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < DB_HEALTH_CHECK_SECONDS:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Take a healthy connection, opening one if below max_size, else wait for a release"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection free after {timeout:.1f}s "
+                                      f"({self.max_size} in use)")
+                waited = True
+                self._condition.wait(remaining)
+
+        # Connect / health-check outside the lock so other threads are not blocked
+        try:
+            if conn is not None and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                with self._condition:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        waited_for = time.monotonic() - started
+        with self._condition:
+            self._acquired += 1
+            if waited:
+                self._waits += 1
+            self._wait_total += waited_for
+            self._wait_max = max(self._wait_max, waited_for)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Return a connection; broken or explicitly closed ones are dropped"""
+        if conn is None:
+            return
+        if not close and not conn.closed:
+            try:
+                # Never hand out a connection with an open or failed transaction
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                close = True
+        with self._condition:
+            if close or conn.closed or self._closed:
+                self._close_quietly(conn)
+                self._size -= 1
+                self._discarded += 1
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... - rolls back on error and always releases"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def warm(self, count: int = DB_POOL_WARM) -> int:
+        """Open up to count connections and prepare the hot statements on each, so the
+        first requests after startup pay neither the connect nor the PREPARE"""
+        conns = []
+        try:
+            for _ in range(min(count, self.max_size)):
+                conns.append(self.getconn())
+            for conn in conns:
+                cursor = conn.cursor()
+                prepare_all(cursor)
+                cursor.close()
+                conn.commit()
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+        return len(conns)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "avg_wait_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3)
+            }
+
+    def closeall(self):
+        with self._condition:
+            self._closed = True
+            for conn in self._idle:
+                self._close_quietly(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._condition.notify_all()
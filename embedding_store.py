@@ -0,0 +1,329 @@
+"""
+Embedding Store Module
+Semantic memory over conversation turns and detailed media memories
+Each user gets an append-only, memory-mapped float32 matrix of hashed n-gram embeddings
+searched with batched cosine similarity in NumPy (no network, no model download)
+"""
+
+import os
+import json
+import zlib
+import weakref
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Iterable
+
+# NumPy is optional - semantic memory is simply disabled without it
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("[INFO] numpy not installed - semantic memory search disabled")
+
+from memory_index import MODES, memory_text, tokenize, turn_text
+
+# Configuration
+MEMORY_DIR = "memory"
+EMBEDDINGS_DIR = os.path.join(MEMORY_DIR, "embeddings")
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "512"))
+EMBEDDING_TOP_K = int(os.environ.get("EMBEDDING_TOP_K", "3"))
+EMBEDDING_MIN_SCORE = float(os.environ.get("EMBEDDING_MIN_SCORE", "0.15"))
+EMBEDDING_MAX_USERS = int(os.environ.get("EMBEDDING_MAX_USERS", "100"))  # Stores kept open
+INITIAL_CAPACITY = 256
+COMPACT_STALE_RATIO = 0.25  # Compact once a quarter of the rows are superseded
+LABEL_WORDS = {"user", "responded"}  # Transcript labels present in every turn
+
+
+def _hash_feature(feature: str):
+    """Stable bucket and sign for a feature (crc32, so files stay valid across restarts)"""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % EMBEDDING_DIM, 1.0 if (h >> 31) & 1 else -1.0
+
+
+def _features(text: str) -> List[str]:
+    """Word unigrams, word bigrams and character trigrams of each word (stopwords and labels dropped)"""
+    words = [w for w in tokenize(text) if w not in LABEL_WORDS]
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+
+def embed_texts(texts: List[str]):
+    """Embed a batch of texts into L2-normalized float32 vectors (n x EMBEDDING_DIM)"""
+    matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(text or ""):
+            bucket, sign = _hash_feature(feature)
+            matrix[row, bucket] += sign
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class UserEmbeddingStore:
+    """Append-only embedding matrix for one user, backed by a memory-mapped file"""
+
+    def __init__(self, username: str):
+        self.username = username
+        self.matrix_path = os.path.join(EMBEDDINGS_DIR, f"{username}.f32")
+        self.meta_path = os.path.join(EMBEDDINGS_DIR, f"{username}.meta.jsonl")
+        self.lock = threading.Lock()
+        self.open_lock = threading.Lock()  # Held while the files are opened or created and backfilled
+        self.loaded = False
+        self.rows: List[Dict] = []  # Row metadata, same order as the matrix
+        self.latest: Dict[str, int] = {}  # doc_id -> newest row
+        self.matrix = None
+        self.capacity = 0
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.matrix_path) and os.path.exists(self.meta_path)
+
+    def open(self):
+        """Map the existing files into memory"""
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            self.rows = [json.loads(line) for line in f if line.strip()]
+        for position, row in enumerate(self.rows):
+            self.latest[row["doc_id"]] = position
+
+        self.capacity = max(os.path.getsize(self.matrix_path) // (EMBEDDING_DIM * 4), len(self.rows))
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                                shape=(max(self.capacity, 1), EMBEDDING_DIM))
+
+    def create(self):
+        """Create empty files"""
+        if not os.path.exists(EMBEDDINGS_DIR):
+            os.makedirs(EMBEDDINGS_DIR)
+        open(self.meta_path, 'w').close()
+        self._allocate(INITIAL_CAPACITY)
+
+    def _allocate(self, capacity: int):
+        """Grow (or create) the matrix file - existing rows stay in place on disk"""
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(capacity * EMBEDDING_DIM * 4)
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, EMBEDDING_DIM))
+        self.capacity = capacity
+
+    def append(self, entries: List[Dict]):
+        """Append rows for new documents; re-added doc_ids supersede their older rows"""
+        with self.lock:
+            # Skip documents whose newest row already has this text (e.g. a turn the backfill
+            # just read from storage)
+            entries = [entry for entry in entries
+                       if entry["doc_id"] not in self.latest
+                       or self.rows[self.latest[entry["doc_id"]]].get("text") != entry["text"]]
+        if not entries:
+            return
+        vectors = embed_texts([entry["text"] for entry in entries])
+
+        with self.lock:
+            start = len(self.rows)
+            needed = start + len(entries)
+            if needed > self.capacity:
+                new_capacity = max(self.capacity * 2, INITIAL_CAPACITY)
+                while new_capacity < needed:
+                    new_capacity *= 2
+                self._allocate(new_capacity)
+
+            self.matrix[start:needed] = vectors
+            self.matrix.flush()
+
+            with open(self.meta_path, 'a', encoding='utf-8') as f:
+                for offset, entry in enumerate(entries):
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    self.rows.append(entry)
+                    self.latest[entry["doc_id"]] = start + offset
+
+            stale = len(self.rows) - len(self.latest)
+            if stale and stale / len(self.rows) >= COMPACT_STALE_RATIO:
+                self._compact()
+
+    def _compact(self):
+        """Drop superseded rows and shrink the matrix (caller holds the lock)"""
+        keep = sorted(self.latest.values())
+        vectors = np.array(self.matrix[keep])
+        rows = [self.rows[position] for position in keep]
+
+        meta_tmp = self.meta_path + ".tmp"
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        self.matrix = None
+        os.remove(self.matrix_path)
+        self._allocate(max(len(rows), INITIAL_CAPACITY))
+        self.matrix[:len(rows)] = vectors
+        self.matrix.flush()
+        os.replace(meta_tmp, self.meta_path)
+
+        self.rows = rows
+        self.latest = {row["doc_id"]: position for position, row in enumerate(rows)}
+        print(f"[SUCCESS] Compacted embedding store for {self.username}: {len(rows)} rows")
+
+    def compact(self):
+        with self.lock:
+            if len(self.rows) != len(self.latest):
+                self._compact()
+
+    def search(self, queries: List[str], top_k: int, modes: Iterable[str],
+               exclude_timestamps=None) -> List[List[Dict]]:
+        """Batched cosine top-k: one result list per query"""
+        modes = set(modes)
+        exclude_timestamps = exclude_timestamps or set()
+        query_vectors = embed_texts(queries)
+
+        with self.lock:
+            candidates = [position for position in self.latest.values()
+                          if self.rows[position].get("mode") in modes
+                          and self.rows[position].get("timestamp") not in exclude_timestamps]
+            if not candidates:
+                return [[] for _ in queries]
+            candidates = np.array(sorted(candidates))
+            scores = query_vectors @ np.asarray(self.matrix[candidates]).T  # (queries x candidates)
+            rows = self.rows
+
+        results = []
+        k = min(top_k, len(candidates))
+        for query_scores in scores:
+            top = np.argpartition(-query_scores, k - 1)[:k]
+            top = top[np.argsort(-query_scores[top])]
+            results.append([
+                {**rows[candidates[i]], "score": round(float(query_scores[i]), 4)}
+                for i in top if query_scores[i] >= EMBEDDING_MIN_SCORE
+            ])
+        return results
+
+
+# username -> UserEmbeddingStore (least recently used closed first)
+_stores: "OrderedDict[str, UserEmbeddingStore]" = OrderedDict()
+# Every store still referenced anywhere, evicted or not - one store per user's files at a time
+_live_stores: "weakref.WeakValueDictionary[str, UserEmbeddingStore]" = weakref.WeakValueDictionary()
+_stores_lock = threading.Lock()
+
+
+def _backfill(store: UserEmbeddingStore):
+    """Embed a user's existing history the first time their store is created"""
+    from database import load_conversation
+
+    entries = []
+    for mode in MODES:
+        conversation = load_conversation(store.username, mode)
+        if not conversation:
+            continue
+        for msg in conversation.get("messages", []):
+            if "user_message" in msg:
+                entries.append(_turn_entry(mode, msg.get("timestamp"), msg.get("user_message"), msg.get("bot_response")))
+        for memory in conversation.get("detailed_memories", []) or []:
+            entries.append(_memory_entry(mode, memory))
+    store.append(entries)
+    print(f"[SUCCESS] Backfilled embedding store for {store.username}: {len(entries)} rows")
+
+
+def get_user_store(username: str) -> UserEmbeddingStore:
+    """Open (or create and backfill) a user's embedding store"""
+    with _stores_lock:
+        store = _stores.get(username)
+        if store is not None:
+            _stores.move_to_end(username)
+        else:
+            # An evicted store still in use (e.g. mid-append) is taken back rather than opening
+            # a second one on the same files
+            store = _live_stores.get(username)
+            if store is None:
+                store = UserEmbeddingStore(username)
+                _live_stores[username] = store
+            _stores[username] = store
+            while len(_stores) > EMBEDDING_MAX_USERS:
+                _stores.popitem(last=False)
+
+    if not store.loaded:
+        # Per-user: a backfill reads the whole history and must not hold up other users
+        with store.open_lock:
+            if not store.loaded:
+                created = False
+                try:
+                    if store.exists:
+                        store.open()
+                    else:
+                        created = True
+                        store.create()
+                        _backfill(store)
+                except Exception:
+                    if created:
+                        # Don't leave a half-filled store that would be opened as complete next time
+                        store.matrix = None
+                        for path in (store.matrix_path, store.meta_path):
+                            if os.path.exists(path):
+                                os.remove(path)
+                    with _stores_lock:
+                        if _stores.get(username) is store:
+                            del _stores[username]
+                        if _live_stores.get(username) is store:
+                            del _live_stores[username]
+                    raise
+                store.loaded = True
+    return store
+
+
+def _turn_entry(mode: str, timestamp: Optional[str], message: Optional[str], response: Optional[str]) -> Dict:
+    return {
+        "doc_id": f"turn:{mode}:{timestamp}",
+        "mode": mode,
+        "kind": "turn",
+        "timestamp": timestamp,
+        "text": turn_text(message, response)
+    }
+
+
+def _memory_entry(mode: str, detailed_memory: Dict) -> Dict:
+    return {
+        "doc_id": f"memory:{detailed_memory.get('timestamp')}",
+        "mode": mode,
+        "kind": "memory",
+        "timestamp": detailed_memory.get("timestamp"),
+        "text": memory_text(detailed_memory)
+    }
+
+
+def embed_conversation_turn(username: str, mode: str, timestamp: str, message: str, response: str,
+                            detailed_memory: Optional[Dict] = None):
+    """Append a newly saved turn (and its media memory) to the user's embedding store"""
+    if not NUMPY_AVAILABLE:
+        return
+    try:
+        entries = [_turn_entry(mode, timestamp, message, response)]
+        if detailed_memory:
+            entries.append(_memory_entry(mode, detailed_memory))
+        get_user_store(username).append(entries)
+    except Exception as e:
+        print(f"[ERROR] Failed to embed conversation turn for {username}: {e}")
+
+
+def embed_detailed_memory(username: str, mode: str, detailed_memory: Dict):
+    """Append an updated detailed memory (supersedes its earlier row)"""
+    if not NUMPY_AVAILABLE:
+        return
+    try:
+        get_user_store(username).append([_memory_entry(mode, detailed_memory)])
+    except Exception as e:
+        print(f"[ERROR] Failed to embed detailed memory for {username}: {e}")
+
+
+def search_similar(username: str, query: str, modes: Iterable[str], top_k: int = EMBEDDING_TOP_K,
+                   exclude_timestamps=None) -> List[Dict]:
+    """Semantic top-k search over a user's turns and media memories"""
+    if not NUMPY_AVAILABLE or not query or not query.strip():
+        return []
+    try:
+        return get_user_store(username).search([query], top_k, modes, exclude_timestamps)[0]
+    except Exception as e:
+        print(f"[ERROR] Semantic memory search failed for {username}: {e}")
+        return []
+
@@ -5,6 +5,8 @@ Handles device registration, video streaming, and audio processing from ESP32-CA
 
 import os
 import json
+import time
+import threading
 from datetime import datetime
 from typing import Optional, Dict
 import uuid
@@ -17,89 +19,66 @@ try:
 except ImportError:
     PSYCOPG2_AVAILABLE = False
 
+from sqlite_storage import SQLITE_DATABASE_PATH, sqlite_connection, sqlite_transaction
+
 DATABASE_URL = os.environ.get("DATABASE_URL")
 USE_DATABASE = DATABASE_URL is not None and PSYCOPG2_AVAILABLE
+USE_SQLITE = not USE_DATABASE and SQLITE_DATABASE_PATH is not None
 MEMORY_DIR = "memory"
 DEVICES_FILE = os.path.join(MEMORY_DIR, "devices.json")
+DEVICE_CACHE_TTL_SECONDS = float(os.environ.get("DEVICE_CACHE_TTL_SECONDS", "300"))
 
+# device_id -> (username, cached_at) for registered devices - filled at startup and on lookup,
+# so heartbeats and frame uploads skip the storage round-trip
+_device_cache: Dict[str, tuple] = {}
+_device_cache_lock = threading.Lock()
 
-def init_devices_table(db_pool):
-    """Initialize ESP32 devices table in PostgreSQL"""
-    if not USE_DATABASE or not db_pool:
-        return
-    
-    try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Create devices table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS esp32_devices (
-                id SERIAL PRIMARY KEY,
-                device_id VARCHAR(255) UNIQUE NOT NULL,
-                username VARCHAR(255) NOT NULL,
-                device_name VARCHAR(255),
-                mac_address VARCHAR(50),
-                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-        """)
-        
-        # Create index
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_device_id 
-            ON esp32_devices(device_id)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_device_username 
-            ON esp32_devices(username)
-        """)
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
-        
-        print("[SUCCESS] ESP32 devices table initialized")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to initialize devices table: {e}")
+
+def _cache_device(device_id: str, username: str):
+    with _device_cache_lock:
+        _device_cache[device_id] = (username, time.monotonic())
+
+
+def _cached_device_username(device_id: str) -> Optional[str]:
+    with _device_cache_lock:
+        cached = _device_cache.get(device_id)
+    if cached and time.monotonic() - cached[1] < DEVICE_CACHE_TTL_SECONDS:
+        return cached[0]
+    return None
 
 
 def register_device_db(device_id: str, username: str, device_name: str, mac_address: str, db_pool) -> Dict:
     """Register ESP32 device in PostgreSQL"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Check if device already exists
-        cursor.execute("""
-            SELECT device_id, username FROM esp32_devices 
-            WHERE device_id = %s
-        """, (device_id,))
-        
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing device
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Check if device already exists
             cursor.execute("""
-                UPDATE esp32_devices 
-                SET username = %s, device_name = %s, mac_address = %s, 
-                    last_seen = %s, is_active = TRUE
+                SELECT device_id, username FROM esp32_devices 
                 WHERE device_id = %s
-            """, (username, device_name, mac_address, datetime.now(), device_id))
-        else:
-            # Insert new device
-            cursor.execute("""
-                INSERT INTO esp32_devices 
-                (device_id, username, device_name, mac_address, registered_at, last_seen)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (device_id, username, device_name, mac_address, datetime.now(), datetime.now()))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+            """, (device_id,))
+            
+            existing = cursor.fetchone()
+            
+            if existing:
+                # Update existing device
+                cursor.execute("""
+                    UPDATE esp32_devices 
+                    SET username = %s, device_name = %s, mac_address = %s, 
+                        last_seen = %s, is_active = TRUE
+                    WHERE device_id = %s
+                """, (username, device_name, mac_address, datetime.now(), device_id))
+            else:
+                # Insert new device
+                cursor.execute("""
+                    INSERT INTO esp32_devices 
+                    (device_id, username, device_name, mac_address, registered_at, last_seen)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (device_id, username, device_name, mac_address, datetime.now(), datetime.now()))
+            
+            conn.commit()
+            cursor.close()
         
         return {
             "success": True,
@@ -151,20 +130,58 @@ def register_device_json(device_id: str, username: str, device_name: str, mac_ad
         return {"success": False, "error": str(e)}
 
 
-def get_device_username_db(device_id: str, db_pool) -> Optional[str]:
-    """Get username associated with device from PostgreSQL"""
+def register_device_sqlite(device_id: str, username: str, device_name: str, mac_address: str) -> Dict:
+    """Register ESP32 device in SQLite"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
+        now = datetime.now().isoformat()
+        with sqlite_transaction() as conn:
+            conn.execute("""
+                INSERT INTO esp32_devices
+                (device_id, username, device_name, mac_address, registered_at, last_seen, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (device_id) DO UPDATE
+                SET username = excluded.username, device_name = excluded.device_name,
+                    mac_address = excluded.mac_address, last_seen = excluded.last_seen, is_active = 1
+            """, (device_id, username, device_name, mac_address, now, now))
         
-        cursor.execute("""
-            SELECT username FROM esp32_devices 
-            WHERE device_id = %s AND is_active = TRUE
-        """, (device_id,))
+        return {
+            "success": True,
+            "device_id": device_id,
+            "username": username,
+            "message": "Device registered successfully"
+        }
         
-        result = cursor.fetchone()
-        cursor.close()
-        db_pool.putconn(conn)
+    except Exception as e:
+        print(f"[ERROR] Failed to register device: {e}")
+        return {"success": False, "error": str(e)}
+
+
+def register_device(device_id: str, username: str, device_name: str, mac_address: str, db_pool=None) -> Dict:
+    """Register ESP32 device (auto-detects PostgreSQL, SQLite or JSON)"""
+    if USE_DATABASE and db_pool:
+        result = register_device_db(device_id, username, device_name, mac_address, db_pool)
+    elif USE_SQLITE:
+        result = register_device_sqlite(device_id, username, device_name, mac_address)
+    else:
+        result = register_device_json(device_id, username, device_name, mac_address)
+    if result["success"]:
+        _cache_device(device_id, username)
+    return result
+
+
+def get_device_username_db(device_id: str, db_pool) -> Optional[str]:
+    """Get username associated with device from PostgreSQL"""
+    try:
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT username FROM esp32_devices 
+                WHERE device_id = %s AND is_active = TRUE
+            """, (device_id,))
+            
+            result = cursor.fetchone()
+            cursor.close()
         
         return result[0] if result else None
         
@@ -193,21 +210,90 @@ def get_device_username_json(device_id: str) -> Optional[str]:
         return None
 
 
-def update_device_last_seen_db(device_id: str, db_pool) -> bool:
-    """Update device last seen timestamp in PostgreSQL"""
+def get_device_username_sqlite(device_id: str) -> Optional[str]:
+    """Get username associated with device from SQLite"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE esp32_devices 
-            SET last_seen = %s 
-            WHERE device_id = %s
-        """, (datetime.now(), device_id))
+        result = sqlite_connection().execute("""
+            SELECT username FROM esp32_devices
+            WHERE device_id = ? AND is_active = 1
+        """, (device_id,)).fetchone()
+        return result["username"] if result else None
         
-        conn.commit()
+    except Exception as e:
+        print(f"[ERROR] Failed to get device username: {e}")
+        return None
+
+
+def get_device_username(device_id: str, db_pool=None) -> Optional[str]:
+    """Get username associated with device (cache first, then PostgreSQL, SQLite or JSON)"""
+    username = _cached_device_username(device_id)
+    if username:
+        return username
+    if USE_DATABASE and db_pool:
+        username = get_device_username_db(device_id, db_pool)
+    elif USE_SQLITE:
+        username = get_device_username_sqlite(device_id)
+    else:
+        username = get_device_username_json(device_id)
+    if username:
+        _cache_device(device_id, username)
+    return username
+
+
+def load_active_devices_db(db_pool) -> Dict[str, str]:
+    """device_id -> username of every active device in PostgreSQL"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT device_id, username FROM esp32_devices WHERE is_active = TRUE")
+        devices = dict(cursor.fetchall())
         cursor.close()
-        db_pool.putconn(conn)
+    return devices
+
+
+def load_active_devices_json() -> Dict[str, str]:
+    """device_id -> username of every active device in JSON"""
+    if not os.path.exists(DEVICES_FILE):
+        return {}
+    with open(DEVICES_FILE, 'r') as f:
+        devices = json.load(f)
+    return {device_id: device.get("username") for device_id, device in devices.items()
+            if device.get("is_active") and device.get("username")}
+
+
+def load_active_devices_sqlite() -> Dict[str, str]:
+    """device_id -> username of every active device in SQLite"""
+    rows = sqlite_connection().execute("SELECT device_id, username FROM esp32_devices WHERE is_active = 1").fetchall()
+    return {row["device_id"]: row["username"] for row in rows}
+
+
+def warm_device_cache(db_pool=None) -> int:
+    """Load every active device into the cache at startup - returns how many"""
+    if USE_DATABASE and db_pool:
+        devices = load_active_devices_db(db_pool)
+    elif USE_SQLITE:
+        devices = load_active_devices_sqlite()
+    else:
+        devices = load_active_devices_json()
+    now = time.monotonic()
+    with _device_cache_lock:
+        _device_cache.update({device_id: (username, now) for device_id, username in devices.items()})
+    return len(devices)
+
+
+def update_device_last_seen_db(device_id: str, db_pool) -> bool:
+    """Update device last seen timestamp in PostgreSQL"""
+    try:
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                UPDATE esp32_devices 
+                SET last_seen = %s 
+                WHERE device_id = %s
+            """, (datetime.now(), device_id))
+            
+            conn.commit()
+            cursor.close()
         
         return True
         
@@ -238,3 +324,26 @@ def update_device_last_seen_json(device_id: str) -> bool:
     except Exception as e:
         print(f"[ERROR] Failed to update device last seen: {e}")
         return False
+
+
+def update_device_last_seen_sqlite(device_id: str) -> bool:
+    """Update device last seen timestamp in SQLite"""
+    try:
+        with sqlite_transaction() as conn:
+            cursor = conn.execute("UPDATE esp32_devices SET last_seen = ? WHERE device_id = ?",
+                                  (datetime.now().isoformat(), device_id))
+        return cursor.rowcount > 0
+        
+    except Exception as e:
+        print(f"[ERROR] Failed to update device last seen: {e}")
+        return False
+
+
+def update_device_last_seen(device_id: str, db_pool=None) -> bool:
+    """Update device last seen timestamp (auto-detects PostgreSQL, SQLite or JSON)"""
+    if USE_DATABASE and db_pool:
+        return update_device_last_seen_db(device_id, db_pool)
+    elif USE_SQLITE:
+        return update_device_last_seen_sqlite(device_id)
+    else:
+        return update_device_last_seen_json(device_id)
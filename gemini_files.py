@@ -0,0 +1,254 @@
+"""
+Gemini Files Module
+Offloads large media to the Gemini File API (resumable upload) and reuses the
+uploaded file by content hash for as long as Gemini keeps it, so follow-up
+questions about the same clip are sent as a short file_data reference
+Set GEMINI_FILE_API=local to use the on-disk stand-in instead of Gemini (tests / offline)
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict
+
+import requests
+
+from media import MediaInput, inline_media_part, raw_media_body
+
+# Configuration
+MEMORY_DIR = "memory"
+GEMINI_FILE_CACHE_PATH = os.path.join(MEMORY_DIR, "gemini_files.json")
+GEMINI_FILE_API = os.environ.get("GEMINI_FILE_API", "gemini").lower()  # "gemini", "local" or "off"
+GEMINI_FILE_API_THRESHOLD = int(os.environ.get("GEMINI_FILE_API_THRESHOLD", str(8 * 1024 * 1024)))  # Bytes
+GEMINI_FILE_ACTIVE_TIMEOUT = float(os.environ.get("GEMINI_FILE_ACTIVE_TIMEOUT", "120"))
+GEMINI_FILE_POLL_SECONDS = 2.0
+GEMINI_FILE_DEFAULT_TTL = timedelta(hours=48)  # Gemini deletes uploaded files after 48 hours
+GEMINI_FILE_EXPIRY_MARGIN = timedelta(hours=1)  # Stop reusing a file this long before it expires
+LOCAL_FILES_DIR = os.path.join(MEMORY_DIR, "gemini_files_local")
+
+GEMINI_UPLOAD_BASE_URL = "https://generativelanguage.googleapis.com/upload/v1beta"
+GEMINI_FILES_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+# Set by app.py (the API key may come from config/gemini_key.py)
+_api_key: Optional[str] = None
+
+# content hash -> {"name", "uri", "mime_type", "size", "expires_at"}
+_cache: Dict[str, Dict] = {}
+_cache_loaded = False
+_cache_lock = threading.Lock()
+_upload_locks: Dict[str, threading.Lock] = {}
+
+
+def configure(api_key: str):
+    """Set the API key used for File API calls"""
+    global _api_key
+    _api_key = api_key
+
+
+class GeminiFileAPI:
+    """Gemini File API client (resumable upload protocol)"""
+
+    def upload(self, media: MediaInput, display_name: str) -> Dict:
+        start = requests.post(
+            f"{GEMINI_UPLOAD_BASE_URL}/files?key={_api_key}",
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(media.size),
+                "X-Goog-Upload-Header-Content-Type": media.mime_type,
+                "Content-Type": "application/json"
+            },
+            json={"file": {"display_name": display_name}},
+            timeout=30
+        )
+        upload_url = start.headers.get("x-goog-upload-url")
+        if start.status_code != 200 or not upload_url:
+            raise RuntimeError(f"File API upload start failed: {start.status_code} {start.text[:200]}")
+
+        # The file is streamed straight from the spooled upload / data URL text
+        response = requests.post(
+            upload_url,
+            headers={
+                "Content-Length": str(media.size),
+                "X-Goog-Upload-Offset": "0",
+                "X-Goog-Upload-Command": "upload, finalize"
+            },
+            data=raw_media_body(media),
+            timeout=300
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"File API upload failed: {response.status_code} {response.text[:200]}")
+        return response.json()["file"]
+
+    def get(self, name: str) -> Dict:
+        response = requests.get(f"{GEMINI_FILES_BASE_URL}/{name}?key={_api_key}", timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(f"File API get failed: {response.status_code} {response.text[:200]}")
+        return response.json()
+
+
+class LocalFileAPI:
+    """Local stand-in for the File API - stores uploads on disk and returns local:// URIs"""
+
+    def upload(self, media: MediaInput, display_name: str) -> Dict:
+        os.makedirs(LOCAL_FILES_DIR, exist_ok=True)
+        file_id = uuid.uuid4().hex
+        with open(os.path.join(LOCAL_FILES_DIR, file_id), "wb") as f:
+            for chunk in media.iter_bytes():
+                f.write(chunk)
+        expires_at = datetime.now(timezone.utc) + GEMINI_FILE_DEFAULT_TTL
+        return {
+            "name": f"files/{file_id}",
+            "displayName": display_name,
+            "uri": f"local://files/{file_id}",
+            "mimeType": media.mime_type,
+            "sizeBytes": str(media.size),
+            "state": "ACTIVE",
+            "expirationTime": expires_at.isoformat().replace("+00:00", "Z")
+        }
+
+    def get(self, name: str) -> Dict:
+        file_id = name.split("/", 1)[1]
+        if not os.path.exists(os.path.join(LOCAL_FILES_DIR, file_id)):
+            raise RuntimeError(f"Local file {name} not found")
+        return {"name": name, "uri": f"local://files/{file_id}", "state": "ACTIVE"}
+
+
+def get_file_api():
+    if GEMINI_FILE_API == "local":
+        return LocalFileAPI()
+    if GEMINI_FILE_API == "off":
+        return None
+    return GeminiFileAPI()
+
+
+def _load_cache():
+    """Load the persisted hash -> file cache once, dropping expired entries"""
+    global _cache_loaded
+    if _cache_loaded:
+        return
+    _cache_loaded = True
+    try:
+        if os.path.exists(GEMINI_FILE_CACHE_PATH):
+            with open(GEMINI_FILE_CACHE_PATH, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            now = datetime.now(timezone.utc)
+            _cache.update({content_hash: entry for content_hash, entry in entries.items()
+                           if _parse_time(entry.get("expires_at")) > now})
+    except Exception as e:
+        print(f"[WARNING] Could not load Gemini file cache: {e}")
+
+
+def _save_cache():
+    """Persist the cache (caller holds the lock) - temp file + rename"""
+    try:
+        os.makedirs(MEMORY_DIR, exist_ok=True)
+        tmp_path = GEMINI_FILE_CACHE_PATH + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_cache, f, indent=2)
+        os.replace(tmp_path, GEMINI_FILE_CACHE_PATH)
+    except Exception as e:
+        print(f"[WARNING] Could not save Gemini file cache: {e}")
+
+
+def _parse_time(value: Optional[str]) -> datetime:
+    if not value:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    # Gemini returns RFC 3339 with nanoseconds, e.g. 2024-01-01T00:00:00.123456789Z
+    value = value.replace("Z", "+00:00")
+    if "." in value:
+        head, tail = value.split(".", 1)
+        fraction, _, offset = tail.partition("+")
+        value = f"{head}.{fraction[:6]}+{offset}" if offset else f"{head}.{fraction[:6]}"
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _wait_until_active(api, file_info: Dict) -> Dict:
+    """Videos are processed after upload and can only be referenced once ACTIVE"""
+    deadline = time.time() + GEMINI_FILE_ACTIVE_TIMEOUT
+    while file_info.get("state", "ACTIVE") == "PROCESSING":
+        if time.time() > deadline:
+            raise RuntimeError(f"File {file_info.get('name')} still processing after {GEMINI_FILE_ACTIVE_TIMEOUT}s")
+        time.sleep(GEMINI_FILE_POLL_SECONDS)
+        file_info = api.get(file_info["name"])
+    if file_info.get("state", "ACTIVE") != "ACTIVE":
+        raise RuntimeError(f"File {file_info.get('name')} is {file_info.get('state')}")
+    return file_info
+
+
+def get_cached_file(content_hash: str) -> Optional[Dict]:
+    """Cached upload for this content, if it is not about to expire"""
+    with _cache_lock:
+        _load_cache()
+        entry = _cache.get(content_hash)
+        if entry and _parse_time(entry["expires_at"]) - GEMINI_FILE_EXPIRY_MARGIN > datetime.now(timezone.utc):
+            return entry
+        if entry:
+            del _cache[content_hash]
+            _save_cache()
+    return None
+
+
+def upload_media(media: MediaInput, display_name: str = "media") -> Dict:
+    """Upload media through the File API, or reuse an earlier upload of the same content"""
+    content_hash = media.content_hash()
+    entry = get_cached_file(content_hash)
+    if entry:
+        print(f"[GEMINI FILES] Reusing uploaded file {entry['name']} for {content_hash[:12]}")
+        return entry
+
+    with _cache_lock:
+        lock = _upload_locks.setdefault(content_hash, threading.Lock())
+
+    # Concurrent requests for the same clip wait for a single upload
+    try:
+        with lock:
+            entry = get_cached_file(content_hash)
+            if entry:
+                return entry
+
+            api = get_file_api()
+            started = time.time()
+            file_info = _wait_until_active(api, api.upload(media, display_name))
+            expires_at = file_info.get("expirationTime") or \
+                (datetime.now(timezone.utc) + GEMINI_FILE_DEFAULT_TTL).isoformat()
+            entry = {
+                "name": file_info["name"],
+                "uri": file_info["uri"],
+                "mime_type": file_info.get("mimeType") or media.mime_type,
+                "size": media.size,
+                "expires_at": expires_at
+            }
+            with _cache_lock:
+                _cache[content_hash] = entry
+                _save_cache()
+    finally:
+        # Also after a failed upload, so the table doesn't keep a lock per failed clip
+        with _cache_lock:
+            if _upload_locks.get(content_hash) is lock:
+                del _upload_locks[content_hash]
+
+    print(f"[GEMINI FILES] Uploaded {media.size} bytes as {entry['name']} in {time.time() - started:.1f}s")
+    return entry
+
+
+def gemini_media_part(media: MediaInput, display_name: str = "media") -> Dict:
+    """file_data part for large media (uploaded once per content), inline_data otherwise"""
+    if media.size < GEMINI_FILE_API_THRESHOLD or get_file_api() is None:
+        return inline_media_part(media)
+    try:
+        entry = upload_media(media, display_name)
+        return {"file_data": {"mime_type": entry["mime_type"], "file_uri": entry["uri"]}}
+    except Exception as e:
+        print(f"[WARNING] File API upload failed, sending media inline: {e}")
+        return inline_media_part(media)
+
+
+async def gemini_media_part_async(media: MediaInput, display_name: str = "media") -> Dict:
+    """gemini_media_part in a worker thread - an upload and its ACTIVE polling can take minutes"""
+    return await asyncio.to_thread(gemini_media_part, media, display_name)
@@ -0,0 +1,200 @@
+"""
+Group Commit Module
+Batches conversation inserts from all request handlers into one multi-row INSERT
+and one COMMIT every few milliseconds (or every N rows), so the number of commits
+no longer grows with the number of chat turns
+"""
+
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Optional, Callable, List, Tuple, Dict
+
+try:
+    from psycopg2.extras import execute_values
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+
+# Configuration
+GROUP_COMMIT_DELAY_MS = float(os.environ.get("GROUP_COMMIT_DELAY_MS", "5"))  # Max wait after the first queued row
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get("GROUP_COMMIT_MAX_ROWS", "64"))  # Flush immediately at this many rows
+GROUP_COMMIT_WAIT_TIMEOUT = float(os.environ.get("GROUP_COMMIT_WAIT_TIMEOUT", "15"))  # Seconds a caller waits
+
+CONVERSATION_COLUMNS = "(session_id, username, mode, user_message, bot_response, has_media, media_type, timestamp, channel)"
+MEMORY_COLUMNS = "(session_id, username, mode, media_type, timestamp, detailed_analysis, extracted_memory)"
+
+
+class PendingWrite:
+    """One chat turn waiting for the next group commit"""
+
+    def __init__(self, conversation: Tuple, memory: Optional[Tuple], on_commit: Optional[Callable[[bool], None]]):
+        self.conversation = conversation
+        self.memory = memory
+        self.on_commit = on_commit
+        self.future: Future = Future()
+
+
+class GroupCommitWriter:
+    """Background writer that flushes queued turns as one transaction"""
+
+    def __init__(self, pool, delay_ms: float = GROUP_COMMIT_DELAY_MS, max_rows: int = GROUP_COMMIT_MAX_ROWS):
+        self.pool = pool
+        self.delay = delay_ms / 1000.0
+        self.max_rows = max(1, max_rows)
+        self._queue: List[PendingWrite] = []
+        self._first_queued_at = 0.0
+        self._condition = threading.Condition()
+        self._closed = False
+        # Metrics
+        self._flushes = 0
+        self._rows = 0
+        self._failed_rows = 0
+        self._max_batch = 0
+
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, conversation: Tuple, memory: Optional[Tuple] = None,
+               on_commit: Optional[Callable[[bool], None]] = None) -> Future:
+        """Queue a turn - the returned future resolves to True once it is committed"""
+        write = PendingWrite(conversation, memory, on_commit)
+        with self._condition:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                if not self._queue:
+                    self._first_queued_at = time.monotonic()
+                self._queue.append(write)
+                self._condition.notify()
+        if closed:
+            # Shutting down - write it directly
+            self._complete([write], [self._write_one(write)])
+        return write.future
+
+    def write(self, conversation: Tuple, memory: Optional[Tuple] = None) -> bool:
+        """Queue a turn and block until it is durable
+
+        A turn still queued when the wait times out is taken off the queue, so False always
+        means it was not saved; one already in a running flush gets that flush's result.
+        """
+        future = self.submit(conversation, memory)
+        try:
+            return future.result(timeout=GROUP_COMMIT_WAIT_TIMEOUT)
+        except FutureTimeoutError:
+            if self._cancel(future):
+                print(f"[ERROR] Group commit not started within {GROUP_COMMIT_WAIT_TIMEOUT}s, turn dropped")
+                return False
+            print("[WARNING] Group commit is slow, waiting for the running flush")
+            return future.result()
+        except Exception as e:
+            print(f"[ERROR] Waiting for group commit failed: {e}")
+            return False
+
+    def _cancel(self, future: Future) -> bool:
+        """Take a turn off the queue if no flush has picked it up yet"""
+        with self._condition:
+            for index, write in enumerate(self._queue):
+                if write.future is future:
+                    del self._queue[index]
+                    break
+            else:
+                return False
+        future.set_result(False)
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue and self._closed:
+                    return
+                # Give other handlers a few milliseconds to join this commit
+                deadline = self._first_queued_at + self.delay
+                while len(self._queue) < self.max_rows and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._queue[:self.max_rows]
+                del self._queue[:self.max_rows]
+                if self._queue:
+                    self._first_queued_at = time.monotonic()
+            if batch:  # Empty when the waiting turns timed out and were taken back
+                self._flush(batch)
+
+    def _flush(self, batch: List[PendingWrite]):
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                execute_values(cursor, f"INSERT INTO conversations {CONVERSATION_COLUMNS} VALUES %s",
+                               [write.conversation for write in batch], page_size=self.max_rows)
+                memories = [write.memory for write in batch if write.memory]
+                if memories:
+                    execute_values(cursor, f"INSERT INTO detailed_memories {MEMORY_COLUMNS} VALUES %s",
+                                   memories, page_size=self.max_rows)
+                conn.commit()
+                cursor.close()
+            results = [True] * len(batch)
+        except Exception as e:
+            # One bad row must not fail the others - retry them one by one
+            print(f"[WARNING] Group commit of {len(batch)} rows failed, retrying individually: {e}")
+            results = [self._write_one(write) for write in batch]
+        self._complete(batch, results)
+
+    def _write_one(self, write: PendingWrite) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"INSERT INTO conversations {CONVERSATION_COLUMNS} "
+                               "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", write.conversation)
+                if write.memory:
+                    cursor.execute(f"INSERT INTO detailed_memories {MEMORY_COLUMNS} "
+                                   "VALUES (%s, %s, %s, %s, %s, %s, %s)", write.memory)
+                conn.commit()
+                cursor.close()
+            return True
+        except Exception as e:
+            print(f"[ERROR] Failed to save conversation to database: {e}")
+            return False
+
+    def _complete(self, batch: List[PendingWrite], results: List[bool]):
+        with self._condition:
+            self._flushes += 1
+            self._rows += len(batch)
+            self._failed_rows += results.count(False)
+            self._max_batch = max(self._max_batch, len(batch))
+        for write, committed in zip(batch, results):
+            write.future.set_result(committed)
+            if write.on_commit:
+                try:
+                    write.on_commit(committed)
+                except Exception as e:
+                    print(f"[ERROR] Group commit callback failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "queued": len(self._queue),
+                "flushes": self._flushes,
+                "rows": self._rows,
+                "failed_rows": self._failed_rows,
+                "avg_batch": round(self._rows / self._flushes, 2) if self._flushes else 0.0,
+                "max_batch": self._max_batch,
+                "delay_ms": self.delay * 1000,
+                "max_rows": self.max_rows
+            }
+
+    def close(self, timeout: float = GROUP_COMMIT_WAIT_TIMEOUT):
+        """Flush everything still queued (fire-and-forget rows included) and stop the thread"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
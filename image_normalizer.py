@@ -0,0 +1,111 @@
+"""
+Image Normalizer Module
+Downscales and re-encodes images before they are sent to Gemini
+Gemini tiles images larger than ~768px anyway, so full-resolution phone photos and
+camera frames only make the request bigger; results are cached by content hash
+"""
+
+import io
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Tuple
+
+# Pillow is optional - images are sent unchanged without it
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("[INFO] Pillow not installed - images are sent to Gemini at original size")
+
+from media import MediaInput, media_from_data_url, inline_media_part
+
+# Configuration
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "768"))  # Longest side in pixels
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_NORMALIZE_WORKERS = int(os.environ.get("IMAGE_NORMALIZE_WORKERS", "2"))
+IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "256"))  # Normalized images kept in RAM
+NORMALIZABLE_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp", "image/bmp"}
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_NORMALIZE_WORKERS, thread_name_prefix="image-normalize")
+
+# content hash -> (bytes, mime type)
+_cache: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def normalize_image_bytes(data: bytes) -> Tuple[Optional[bytes], str]:
+    """Resize to IMAGE_MAX_DIMENSION and re-encode as JPEG -> (bytes or None if not smaller, mime type)"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        resized = max(image.size) > IMAGE_MAX_DIMENSION
+        if resized:
+            image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white - JPEG has no alpha channel
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+
+    encoded = output.getvalue()
+    if not resized and len(encoded) >= len(data):
+        return None, "image/jpeg"
+    return encoded, "image/jpeg"
+
+
+def normalize_image(media: MediaInput) -> MediaInput:
+    """Downscaled copy of an image (cached by content hash), or the original when that is already small"""
+    if not PIL_AVAILABLE or media.mime_type.lower() not in NORMALIZABLE_TYPES:
+        return media
+
+    try:
+        content_hash = media.content_hash()
+    except Exception as e:
+        print(f"[WARNING] Image could not be read, sending original: {e}")
+        return media
+    with _cache_lock:
+        cached = _cache.get(content_hash)
+        if cached is not None:
+            _cache.move_to_end(content_hash)
+
+    if cached is None:
+        try:
+            data, mime_type = normalize_image_bytes(media.read_bytes())
+        except Exception as e:
+            print(f"[WARNING] Image normalization failed, sending original: {e}")
+            return media
+        cached = (data, mime_type)
+        with _cache_lock:
+            _cache[content_hash] = cached
+            while len(_cache) > IMAGE_CACHE_SIZE:
+                _cache.popitem(last=False)
+        if data is not None:
+            print(f"[IMAGE] Normalized {media.size} -> {len(data)} bytes")
+
+    data, mime_type = cached
+    if data is None:
+        return media
+    return MediaInput(mime_type, file=io.BytesIO(data))
+
+
+async def normalize_image_async(media: MediaInput) -> MediaInput:
+    """normalize_image on the worker pool so the event loop is not blocked"""
+    return await asyncio.get_running_loop().run_in_executor(_executor, normalize_image, media)
+
+
+async def normalized_image_part(data_url: str) -> Optional[Dict]:
+    """inline_data part for an image data URL (e.g. a locket frame) after normalization"""
+    media = media_from_data_url(data_url)
+    if media is None:
+        return None
+    return inline_media_part(await normalize_image_async(media))
@@ -0,0 +1,215 @@
+"""
+Media Module
+Images and videos attached to Gemini requests, held as a spooled temp file (uploads)
+or as the base64 text of a data URL (legacy JSON clients), plus Gemini request bodies
+that stream the media base64-encoded instead of building one big JSON string in memory
+"""
+
+import os
+import re
+import json
+import uuid
+import base64
+import hashlib
+import tempfile
+from typing import Optional, Dict, List, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configuration
+MEDIA_SPOOL_MAX_MEMORY = int(os.environ.get("MEDIA_SPOOL_MAX_MEMORY", str(1024 * 1024)))  # Larger uploads go to disk
+GEMINI_POOL_MAXSIZE = int(os.environ.get("GEMINI_POOL_MAXSIZE", "16"))  # Keep-alive connections to the Gemini host
+STREAM_CHUNK_SIZE = 3 * 64 * 1024  # Multiple of 3 so base64 chunks concatenate without padding
+
+BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class MediaInput:
+    """One image or video - either a (spooled) binary file or already base64-encoded text"""
+
+    def __init__(self, mime_type: str, file=None, base64_data: Optional[str] = None,
+                 content_hash: Optional[str] = None):
+        self.mime_type = mime_type
+        self.file = file
+        self.base64_data = base64_data
+        self._content_hash = content_hash  # Known up front when the bytes were hashed on arrival
+        if file is not None:
+            file.seek(0, os.SEEK_END)
+            self.size = file.tell()
+            file.seek(0)
+        else:
+            self.size = len(base64_data) * 3 // 4 - base64_data[-2:].count("=")
+
+    @property
+    def base64_length(self) -> int:
+        if self.file is None:
+            return len(self.base64_data)
+        return 4 * ((self.size + 2) // 3)
+
+    def iter_base64(self):
+        """Yield the base64 encoding in chunks (ASCII bytes)"""
+        if self.file is None:
+            for start in range(0, len(self.base64_data), STREAM_CHUNK_SIZE):
+                yield self.base64_data[start:start + STREAM_CHUNK_SIZE].encode("ascii")
+            return
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+
+    def iter_bytes(self):
+        """Yield the raw media bytes in chunks"""
+        if self.file is None:
+            step = STREAM_CHUNK_SIZE // 3 * 4  # Whole base64 quanta decode independently
+            for start in range(0, len(self.base64_data), step):
+                yield base64.b64decode(self.base64_data[start:start + step])
+            return
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def content_hash(self) -> str:
+        """SHA-256 of the raw bytes (computed once, streamed)"""
+        if self._content_hash is None:
+            digest = hashlib.sha256()
+            for chunk in self.iter_bytes():
+                digest.update(chunk)
+            self._content_hash = digest.hexdigest()
+        return self._content_hash
+
+    def read_bytes(self) -> bytes:
+        """Raw media bytes (one full copy - only for callers that really need them)"""
+        if self.file is None:
+            return base64.b64decode(self.base64_data)
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def media_from_data_url(data_url: str) -> Optional[MediaInput]:
+    """Wrap a data:<mime>;base64,<data> URL without decoding it - None when it is malformed
+
+    The data is spliced into Gemini request bodies as-is, so it must be strict base64
+    (line breaks some clients insert are dropped)
+    """
+    header, separator, base64_data = data_url.partition(",")
+    base64_data = WHITESPACE_PATTERN.sub("", base64_data)
+    if not separator or not header.startswith("data:") or not base64_data:
+        return None
+    if len(base64_data) % 4 or not BASE64_PATTERN.fullmatch(base64_data):
+        return None
+    mime_type = header[5:].split(";")[0] or "application/octet-stream"
+    return MediaInput(mime_type, base64_data=base64_data)
+
+
+def media_from_upload(upload) -> MediaInput:
+    """Wrap a multipart UploadFile - its spooled temp file is used as-is, no copy"""
+    return MediaInput(upload.content_type or "application/octet-stream", file=upload.file)
+
+
+async def media_from_stream(chunks, mime_type: str) -> MediaInput:
+    """Spool a raw request body (async iterator of bytes) to a temp file"""
+    spool = tempfile.SpooledTemporaryFile(max_size=MEDIA_SPOOL_MAX_MEMORY)
+    async for chunk in chunks:
+        spool.write(chunk)
+    return MediaInput(mime_type, file=spool)
+
+
+def inline_media_part(media: MediaInput) -> Dict:
+    """Gemini inline_data part - the data is spliced in when the request body is streamed"""
+    return {"inline_data": {"mime_type": media.mime_type, "data": media}}
+
+
+class StreamingBody:
+    """File-like request body of known length produced chunk by chunk (requests streams it)"""
+
+    def __init__(self, length: int, chunks):
+        self.length = length
+        self.chunks = chunks  # Callable returning a fresh iterator of bytes
+        self._iterator = None
+        self._buffer = b""
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.chunks())
+
+    def read(self, size: int = -1) -> bytes:
+        if self._iterator is None:
+            self._iterator = iter(self)
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._iterator, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def raw_media_body(media: MediaInput) -> StreamingBody:
+    """The media's raw bytes as a streaming request body (e.g. for file uploads)"""
+    return StreamingBody(media.size, media.iter_bytes)
+
+
+def encode_request_body(payload: Dict) -> StreamingBody:
+    """Serialize a Gemini payload whose parts may hold MediaInput objects"""
+    media_by_token: Dict[str, MediaInput] = {}
+
+    def placeholder(value):
+        if isinstance(value, MediaInput):
+            token = f"@@media-{uuid.uuid4().hex}@@"
+            media_by_token[token] = value
+            return token
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    serialized = json.dumps(payload, default=placeholder)
+    segments: List[Union[bytes, MediaInput]] = []
+    for token, media in media_by_token.items():
+        before, serialized = serialized.split(token, 1)
+        segments += [before.encode("utf-8"), media]
+    segments.append(serialized.encode("utf-8"))
+
+    def chunks():
+        # JSON text with the base64 media streamed in between
+        for segment in segments:
+            if isinstance(segment, bytes):
+                yield segment
+            else:
+                yield from segment.iter_base64()
+
+    length = sum(len(s) if isinstance(s, bytes) else s.base64_length for s in segments)
+    return StreamingBody(length, chunks)
+
+
+# One keep-alive session for Gemini calls: requests reuse pooled TLS connections
+# instead of a new TCP + TLS handshake per call
+gemini_session = requests.Session()
+gemini_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=GEMINI_POOL_MAXSIZE))
+
+
+def warm_gemini_connection(url: str, timeout: float = 10) -> int:
+    """Open the TLS connection to the Gemini host ahead of the first request - returns the HTTP status"""
+    response = gemini_session.head(url, timeout=timeout)
+    response.close()
+    return response.status_code
+
+
+def post_gemini(api_url: str, payload: Dict, **kwargs):
+    """POST a Gemini payload, streaming any attached media into the body"""
+    body = encode_request_body(payload)
+    headers = {"Content-Type": "application/json", **kwargs.pop("headers", {})}
+    return gemini_session.post(api_url, data=body, headers=headers, **kwargs)
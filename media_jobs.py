@@ -0,0 +1,168 @@
+"""
+Media Jobs Module
+In-process background job queue persisted to SQLite so jobs survive restarts
+Used to run follow-up Gemini calls (e.g. detailed media memory extraction)
+after the chat response has already been returned
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Callable, Optional, Any
+
+# Configuration
+MEMORY_DIR = "memory"
+JOBS_DB_PATH = os.environ.get("MEDIA_JOBS_DB", os.path.join(MEMORY_DIR, "jobs.db"))
+MEDIA_JOB_WORKERS = int(os.environ.get("MEDIA_JOB_WORKERS", "2"))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.environ.get("MEDIA_JOB_MAX_ATTEMPTS", "5"))
+MEDIA_JOB_BACKOFF_SECONDS = float(os.environ.get("MEDIA_JOB_BACKOFF_SECONDS", "5"))
+MEDIA_JOB_POLL_SECONDS = 2.0
+
+# kind -> handler(payload); a handler raises to have the job retried
+_handlers: Dict[str, Callable[[Dict], Any]] = {}
+
+_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Open the jobs database on first use and recover jobs interrupted by a restart"""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs(status, next_run_at)")
+        # Jobs that were running when the process stopped go back to the queue
+        conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def register_job_handler(kind: str, handler: Callable[[Dict], Any]):
+    """Register the function that runs jobs of the given kind"""
+    _handlers[kind] = handler
+
+
+def enqueue_job(kind: str, payload: Dict) -> Optional[int]:
+    """Persist a job and wake a worker - returns the job id"""
+    try:
+        now = time.time()
+        with _db_lock:
+            conn = _get_conn()
+            cursor = conn.execute("""
+                INSERT INTO jobs (kind, payload, status, attempts, next_run_at, created_at, updated_at)
+                VALUES (?, ?, 'pending', 0, ?, ?, ?)
+            """, (kind, json.dumps(payload, ensure_ascii=False), now, now, now))
+            conn.commit()
+            job_id = cursor.lastrowid
+
+        start_workers()
+        _wakeup.set()
+        return job_id
+
+    except Exception as e:
+        print(f"[ERROR] Failed to enqueue {kind} job: {e}")
+        return None
+
+
+def _claim_next_job() -> Optional[Dict]:
+    """Atomically take the oldest due job"""
+    with _db_lock:
+        conn = _get_conn()
+        row = conn.execute("""
+            SELECT id, kind, payload, attempts FROM jobs
+            WHERE status = 'pending' AND next_run_at <= ?
+            ORDER BY next_run_at, id
+            LIMIT 1
+        """, (time.time(),)).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), row[0]))
+        conn.commit()
+    return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3]}
+
+
+def _finish_job(job: Dict, error: Optional[str] = None):
+    """Mark a job done, or schedule its retry with exponential backoff"""
+    now = time.time()
+    attempts = job["attempts"] + 1
+    with _db_lock:
+        conn = _get_conn()
+        if error is None:
+            conn.execute("UPDATE jobs SET status = 'done', attempts = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                         (attempts, now, job["id"]))
+        elif attempts >= MEDIA_JOB_MAX_ATTEMPTS:
+            conn.execute("UPDATE jobs SET status = 'failed', attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                         (attempts, error, now, job["id"]))
+        else:
+            delay = MEDIA_JOB_BACKOFF_SECONDS * (2 ** (attempts - 1))
+            conn.execute("""
+                UPDATE jobs SET status = 'pending', attempts = ?, last_error = ?, next_run_at = ?, updated_at = ?
+                WHERE id = ?
+            """, (attempts, error, now + delay, now, job["id"]))
+        conn.commit()
+
+    if error is None:
+        print(f"[SUCCESS] Job {job['id']} ({job['kind']}) completed")
+    elif attempts >= MEDIA_JOB_MAX_ATTEMPTS:
+        print(f"[ERROR] Job {job['id']} ({job['kind']}) failed permanently: {error}")
+    else:
+        print(f"[WARNING] Job {job['id']} ({job['kind']}) failed (attempt {attempts}), retrying: {error}")
+
+
+def _worker_loop():
+    while True:
+        job = None
+        try:
+            job = _claim_next_job()
+            if job is None:
+                _wakeup.wait(MEDIA_JOB_POLL_SECONDS)
+                _wakeup.clear()
+                continue
+
+            handler = _handlers.get(job["kind"])
+            if handler is None:
+                _finish_job(job, f"No handler registered for job kind '{job['kind']}'")
+                continue
+
+            handler(job["payload"])
+            _finish_job(job)
+
+        except Exception as e:
+            if job is not None:
+                _finish_job(job, str(e))
+            else:
+                print(f"[ERROR] Job worker error: {e}")
+                time.sleep(MEDIA_JOB_POLL_SECONDS)
+
+
+def start_workers():
+    """Start the bounded worker pool (idempotent)"""
+    with _workers_lock:
+        if _workers:
+            return
+        for number in range(MEDIA_JOB_WORKERS):
+            worker = threading.Thread(target=_worker_loop, name=f"media-job-{number}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+    print(f"[INFO] Started {MEDIA_JOB_WORKERS} background media job workers")
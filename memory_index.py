@@ -0,0 +1,260 @@
+"""
+Memory Index Module
+Per-user BM25 inverted index over conversation turns and detailed media memories
+Built lazily from storage on first use, then updated incrementally on every save
+"""
+
+import os
+import re
+import math
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Iterable
+
+# Configuration
+MEMORY_INDEX_TOP_K = int(os.environ.get("MEMORY_INDEX_TOP_K", "5"))
+MEMORY_INDEX_MAX_USERS = int(os.environ.get("MEMORY_INDEX_MAX_USERS", "200"))  # Indexes kept in RAM
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+MODES = ("sustainability", "personal-assistant")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "had", "has", "have", "he", "her", "his", "how", "i", "if", "in", "is", "it", "its", "me",
+    "my", "no", "not", "of", "on", "or", "our", "she", "so", "that", "the", "their", "them",
+    "then", "there", "they", "this", "to", "was", "we", "were", "what", "when", "where", "which",
+    "who", "why", "will", "with", "you", "your", "im", "ive", "dont", "just", "like", "here"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords and single characters removed"""
+    if not text:
+        return []
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def _flatten_values(value) -> Iterable[str]:
+    """Yield every string inside a nested extracted_memory structure"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield str(key)
+            yield from _flatten_values(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _flatten_values(item)
+    elif value is not None:
+        yield str(value)
+
+
+def memory_text(detailed_memory: Dict) -> str:
+    """Searchable text for one detailed media memory"""
+    extracted = detailed_memory.get("extracted_memory") or {}
+    if isinstance(extracted, str):
+        try:
+            extracted = json.loads(extracted)
+        except ValueError:
+            extracted = {"text": extracted}
+    return " ".join([detailed_memory.get("detailed_analysis") or ""] + list(_flatten_values(extracted)))
+
+
+class UserMemoryIndex:
+    """BM25 index for a single user"""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict] = {}  # doc_id -> {"mode", "kind", "timestamp", "text", "length"}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: term frequency}
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def add(self, doc_id: str, text: str, mode: str, kind: str, timestamp: Optional[str]):
+        """Add (or replace) a document"""
+        tokens = tokenize(text)
+        with self.lock:
+            if doc_id in self.docs:
+                self._remove(doc_id)
+            if not tokens:
+                return
+
+            frequencies: Dict[str, int] = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, count in frequencies.items():
+                self.postings.setdefault(token, {})[doc_id] = count
+
+            self.docs[doc_id] = {
+                "mode": mode,
+                "kind": kind,
+                "timestamp": timestamp,
+                "text": text,
+                "length": len(tokens)
+            }
+            self.total_length += len(tokens)
+
+    def _remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id)
+        self.total_length -= doc["length"]
+        for token in set(tokenize(doc["text"])):
+            doc_postings = self.postings.get(token)
+            if doc_postings:
+                doc_postings.pop(doc_id, None)
+                if not doc_postings:
+                    del self.postings[token]
+
+    def search(self, query: str, top_k: int, modes: Iterable[str], exclude_timestamps=None) -> List[Dict]:
+        """Return the top-k documents by BM25 score"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        modes = set(modes)
+        exclude_timestamps = exclude_timestamps or set()
+
+        with self.lock:
+            doc_count = len(self.docs)
+            if doc_count == 0:
+                return []
+            avg_length = self.total_length / doc_count
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                doc_postings = self.postings.get(term)
+                if not doc_postings:
+                    continue
+                df = len(doc_postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, tf in doc_postings.items():
+                    length = self.docs[doc_id]["length"]
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+
+            results = []
+            for doc_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                doc = self.docs[doc_id]
+                if doc["mode"] not in modes or doc["timestamp"] in exclude_timestamps:
+                    continue
+                results.append({**doc, "doc_id": doc_id, "score": round(score, 4)})
+                if len(results) >= top_k:
+                    break
+            return results
+
+
+def turn_text(message: Optional[str], response: Optional[str]) -> str:
+    return f"User: {message or ''}\nYou responded: {response or ''}"
+
+
+def turn_doc_id(mode: str, timestamp: Optional[str]) -> str:
+    return f"turn:{mode}:{timestamp}"
+
+
+def memory_doc_id(timestamp: Optional[str]) -> str:
+    return f"memory:{timestamp}"
+
+
+# username -> UserMemoryIndex (least recently used evicted first)
+_indexes: "OrderedDict[str, UserMemoryIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+# username -> documents saved while that user's index is being built, replayed once the
+# build finishes (the storage scan may have run before they were written)
+_building: Dict[str, List[tuple]] = {}
+
+
+def _build_index(username: str) -> UserMemoryIndex:
+    """Build a user's index from everything in storage (one full scan per process)"""
+    from database import load_conversation
+
+    index = UserMemoryIndex()
+    for mode in MODES:
+        conversation = load_conversation(username, mode)
+        if not conversation:
+            continue
+
+        for msg in conversation.get("messages", []):
+            timestamp = msg.get("timestamp")
+            text = turn_text(msg.get("user_message"), msg.get("bot_response"))
+            index.add(turn_doc_id(mode, timestamp), text, mode, "turn", timestamp)
+
+        for memory in conversation.get("detailed_memories", []) or []:
+            index.add(memory_doc_id(memory.get("timestamp")), memory_text(memory),
+                      mode, "memory", memory.get("timestamp"))
+
+    print(f"[SUCCESS] Built memory index for {username}: {len(index.docs)} documents")
+    return index
+
+
+def get_user_index(username: str) -> UserMemoryIndex:
+    """Get a user's index, building it on first use"""
+    with _indexes_lock:
+        index = _indexes.get(username)
+        if index is not None:
+            _indexes.move_to_end(username)
+            return index
+        # From here on saves are buffered for this user; a concurrent build shares the buffer
+        pending = _building.setdefault(username, [])
+
+    try:
+        index = _build_index(username)
+    except Exception:
+        with _indexes_lock:
+            if _building.get(username) is pending:
+                del _building[username]
+        raise
+
+    with _indexes_lock:
+        # Another request may have built it meanwhile - keep the first one
+        existing = _indexes.get(username)
+        if existing is not None:
+            return existing
+        # Replay what was saved during the build (re-adding a document already scanned replaces it)
+        for document in _building.pop(username, pending):
+            index.add(*document)
+        if pending:
+            print(f"[INFO] Replayed {len(pending)} documents saved while building the memory index for {username}")
+        _indexes[username] = index
+        while len(_indexes) > MEMORY_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _index_document(username: str, doc_id: str, text: str, mode: str, kind: str, timestamp: Optional[str]):
+    """Add a document to a loaded index, or buffer it while the index is being built"""
+    with _indexes_lock:
+        index = _indexes.get(username)
+        if index is None:
+            pending = _building.get(username)
+            if pending is not None:
+                pending.append((doc_id, text, mode, kind, timestamp))
+            # Not loaded and not building: the next query builds the index from storage,
+            # which already includes this document
+            return
+    index.add(doc_id, text, mode, kind, timestamp)
+
+
+def index_conversation_turn(username: str, mode: str, timestamp: str, message: str, response: str,
+                            detailed_memory: Optional[Dict] = None):
+    """Incrementally index a newly saved turn (no-op if the user's index is not loaded yet)"""
+    _index_document(username, turn_doc_id(mode, timestamp), turn_text(message, response), mode, "turn", timestamp)
+    if detailed_memory:
+        _index_document(username, memory_doc_id(detailed_memory.get("timestamp")), memory_text(detailed_memory),
+                        mode, "memory", detailed_memory.get("timestamp"))
+
+
+def index_detailed_memory(username: str, mode: str, detailed_memory: Dict):
+    """Re-index a detailed memory whose structured fields were filled in later"""
+    _index_document(username, memory_doc_id(detailed_memory.get("timestamp")), memory_text(detailed_memory),
+                    mode, "memory", detailed_memory.get("timestamp"))
+
+
+def search_memories(username: str, query: str, modes: Iterable[str], top_k: int = MEMORY_INDEX_TOP_K,
+                    exclude_timestamps=None) -> List[Dict]:
+    """Find the most relevant older turns and media memories for a query"""
+    try:
+        if not tokenize(query):
+            return []
+        return get_user_index(username).search(query, top_k, modes, exclude_timestamps)
+    except Exception as e:
+        print(f"[ERROR] Memory search failed for {username}: {e}")
+        return []
@@ -0,0 +1,166 @@
+"""
+Model Router Module
+Chooses the Gemini model and generationConfig (maxOutputTokens, thinking budget, ...) for
+each request from a policy table keyed by channel, media type, prompt size and routed
+persona, and records latency per route so the table can be tuned from /debug/model-routes.
+Short text turns go to the fast tier, vision and long / reasoning-heavy requests to the
+capable one.
+
+Routes are checked in order and the first match wins. A route matches when every key it
+sets matches the request:
+  channel            "chat", "esp32", "locket", "transcription" or "background" (str or list)
+  media              list of media types, None standing for text-only
+  min_prompt_tokens / max_prompt_tokens
+                     estimated tokens of the request contents (history + current turn - the
+                     static system prompt is left out, it is the same for every request)
+  personas           routed persona keys, matches if any of them is selected
+The route then names a "model" (a tier - "fast" / "capable" - or a model ID) and optional
+"max_output_tokens", "thinking_budget" (0 disables thinking, -1 lets the model decide) and
+"temperature". MODEL_ROUTES_FILE may point to a JSON list of routes replacing the defaults
+"""
+
+import os
+import json
+import threading
+from collections import deque
+from typing import Optional, Dict, List, Iterable
+
+from prompt_cache import estimate_tokens
+
+# Configuration
+GEMINI_FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+GEMINI_CAPABLE_MODEL = os.environ.get("GEMINI_CAPABLE_MODEL", "gemini-2.5-flash")
+MODEL_ROUTER_ENABLED = os.environ.get("MODEL_ROUTER_ENABLED", "true").lower() == "true"  # false: every route on the capable tier
+MODEL_ROUTES_FILE = os.environ.get("MODEL_ROUTES_FILE")  # JSON list of routes replacing DEFAULT_ROUTES
+ROUTE_LATENCY_SAMPLES = 200  # Recent latencies kept per route for percentiles
+
+MODEL_TIERS = {"fast": GEMINI_FAST_MODEL, "capable": GEMINI_CAPABLE_MODEL}
+
+DEFAULT_ROUTES = [
+    # Hands-free devices: answers are read out, so short and without thinking time
+    {"name": "locket-vision", "channel": "locket", "media": ["image", "video"],
+     "model": "capable", "max_output_tokens": 400, "thinking_budget": 0},
+    {"name": "locket-text", "channel": "locket", "model": "fast", "max_output_tokens": 400, "thinking_budget": 0},
+    {"name": "esp32-video", "channel": "esp32", "media": ["video"],
+     "model": "capable", "max_output_tokens": 500, "thinking_budget": 0, "temperature": 0.7},
+    {"name": "esp32-text", "channel": "esp32", "model": "fast", "max_output_tokens": 500, "thinking_budget": 0,
+     "temperature": 0.7},
+    # Web chat with media: detailed analysis that becomes structured memory
+    {"name": "chat-video", "channel": "chat", "media": ["video"], "model": "capable", "thinking_budget": 1024},
+    {"name": "chat-image", "channel": "chat", "media": ["image"], "model": "capable", "thinking_budget": 512},
+    # Internal calls
+    {"name": "transcription", "channel": "transcription", "model": "fast", "thinking_budget": 0},
+    {"name": "background", "channel": "background", "model": "fast", "thinking_budget": 0},
+    # Web chat text - reasoning-heavy personas first, whatever the prompt size
+    {"name": "chat-text-reasoning", "channel": "chat", "media": [None],
+     "personas": ["tech_rile", "finance_rile", "teacher_rile"], "model": "capable", "thinking_budget": 1024},
+    {"name": "chat-text-short", "channel": "chat", "media": [None], "max_prompt_tokens": 4000,
+     "model": "fast", "max_output_tokens": 1024, "thinking_budget": 0},
+    {"name": "default", "model": "capable"}
+]
+
+
+def load_routes(path: Optional[str] = MODEL_ROUTES_FILE) -> List[Dict]:
+    """Routes from MODEL_ROUTES_FILE, or the defaults (also when the file can't be read)"""
+    if path:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                routes = json.load(f)
+            if not isinstance(routes, list) or not all(isinstance(route, dict) and route.get("name")
+                                                       for route in routes):
+                raise ValueError("expected a list of routes with names")
+            print(f"[SUCCESS] Loaded {len(routes)} model routes from {path}")
+            return routes
+        except Exception as e:
+            print(f"[ERROR] Failed to load model routes from {path}, using defaults: {e}")
+    return DEFAULT_ROUTES
+
+
+def contents_tokens(payload: Dict) -> int:
+    """Estimated tokens of the text in a payload's contents (media parts not counted)"""
+    return sum(estimate_tokens(part["text"]) for content in payload.get("contents", [])
+               for part in content.get("parts", []) if isinstance(part.get("text"), str))
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+class ModelRouter:
+    """First-matching route from the policy table, plus latency per route"""
+
+    def __init__(self, routes: List[Dict]):
+        self.routes = routes
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}  # route name -> recent seconds
+        self._counts: Dict[str, Dict[str, int]] = {}  # route name -> {"requests", "errors"}
+
+    def model_for(self, route: Dict) -> str:
+        if not MODEL_ROUTER_ENABLED:
+            return GEMINI_CAPABLE_MODEL
+        model = route.get("model", "capable")
+        return MODEL_TIERS.get(model, model)
+
+    def matches(self, route: Dict, channel: str, media_type: Optional[str], prompt_tokens: int,
+                personas: Optional[Iterable[str]]) -> bool:
+        if "channel" in route and channel not in _as_list(route["channel"]):
+            return False
+        if "media" in route and media_type not in route["media"]:
+            return False
+        if prompt_tokens < route.get("min_prompt_tokens", 0):
+            return False
+        if "max_prompt_tokens" in route and prompt_tokens > route["max_prompt_tokens"]:
+            return False
+        if "personas" in route and not set(personas or ()) & set(route["personas"]):
+            return False
+        return True
+
+    def select(self, channel: str, media_type: Optional[str] = None, prompt_tokens: int = 0,
+               personas: Optional[Iterable[str]] = None) -> Dict:
+        """The route for a request: {"name", "model", "generation_config"}"""
+        route = next((candidate for candidate in self.routes
+                      if self.matches(candidate, channel, media_type, prompt_tokens, personas)), {"name": "default"})
+        generation_config = {}
+        if route.get("temperature") is not None:
+            generation_config["temperature"] = route["temperature"]
+        if route.get("max_output_tokens"):
+            generation_config["maxOutputTokens"] = route["max_output_tokens"]
+        if route.get("thinking_budget") is not None:
+            generation_config["thinkingConfig"] = {"thinkingBudget": route["thinking_budget"]}
+        return {"name": route["name"], "model": self.model_for(route), "generation_config": generation_config}
+
+    def apply(self, payload: Dict, route: Dict) -> Dict:
+        """Merge the route's generationConfig into a payload (values the caller set explicitly win)"""
+        if route["generation_config"]:
+            payload["generationConfig"] = {**route["generation_config"], **payload.get("generationConfig", {})}
+        return payload
+
+    def record(self, route: Dict, seconds: float, ok: bool = True):
+        with self._lock:
+            name = route["name"]
+            self._latencies.setdefault(name, deque(maxlen=ROUTE_LATENCY_SAMPLES)).append(seconds)
+            counts = self._counts.setdefault(name, {"requests": 0, "errors": 0})
+            counts["requests"] += 1
+            if not ok:
+                counts["errors"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latency = {}
+            for name, samples in self._latencies.items():
+                ordered = sorted(samples)
+                latency[name] = {
+                    **self._counts[name],
+                    "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1)
+                }
+            return {
+                "enabled": MODEL_ROUTER_ENABLED,
+                "tiers": MODEL_TIERS,
+                "routes": self.routes,
+                "latency": latency
+            }
+
+
+model_router = ModelRouter(load_routes())
@@ -0,0 +1,136 @@
+"""
+Persona Router Module
+Multinomial Naive Bayes over each persona's description, specialties, keywords and example
+queries (personas/*.json), trained in memory at startup and whenever a persona file
+changes. Picks the one or two personas a personal-assistant message is about so the prompt
+only carries their rubrics; returns None when no persona clearly matches (greetings,
+capability questions, broad or mixed queries) and the full multi-persona prompt is used
+"""
+
+import os
+import math
+import threading
+from typing import Optional, Dict, List, Tuple
+
+from memory_index import tokenize
+
+# Configuration
+PERSONA_ROUTER_ENABLED = os.environ.get("PERSONA_ROUTER_ENABLED", "true").lower() == "true"
+PERSONA_ROUTER_MIN_CONFIDENCE = float(os.environ.get("PERSONA_ROUTER_MIN_CONFIDENCE", "0.6"))  # Else full prompt
+PERSONA_ROUTER_SECOND_RATIO = float(os.environ.get("PERSONA_ROUTER_SECOND_RATIO", "0.5"))  # Runner-up kept above this share of the top
+PERSONA_ROUTER_MAX_PERSONAS = 2
+SMOOTHING = 0.1  # Additive smoothing - small, the persona documents are short
+
+
+def stem(token: str) -> str:
+    """Crude suffix stripping so "recipes" / "recipe" and "budgeting" / "budget" share a feature"""
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", "")):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + replacement
+    # "es" only after a sibilant ("dishes", "boxes"), otherwise just the plural "s" ("recipes")
+    if token.endswith("es") and token[:-2].endswith(("s", "x", "z", "ch", "sh")) and len(token) >= 5:
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss") and len(token) >= 4:
+        return token[:-1]
+    return token
+
+
+def features(text: str) -> List[str]:
+    return [stem(token) for token in tokenize(text)]
+
+
+def persona_training_text(persona: Dict) -> str:
+    """What a persona file says it is about (not prompt_template - for some personas that is a
+    long instruction text whose everyday words would pull unrelated messages to them)"""
+    texts = [persona.get("description", "")]
+    texts += persona.get("specialties", []) + persona.get("keywords", [])
+    scenarios = (persona.get("rubric") or {}).get("scenario_examples") or {}
+    texts += [scenario.get("user_query", "") for scenario in scenarios.values() if isinstance(scenario, dict)]
+    return " ".join(text for text in texts if isinstance(text, str))
+
+
+class PersonaRouter:
+    """Naive Bayes persona classifier with a confidence cut-off"""
+
+    def __init__(self):
+        self.signature = None  # Persona files the model was trained on
+        self._log_likelihoods: Dict[str, Dict[str, float]] = {}  # persona -> feature -> log P(feature | persona)
+        self._unseen: Dict[str, float] = {}  # persona -> log P(unseen feature | persona)
+        self._lock = threading.Lock()
+        # Metrics
+        self._routed = 0
+        self._fallbacks = 0
+        self._selected: Dict[str, int] = {}
+
+    def train(self, personas: Dict[str, Dict], signature=None) -> int:
+        """(Re)build the model from persona configs - returns the vocabulary size"""
+        counts = {key: {} for key in personas}
+        vocabulary = set()
+        for key, persona in personas.items():
+            for feature in features(persona_training_text(persona)):
+                counts[key][feature] = counts[key].get(feature, 0) + 1
+                vocabulary.add(feature)
+
+        log_likelihoods, unseen = {}, {}
+        for key, feature_counts in counts.items():
+            denominator = sum(feature_counts.values()) + SMOOTHING * len(vocabulary)
+            log_likelihoods[key] = {feature: math.log((count + SMOOTHING) / denominator)
+                                    for feature, count in feature_counts.items()}
+            unseen[key] = math.log(SMOOTHING / denominator) if denominator else 0.0
+
+        with self._lock:
+            self._log_likelihoods = log_likelihoods
+            self._unseen = unseen
+            self.signature = signature
+        print(f"[SUCCESS] Persona router trained: {len(personas)} personas, {len(vocabulary)} features")
+        return len(vocabulary)
+
+    def classify(self, message: str) -> List[Tuple[str, float]]:
+        """(persona, posterior) pairs, most likely first - empty when the message has no known feature"""
+        with self._lock:
+            log_likelihoods, unseen = self._log_likelihoods, self._unseen
+        known = [feature for feature in features(message)
+                 if any(feature in persona_features for persona_features in log_likelihoods.values())]
+        if not known:
+            return []
+        # Uniform prior - every persona is one document
+        scores = {key: sum(persona_features.get(feature, unseen[key]) for feature in known)
+                  for key, persona_features in log_likelihoods.items()}
+        top = max(scores.values())
+        total = sum(math.exp(score - top) for score in scores.values())
+        posteriors = {key: math.exp(score - top) / total for key, score in scores.items()}
+        return sorted(posteriors.items(), key=lambda item: item[1], reverse=True)
+
+    def route(self, message: str) -> Optional[List[str]]:
+        """The one or two personas to include, or None for the full prompt"""
+        ranked = self.classify(message) if PERSONA_ROUTER_ENABLED else []
+        selected = []
+        if ranked:
+            top_probability = ranked[0][1]
+            selected = [key for key, probability in ranked[:PERSONA_ROUTER_MAX_PERSONAS]
+                        if probability >= PERSONA_ROUTER_SECOND_RATIO * top_probability]
+            confidence = sum(probability for key, probability in ranked if key in selected)
+            if confidence < PERSONA_ROUTER_MIN_CONFIDENCE:
+                selected = []
+        with self._lock:
+            if not selected:
+                self._fallbacks += 1
+                return None
+            self._routed += 1
+            for key in selected:
+                self._selected[key] = self._selected.get(key, 0) + 1
+        return sorted(selected)  # Same set -> same prompt text -> same cache entry
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": PERSONA_ROUTER_ENABLED,
+                "personas": sorted(self._log_likelihoods),
+                "routed": self._routed,
+                "fallbacks": self._fallbacks,
+                "selected": dict(self._selected),
+                "min_confidence": PERSONA_ROUTER_MIN_CONFIDENCE
+            }
+
+
+persona_router = PersonaRouter()
@@ -0,0 +1,119 @@
+"""
+Prompt Assembly Module
+Builds the generateContent body for every conversational endpoint (/chat, the ESP32
+process endpoint, the locket handlers) the same way: the static instructions go out as
+systemInstruction (or the cached prompt), the stored history as alternating user / model
+turns in timestamp order, and only the current message - with the per-request context,
+instructions and media - as the final user turn. Consecutive requests of one user then
+share an identical prefix instead of one re-flattened text block
+"""
+
+import os
+from typing import Optional, Dict, List
+
+from database import load_conversation_page, load_summary, get_relevant_memories_context
+
+# Configuration
+PROMPT_HISTORY_LIMIT = int(os.environ.get("PROMPT_HISTORY_LIMIT", "20"))  # Stored turns replayed per request
+LOCKET_HISTORY_LIMIT = min(10, PROMPT_HISTORY_LIMIT)  # Locket answers are read out - a shorter replay
+
+
+def context_modes(mode: str) -> List[str]:
+    """Modes whose history feeds a request in this mode (personal assistant also sees sustainability)"""
+    return [mode, "sustainability"] if mode == "personal-assistant" else [mode]
+
+
+def load_history(username: str, mode: str, limit: int = PROMPT_HISTORY_LIMIT) -> List[Dict]:
+    """Newest stored turns across the context modes, oldest first (each tagged with its mode)"""
+    messages = []
+    for context_mode in context_modes(mode):
+        # Only the newest page is needed - older turns come from summaries and the memory index
+        page = load_conversation_page(username, context_mode, limit).get("messages") or []
+        messages.extend({**msg, "mode": context_mode} for msg in page)
+    # Stable sort: turns with the same timestamp keep their storage order, so the same
+    # history always produces the same contents
+    messages.sort(key=lambda msg: msg.get("timestamp") or "")
+    return messages[-limit:] if limit else []
+
+
+def history_note(msg: Dict) -> str:
+    note = ""
+    if msg.get("has_media"):
+        note = f" (with {msg.get('media_type') or 'media'})"
+    if msg.get("channel") == "locket":
+        note += " (via camera locket)"
+    return note
+
+
+def append_turn(contents: List[Dict], role: str, parts: List[Dict]):
+    """Add a turn, merging into the previous one when it has the same role (turns must alternate)"""
+    if contents and contents[-1]["role"] == role:
+        previous = contents[-1]["parts"]
+        if previous and parts and "text" in previous[-1] and "text" in parts[0]:
+            previous[-1] = {"text": previous[-1]["text"] + "\n\n" + parts[0]["text"]}
+            parts = parts[1:]
+        previous.extend(parts)
+    else:
+        contents.append({"role": role, "parts": list(parts)})
+
+
+def history_contents(messages: List[Dict]) -> List[Dict]:
+    """Stored turns as user / model contents"""
+    contents = []
+    for msg in messages:
+        user_text = (msg.get("user_message") or "") + history_note(msg)
+        if user_text.strip():
+            append_turn(contents, "user", [{"text": user_text}])
+        if msg.get("bot_response"):
+            append_turn(contents, "model", [{"text": msg["bot_response"]}])
+    return contents
+
+
+def background_context(username: str, mode: str, query: Optional[str], history: List[Dict]) -> str:
+    """Rolling summaries and relevant older memories that fall outside the replayed history"""
+    context = ""
+    summaries = []
+    for summary_mode in context_modes(mode):
+        stored_summary = load_summary(username, summary_mode)
+        if stored_summary and stored_summary.get("summary"):
+            summaries.append((summary_mode, stored_summary["summary"]))
+    if summaries:
+        context += "=== EARLIER CONVERSATION SUMMARY ===\n"
+        context += "Summary of older conversations that are no longer shown in full:\n\n"
+        for summary_mode, summary_text in summaries:
+            context += f"[{summary_mode} mode]\n{summary_text}\n\n"
+        context += "=== END EARLIER CONVERSATION SUMMARY ===\n\n"
+    if query:
+        recent_timestamps = {msg.get("timestamp") for msg in history}
+        context += get_relevant_memories_context(username, query, context_modes(mode), recent_timestamps)
+    return context.strip()
+
+
+def assemble_request(username: str, mode: str, message: str, media_parts: Optional[List[Dict]] = None,
+                     user_block: str = "", history_instructions: str = "", instructions: str = "",
+                     notes: Optional[List[str]] = None, query: Optional[str] = None,
+                     history_limit: int = PROMPT_HISTORY_LIMIT,
+                     generation_config: Optional[Dict] = None) -> Dict:
+    """generateContent payload without the system prompt (add it with prompt_cache.apply)
+
+    The final user turn holds, in this order: user_block, the summaries / relevant memories
+    for query, history_instructions (only when there is history to refer to), instructions,
+    the message itself, notes, then media_parts.
+    """
+    history = load_history(username, mode, history_limit)
+    background = background_context(username, mode, query, history)
+    if history:
+        print(f"[SUCCESS] Using {len(history)} recent messages for context")
+
+    sections = [user_block, background]
+    if history or background:
+        sections.append(history_instructions)
+    sections += [instructions, f"Current user ({username}): {message}"] + (notes or [])
+    turn_text = "\n\n".join(section.strip() for section in sections if section and section.strip())
+
+    contents = history_contents(history)
+    append_turn(contents, "user", [{"text": turn_text}] + (media_parts or []))
+    payload = {"contents": contents}
+    if generation_config:
+        payload["generationConfig"] = generation_config
+    return payload
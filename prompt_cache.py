@@ -0,0 +1,234 @@
+"""
+Prompt Cache Module
+Registers the large static system prompts (the multi-persona block, the locket layer) with
+Gemini's cachedContents API once, and makes requests reference the cache instead of
+re-sending several thousand tokens each time. Entries are keyed by a hash of model + text,
+so editing a persona file produces a new cache; TTLs are extended shortly before they run
+out. Registering and extending happen in a background thread: a request never waits for
+the cachedContents API - until the cache is ready (or after any cache failure) the text is
+sent as systemInstruction.
+
+GEMINI_CONTEXT_CACHE selects the backend: "gemini" (default), "local" (in-process stub for
+tests and offline development) or "off"
+"""
+
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict
+
+from media import gemini_session
+
+# Configuration
+GEMINI_CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE", "gemini").lower()
+PROMPT_CACHE_TTL_SECONDS = int(os.environ.get("PROMPT_CACHE_TTL_SECONDS", "3600"))
+PROMPT_CACHE_REFRESH_SECONDS = int(os.environ.get("PROMPT_CACHE_REFRESH_SECONDS", "300"))  # Extend TTL this close to expiry
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "1024"))  # Gemini rejects smaller caches
+PROMPT_CACHE_RETRY_SECONDS = 300  # After a failed create, send the prompt inline for this long
+DISPLAY_NAME_PREFIX = "rile-prompt-"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class GeminiCacheBackend:
+    """cachedContents REST calls"""
+
+    def __init__(self, api_key: str, base_url: str):
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def find(self, display_name: str) -> Optional[str]:
+        """Name of an existing cache with this display name (e.g. made by another worker)"""
+        page_token = None
+        for _ in range(5):
+            params = {"key": self.api_key, "pageSize": 100}
+            if page_token:
+                params["pageToken"] = page_token
+            response = gemini_session.get(f"{self.base_url}/cachedContents", params=params, timeout=15)
+            response.raise_for_status()
+            data = response.json()
+            for content in data.get("cachedContents", []):
+                if content.get("displayName") == display_name:
+                    return content["name"]
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                break
+        return None
+
+    def create(self, model: str, system_text: str, display_name: str, ttl_seconds: int) -> str:
+        response = gemini_session.post(f"{self.base_url}/cachedContents", params={"key": self.api_key}, json={
+            "model": f"models/{model}",
+            "displayName": display_name,
+            "systemInstruction": {"parts": [{"text": system_text}]},
+            "ttl": f"{ttl_seconds}s"
+        }, timeout=30)
+        response.raise_for_status()
+        return response.json()["name"]
+
+    def refresh(self, name: str, ttl_seconds: int):
+        response = gemini_session.patch(f"{self.base_url}/{name}", params={"key": self.api_key, "updateMask": "ttl"},
+                                        json={"ttl": f"{ttl_seconds}s"}, timeout=15)
+        response.raise_for_status()
+
+
+class LocalCacheBackend:
+    """In-process stand-in for the cachedContents API (tests / offline development)"""
+
+    def __init__(self):
+        self.contents: Dict[str, Dict] = {}  # name -> {"model", "display_name", "text", "expires_at"}
+
+    def find(self, display_name: str) -> Optional[str]:
+        for name, content in self.contents.items():
+            if content["display_name"] == display_name and content["expires_at"] > time.time():
+                return name
+        return None
+
+    def create(self, model: str, system_text: str, display_name: str, ttl_seconds: int) -> str:
+        name = f"cachedContents/local-{len(self.contents) + 1}"
+        self.contents[name] = {"model": model, "display_name": display_name, "text": system_text,
+                               "expires_at": time.time() + ttl_seconds}
+        return name
+
+    def refresh(self, name: str, ttl_seconds: int):
+        if name not in self.contents:
+            raise KeyError(name)
+        self.contents[name]["expires_at"] = time.time() + ttl_seconds
+
+
+class PromptCacheManager:
+    """Maps (model, static prompt) to a live cachedContents name, creating / extending it as needed"""
+
+    def __init__(self, backend=None, ttl_seconds: int = PROMPT_CACHE_TTL_SECONDS,
+                 refresh_seconds: int = PROMPT_CACHE_REFRESH_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[str, Dict] = {}  # key -> {"name", "expires_at", "text"} or {"failed_until"}
+        self._in_flight: Dict[str, Future] = {}  # key -> pending register / refresh
+        self._lock = threading.Lock()  # Guards the tables only - never held across an API call
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prompt-cache")
+        # Metrics
+        self._hits = 0
+        self._creates = 0
+        self._refreshes = 0
+        self._failures = 0
+        self._inline = 0
+
+    def cached_content(self, model: str, system_text: str, wait: bool = False) -> Optional[str]:
+        """cachedContents name for this prompt, or None when it should be sent inline
+
+        A missing or expiring cache is (re)registered in the background; wait=True blocks until
+        that is done (startup warm-up), otherwise the current request goes out inline.
+        """
+        if self.backend is None or estimate_tokens(system_text) < PROMPT_CACHE_MIN_TOKENS:
+            return None
+        key = hashlib.sha256(f"{model}\n{system_text}".encode("utf-8")).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.get("failed_until", 0) > now:
+                return None
+            usable = entry.get("name") if entry and entry.get("expires_at", 0) > now else None
+            if usable and entry["expires_at"] - now > self.refresh_seconds:
+                self._hits += 1
+                return usable
+            # Missing or close to expiry: one background register / refresh per prompt
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._register, key, model, system_text, usable)
+                self._in_flight[key] = future
+            if usable:
+                self._hits += 1  # Still valid while its TTL is being extended
+                return usable
+
+        if wait:
+            return future.result()
+        return None
+
+    def _register(self, key: str, model: str, system_text: str, name: Optional[str]) -> Optional[str]:
+        """Extend an existing cache or find / create one (worker thread, no lock held during API calls)"""
+        refreshed = created = False
+        try:
+            if name:
+                try:
+                    self.backend.refresh(name, self.ttl_seconds)
+                    refreshed = True
+                except Exception:
+                    name = None  # Expired or deleted upstream - register it again
+            if not name:
+                display_name = DISPLAY_NAME_PREFIX + key[:16]
+                name = self.backend.find(display_name)
+                if name:
+                    self.backend.refresh(name, self.ttl_seconds)
+                    refreshed = True
+                else:
+                    name = self.backend.create(model, system_text, display_name, self.ttl_seconds)
+                    created = True
+                    print(f"[PROMPT CACHE] Registered {name} (~{estimate_tokens(system_text)} tokens, "
+                          f"ttl {self.ttl_seconds}s)")
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                self._entries[key] = {"failed_until": time.time() + PROMPT_CACHE_RETRY_SECONDS}
+                self._in_flight.pop(key, None)
+            print(f"[WARNING] Prompt cache unavailable, sending the prompt inline: {e}")
+            return None
+
+        with self._lock:
+            self._refreshes += refreshed
+            self._creates += created
+            self._entries[key] = {"name": name, "expires_at": time.time() + self.ttl_seconds, "text": system_text}
+            self._in_flight.pop(key, None)
+        return name
+
+    def apply(self, payload: Dict, model: str, system_text: str) -> Dict:
+        """Point a generateContent payload at the cached prompt, or carry the prompt as systemInstruction"""
+        name = self.cached_content(model, system_text)
+        if name:
+            payload["cachedContent"] = name
+        else:
+            with self._lock:
+                self._inline += 1
+            payload["systemInstruction"] = {"parts": [{"text": system_text}]}
+        return payload
+
+    def fall_back_inline(self, payload: Dict) -> bool:
+        """The API rejected the payload's cachedContent (expired / deleted upstream): forget it so the
+        next request registers it again, and swap the prompt text into this payload for a retry"""
+        name = payload.get("cachedContent")
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if name and entry.get("name") == name:
+                    del self._entries[key]
+                    payload.pop("cachedContent")
+                    payload["systemInstruction"] = {"parts": [{"text": entry["text"]}]}
+                    self._inline += 1
+                    return True
+        return False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__ if self.backend else None,
+                "entries": sum(1 for entry in self._entries.values() if entry.get("name")),
+                "hits": self._hits,
+                "creates": self._creates,
+                "refreshes": self._refreshes,
+                "failures": self._failures,
+                "inline": self._inline,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+def create_prompt_cache(api_key: str, base_url: str) -> PromptCacheManager:
+    """Manager for the backend selected by GEMINI_CONTEXT_CACHE"""
+    if GEMINI_CONTEXT_CACHE == "off":
+        return PromptCacheManager(None)
+    if GEMINI_CONTEXT_CACHE == "local":
+        return PromptCacheManager(LocalCacheBackend())
+    return PromptCacheManager(GeminiCacheBackend(api_key, base_url))
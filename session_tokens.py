@@ -0,0 +1,111 @@
+"""
+Session Tokens Module
+Stateless signed tokens issued at login and device registration: the username, device ID
+and expiry are carried in the token and signed with HMAC-SHA256, so hot endpoints
+authenticate a request with one hash in memory instead of a storage lookup
+
+Token format: base64url(JSON claims) "." base64url(HMAC-SHA256(secret, claims part))
+Clients send it as `Authorization: Bearer <token>` or as a "token" field
+"""
+
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+from typing import Optional, Dict
+
+# Configuration
+SESSION_TOKEN_TTL_SECONDS = int(os.environ.get("SESSION_TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))  # Web logins
+DEVICE_TOKEN_TTL_SECONDS = int(os.environ.get("DEVICE_TOKEN_TTL_SECONDS", str(30 * 24 * 3600)))  # ESP32 devices
+REQUIRE_SESSION_TOKEN = os.environ.get("REQUIRE_SESSION_TOKEN", "false").lower() == "true"  # Reject bare usernames
+
+_secret = os.environ.get("SESSION_TOKEN_SECRET")
+if _secret:
+    SESSION_TOKEN_SECRET = _secret.encode("utf-8")
+else:
+    # Tokens then only verify in this process and stop working after a restart
+    SESSION_TOKEN_SECRET = secrets.token_bytes(32)
+    print("[WARNING] SESSION_TOKEN_SECRET not set - using a random per-process secret")
+
+
+class SessionTokenError(Exception):
+    """Missing, invalid or mismatched token with the HTTP status to report"""
+
+    def __init__(self, message: str, status_code: int = 401):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_TOKEN_SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_session_token(username: str, device_id: Optional[str] = None,
+                        ttl_seconds: Optional[int] = None) -> Dict:
+    """Signed token for a user (and device) -> {"token", "expires_at"} (expires_at in epoch seconds)"""
+    if ttl_seconds is None:
+        ttl_seconds = DEVICE_TOKEN_TTL_SECONDS if device_id else SESSION_TOKEN_TTL_SECONDS
+    expires_at = int(time.time()) + ttl_seconds
+    claims = {"sub": username, "exp": expires_at}
+    if device_id:
+        claims["dev"] = device_id
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return {"token": f"{payload}.{_sign(payload)}", "expires_at": expires_at}
+
+
+def verify_session_token(token: str) -> Dict:
+    """Check signature and expiry -> {"username", "device_id", "expires_at"}; raises SessionTokenError"""
+    payload, _, signature = (token or "").strip().partition(".")
+    try:
+        valid = bool(payload and signature) and hmac.compare_digest(signature, _sign(payload))
+    except (UnicodeEncodeError, TypeError):
+        valid = False  # Non-ASCII characters - not a token this server issued
+    if not valid:
+        raise SessionTokenError("Invalid session token")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise SessionTokenError("Invalid session token")
+    if int(claims.get("exp", 0)) < time.time():
+        raise SessionTokenError("Session token expired")
+    return {"username": claims.get("sub"), "device_id": claims.get("dev"), "expires_at": claims.get("exp")}
+
+
+def request_token(headers, fields: Optional[Dict] = None) -> Optional[str]:
+    """Token from the Authorization header, else from a "token" request field"""
+    authorization = headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip() or None
+    token = (fields or {}).get("token")
+    return token if isinstance(token, str) and token else None
+
+
+def authenticate_request(headers, fields: Optional[Dict] = None, username: Optional[str] = None,
+                         device_id: Optional[str] = None) -> Optional[Dict]:
+    """Claims of the request's token, checked against the username / device the request names
+
+    Returns None for a request without a token (legacy clients) unless REQUIRE_SESSION_TOKEN
+    is set; a token that is invalid, expired or issued to someone else always raises.
+    """
+    token = request_token(headers, fields)
+    if not token:
+        if REQUIRE_SESSION_TOKEN:
+            raise SessionTokenError("Session token required")
+        return None
+    claims = verify_session_token(token)
+    if username and username != claims["username"]:
+        raise SessionTokenError("Session token was issued to another user", 403)
+    if device_id and device_id != claims["device_id"]:
+        raise SessionTokenError("Session token was issued to another device", 403)
+    return claims
@@ -0,0 +1,306 @@
+"""
+SQLite Storage Module
+Embedded storage backend for single-node deployments without PostgreSQL
+WAL mode (readers never block the writer), the same tables and indexes as the
+PostgreSQL schema, and a bulk import of the files written by the JSON backend
+Enabled by setting SQLITE_DATABASE_PATH; DATABASE_URL still takes precedence
+
+Run `python sqlite_storage.py --import-json` to (re-)import the JSON files into SQLITE_DATABASE_PATH
+"""
+
+import os
+import sys
+import json
+import bisect
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List
+
+# Configuration
+MEMORY_DIR = "memory"
+SQLITE_DATABASE_PATH = os.environ.get("SQLITE_DATABASE_PATH")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Wait for the write lock
+
+# Summaries written before the timestamp cursor: the last folded turn is the count-th one
+BACKFILL_SUMMARIZED_UNTIL = """
+    UPDATE conversation_summaries
+    SET summarized_until = c.timestamp
+    FROM (SELECT username, mode, timestamp,
+                 ROW_NUMBER() OVER (PARTITION BY username, mode ORDER BY timestamp) AS position
+          FROM conversations) c
+    WHERE c.username = conversation_summaries.username AND c.mode = conversation_summaries.mode
+      AND c.position = conversation_summaries.summarized_count
+      AND conversation_summaries.summarized_until IS NULL
+"""
+
+# Schema version is kept in PRAGMA user_version; each entry upgrades to its version
+SCHEMA: List[tuple] = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            username TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            user_message TEXT,
+            bot_response TEXT,
+            has_media INTEGER DEFAULT 0,
+            media_type TEXT,
+            timestamp TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_session_id ON conversations(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_mode ON conversations(mode)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_mode_ts ON conversations(username, mode, timestamp)",
+        """
+        CREATE TABLE IF NOT EXISTS detailed_memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            username TEXT,
+            media_type TEXT,
+            timestamp TEXT,
+            detailed_analysis TEXT,
+            extracted_memory TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_detailed_memories_user_ts ON detailed_memories(username, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_detailed_memories_session_ts ON detailed_memories(session_id, timestamp)",
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_login TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            username TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            summary TEXT,
+            summarized_count INTEGER DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, mode)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS esp32_devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT UNIQUE NOT NULL,
+            username TEXT NOT NULL,
+            device_name TEXT,
+            mac_address TEXT,
+            registered_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_seen TEXT,
+            is_active INTEGER DEFAULT 1
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_device_username ON esp32_devices(username)"
+    ]),
+    (2, [
+        "ALTER TABLE conversations ADD COLUMN channel TEXT NOT NULL DEFAULT 'chat'"
+    ]),
+    (3, [
+        "ALTER TABLE conversation_summaries ADD COLUMN summarized_until TEXT",
+        BACKFILL_SUMMARIZED_UNTIL
+    ]),
+    (4, [
+        # Memories of one mode were found through a session_id subquery over conversations
+        "ALTER TABLE detailed_memories ADD COLUMN mode TEXT",
+        """
+        UPDATE detailed_memories
+        SET mode = (SELECT c.mode FROM conversations c
+                    WHERE c.username = detailed_memories.username AND c.session_id = detailed_memories.session_id
+                    ORDER BY c.timestamp DESC LIMIT 1)
+        WHERE mode IS NULL
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_detailed_memories_user_mode_ts ON detailed_memories(username, mode, timestamp)"
+    ])
+]
+
+
+SCHEMA_VERSION = SCHEMA[-1][0]
+
+# SQLite connections must stay on the thread that opened them
+_local = threading.local()
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Open a connection in autocommit mode - write transactions are opened explicitly"""
+    conn = sqlite3.connect(path or SQLITE_DATABASE_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                           isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints, safe against corruption in WAL mode
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def sqlite_connection() -> sqlite3.Connection:
+    """This thread's connection, opened on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect()
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def sqlite_transaction():
+    """with sqlite_transaction() as conn: ... - BEGIN IMMEDIATE takes the write lock up front,
+    so a read-modify-write never fails halfway with SQLITE_BUSY"""
+    conn = sqlite_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def init_sqlite() -> int:
+    """Create / upgrade the schema; a brand-new database is filled from the JSON files"""
+    os.makedirs(os.path.dirname(SQLITE_DATABASE_PATH) or ".", exist_ok=True)
+    conn = sqlite_connection()
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for version, statements in SCHEMA:
+        if version <= current:
+            continue
+        with sqlite_transaction():
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        print(f"[SUCCESS] Applied SQLite schema version {version}")
+
+    if current == 0:
+        counts = import_json_storage()
+        if any(counts.values()):
+            print(f"[SUCCESS] Imported JSON storage into SQLite: {counts}")
+    return SCHEMA_VERSION
+
+
+# ==================== JSON IMPORT ====================
+
+def _read_json(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[WARNING] Skipping unreadable JSON file {path}: {e}")
+        return None
+
+
+def _memory_session_ids(messages: List[Dict], memories: List[Dict]) -> List[str]:
+    """The JSON files don't store a session per detailed memory - take it from the media
+    turn that saved it (the first media message at or after the memory's timestamp)"""
+    media_messages = [msg for msg in messages if msg.get("has_media")]
+    timestamps = [msg.get("timestamp") or "" for msg in media_messages]
+    session_ids = []
+    for memory in memories:
+        index = bisect.bisect_left(timestamps, memory.get("timestamp") or "")
+        if index < len(media_messages):
+            session_ids.append(media_messages[index].get("session_id") or "json-import")
+        else:
+            session_ids.append(memory.get("session_id") or "json-import")
+    return session_ids
+
+
+def import_json_storage(memory_dir: str = MEMORY_DIR) -> Dict[str, int]:
+    """Bulk-copy users, devices, summaries and conversation files into SQLite (one transaction)
+
+    A user/mode that already has conversations in SQLite is skipped, so running the
+    import again only adds what is missing.
+    """
+    counts = {"users": 0, "devices": 0, "summaries": 0, "conversations": 0, "detailed_memories": 0, "skipped": 0}
+
+    with sqlite_transaction() as conn:
+        users = _read_json(os.path.join(memory_dir, "users.json"))
+        if users:
+            cursor = conn.executemany("""
+                INSERT OR IGNORE INTO users (username, password_hash, created_at, last_login)
+                VALUES (?, ?, ?, ?)
+            """, [(username, user.get("password_hash"), user.get("created_at"), user.get("last_login"))
+                  for username, user in users.items() if user.get("password_hash")])
+            counts["users"] = cursor.rowcount
+
+        devices = _read_json(os.path.join(memory_dir, "devices.json"))
+        if devices:
+            cursor = conn.executemany("""
+                INSERT OR IGNORE INTO esp32_devices
+                (device_id, username, device_name, mac_address, registered_at, last_seen, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(device_id, device.get("username"), device.get("device_name"), device.get("mac_address"),
+                   device.get("registered_at"), device.get("last_seen"), 1 if device.get("is_active", True) else 0)
+                  for device_id, device in devices.items() if device.get("username")])
+            counts["devices"] = cursor.rowcount
+
+        summaries_dir = os.path.join(memory_dir, "summaries")
+        if os.path.isdir(summaries_dir):
+            for filename in sorted(os.listdir(summaries_dir)):
+                if not filename.endswith(".json"):
+                    continue
+                summaries = _read_json(os.path.join(summaries_dir, filename)) or {}
+                username = filename[:-len(".json")]
+                for mode, summary in summaries.items():
+                    cursor = conn.execute("""
+                        INSERT OR IGNORE INTO conversation_summaries
+                        (username, mode, summary, summarized_count, summarized_until, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (username, mode, summary.get("summary"), summary.get("summarized_count", 0),
+                          summary.get("summarized_until"), summary.get("updated_at")))
+                    counts["summaries"] += cursor.rowcount
+
+        for subdir, mode in (("sustainability", "sustainability"), ("personal_assistant", "personal-assistant")):
+            mode_dir = os.path.join(memory_dir, subdir)
+            if not os.path.isdir(mode_dir):
+                continue
+            for filename in sorted(os.listdir(mode_dir)):
+                if not filename.endswith(".json"):
+                    continue
+                username = filename[:-len(".json")]
+                if conn.execute("SELECT 1 FROM conversations WHERE username = ? AND mode = ? LIMIT 1",
+                                (username, mode)).fetchone():
+                    continue
+                data = _read_json(os.path.join(mode_dir, filename)) or {}
+                messages = data.get("messages", []) or []
+                turns = [msg for msg in messages if "user_message" in msg or "bot_response" in msg]
+                counts["skipped"] += len(messages) - len(turns)
+                conn.executemany("""
+                    INSERT INTO conversations
+                    (session_id, username, mode, user_message, bot_response, has_media, media_type, timestamp, channel)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(msg.get("session_id") or "json-import", username, mode, msg.get("user_message"),
+                       msg.get("bot_response"), 1 if msg.get("has_media") else 0, msg.get("media_type"),
+                       msg.get("timestamp") or "", msg.get("channel") or "chat") for msg in turns])
+                counts["conversations"] += len(turns)
+
+                memories = data.get("detailed_memories", []) or []
+                conn.executemany("""
+                    INSERT INTO detailed_memories
+                    (session_id, username, mode, media_type, timestamp, detailed_analysis, extracted_memory)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [(session_id, username, mode, memory.get("media_type"), memory.get("timestamp"),
+                       memory.get("detailed_analysis"), json.dumps(memory.get("extracted_memory") or {}))
+                      for memory, session_id in zip(memories, _memory_session_ids(turns, memories))])
+                counts["detailed_memories"] += len(memories)
+
+        conn.execute(BACKFILL_SUMMARIZED_UNTIL)
+
+    return counts
+
+
+if __name__ == "__main__":
+    if not SQLITE_DATABASE_PATH:
+        print("[ERROR] Set SQLITE_DATABASE_PATH")
+        sys.exit(1)
+    print(f"[INFO] SQLite schema version: {init_sqlite()}")
+    if "--import-json" in sys.argv:
+        print(f"[SUCCESS] Imported: {import_json_storage()}")
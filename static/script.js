@@ -57,6 +57,8 @@ const removeCornerMediaBtn = document.getElementById('remove-corner-media');
 
 let currentUsername = '';
 let sessionId = localStorage.getItem('sdg_session_id') || generateSessionId();
+// Signed session token from login / registration: { token, username, expiresAt }
+let sessionToken = JSON.parse(localStorage.getItem('sdg_session_token') || 'null');
 let cameraStream = null;
 let isCameraOn = false;
 
@@ -623,6 +625,104 @@ function showRecordingUI(mediaRecorder, stream, getVideoData) {
     };
 }
 
+const CHUNKED_UPLOAD_THRESHOLD = 4 * 1024 * 1024; // Larger videos use the resumable upload API
+const CHUNK_UPLOAD_RETRIES = 5;
+
+// Build a multipart /chat request: text fields plus the media blob as a binary file part
+function buildChatFormData(fields, mediaType, blob) {
+    const formData = new FormData();
+    Object.entries(fields).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) formData.append(key, value);
+    });
+    if (blob && (mediaType === 'image' || mediaType === 'video')) {
+        const extension = (blob.type.split('/')[1] || 'bin').split(';')[0];
+        formData.append(mediaType, blob, `${mediaType}.${extension}`);
+    }
+    return formData;
+}
+
+async function sha256Hex(buffer) {
+    if (!window.crypto || !crypto.subtle) return null; // Only available on HTTPS / localhost
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Resumable upload: init, send chunks from the server's offset (resuming after drops), then finalize
+async function uploadChatMediaInChunks(fields, blob) {
+    const initRes = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', ...authHeaders(fields.username) },
+        body: JSON.stringify({ target: 'chat', size: blob.size, mime_type: blob.type, username: fields.username })
+    });
+    const upload = await initRes.json();
+    if (!initRes.ok) throw new Error(upload.error || 'Could not start upload');
+
+    let offset = 0;
+    let failures = 0;
+    while (offset < blob.size) {
+        const buffer = await blob.slice(offset, offset + upload.chunk_size).arrayBuffer();
+        const headers = { 'Content-Type': 'application/octet-stream' };
+        const checksum = await sha256Hex(buffer);
+        if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+        let status = null;
+        try {
+            const res = await fetch(`/api/uploads/${upload.upload_id}?offset=${offset}`, { method: 'PUT', headers, body: buffer });
+            status = await res.json();
+            if (res.ok) {
+                failures = 0;
+                offset = status.offset;
+                continue;
+            }
+        } catch (error) {
+            console.warn('Chunk upload interrupted, resuming:', error);
+        }
+
+        if (++failures > CHUNK_UPLOAD_RETRIES) throw new Error((status && status.error) || 'Upload failed');
+        if (status && typeof status.offset === 'number') {
+            offset = status.offset; // Server told us where to resume
+        } else {
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const res = await fetch(`/api/uploads/${upload.upload_id}`).catch(() => null);
+            if (res && res.ok) offset = (await res.json()).offset;
+        }
+    }
+
+    const res = await fetch(`/api/uploads/${upload.upload_id}/finalize`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(fields)
+    });
+    return res.json();
+}
+
+function storeSessionToken(data) {
+    if (!data.token) return;
+    sessionToken = { token: data.token, username: data.username, expiresAt: data.expires_at };
+    localStorage.setItem('sdg_session_token', JSON.stringify(sessionToken));
+}
+
+// Authorization header for requests made as this user (none if the token belongs to someone else or expired)
+function authHeaders(username) {
+    if (!sessionToken || sessionToken.username !== username || sessionToken.expiresAt * 1000 < Date.now()) return {};
+    return { 'Authorization': `Bearer ${sessionToken.token}` };
+}
+
+// Send a chat message with optional media (a data URL) and return the parsed reply
+async function postChat(fields, mediaType, mediaData) {
+    const blob = mediaData ? await (await fetch(mediaData)).blob() : null;
+    if (blob && mediaType === 'video' && blob.size >= CHUNKED_UPLOAD_THRESHOLD) {
+        return uploadChatMediaInChunks(fields, blob);
+    }
+    // Media goes up as a multipart file part instead of a base64 string inside JSON
+    const res = await fetch('/chat', {
+        method: 'POST',
+        headers: authHeaders(fields.username),
+        body: buildChatFormData(fields, mediaType, blob)
+    });
+    return res.json();
+}
+
 // Send video to Gemini
 async function sendVideoToGemini(videoData) {
     console.log('Sending video to Gemini...');
@@ -640,20 +740,13 @@ async function sendVideoToGemini(videoData) {
         // Get optional video context
         const contextValue = (videoContextInput && videoContextWrap && videoContextWrap.style.display !== 'none') ? (videoContextInput.value || '') : '';
         
-        const response = await fetch('/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                message: "Please analyze this video and provide insights related to sustainability, ethics, or environmental topics.",
-                username: currentUsername,
-                session_id: sessionId,
-                video: videoData,
-                video_context: contextValue,
-                mode: isPersonalAssistantMode ? 'personal-assistant' : 'sustainability'
-            })
-        });
-        
-        const data = await response.json();
+        const data = await postChat({
+            message: "Please analyze this video and provide insights related to sustainability, ethics, or environmental topics.",
+            username: currentUsername,
+            session_id: sessionId,
+            video_context: contextValue,
+            mode: isPersonalAssistantMode ? 'personal-assistant' : 'sustainability'
+        }, 'video', videoData);
         
         // Remove typing indicator
         chatWindow.removeChild(typingDiv);
@@ -1123,6 +1216,131 @@ function goBackToMain() {
     console.log('Returned to main page');
 }
 
+// Conversation history is loaded one page at a time (newest first) and older
+// pages are fetched when the user scrolls to the top of the chat window
+const HISTORY_PAGE_SIZE = 30;
+const HISTORY_MODES = ['sustainability', 'personal-assistant'];
+let historyState = null;
+let historyLoading = false;
+
+function resetHistoryState(username) {
+    historyState = { username, modes: {} };
+    HISTORY_MODES.forEach(mode => {
+        historyState.modes[mode] = { cursor: null, hasMore: true, buffer: [] };
+    });
+}
+
+async function fetchHistoryPage(mode) {
+    const modeState = historyState.modes[mode];
+    let url = `/conversation/${mode}/${historyState.username}?limit=${HISTORY_PAGE_SIZE}`;
+    if (modeState.cursor) {
+        url += `&before=${encodeURIComponent(modeState.cursor)}`;
+    }
+    try {
+        const response = await fetch(url);
+        const data = await response.json();
+        const messages = (data.messages || []).map(msg => ({ ...msg, mode }));
+        modeState.buffer.push(...messages);
+        modeState.hasMore = Boolean(data.has_more);
+        modeState.cursor = data.next_cursor || (messages.length ? messages[messages.length - 1].timestamp : modeState.cursor);
+        console.log(`Loaded ${messages.length} messages from ${mode} mode`);
+    } catch (error) {
+        console.log(`Error loading ${mode} history page:`, error);
+        modeState.hasMore = false;
+    }
+}
+
+// Messages from both modes can only be shown down to the oldest timestamp
+// that every mode with more pages has already reached
+function takeRenderableHistory() {
+    let boundary = null;
+    HISTORY_MODES.forEach(mode => {
+        const modeState = historyState.modes[mode];
+        if (modeState.hasMore && modeState.cursor && (!boundary || modeState.cursor > boundary)) {
+            boundary = modeState.cursor;
+        }
+    });
+    
+    const renderable = [];
+    HISTORY_MODES.forEach(mode => {
+        const modeState = historyState.modes[mode];
+        const keep = [];
+        modeState.buffer.forEach(msg => {
+            if (!boundary || (msg.timestamp || '') >= boundary) {
+                renderable.push(msg);
+            } else {
+                keep.push(msg);
+            }
+        });
+        modeState.buffer = keep;
+    });
+    renderable.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
+    return renderable;
+}
+
+function renderHistoryMessages(messages, prepend) {
+    const firstExisting = prepend ? chatWindow.firstChild : null;
+    const previousCount = chatWindow.children.length;
+    const previousHeight = chatWindow.scrollHeight;
+    const previousTop = chatWindow.scrollTop;
+    
+    messages.forEach(msg => {
+        // Check if this is a locket message (channel column, or the legacy flag)
+        const isLocket = msg.channel === 'locket' || msg.locket === true;
+        const mediaType = msg.media_type || null;
+        
+        // Handle different message formats
+        // Format 1: Regular chat (user_message + bot_response)
+        if (msg.user_message) {
+            appendMessage('user', msg.user_message, false, isLocket, mediaType);
+            if (msg.bot_response) {
+                appendMessage('bot', msg.bot_response, false, isLocket, null);
+            }
+        }
+        // Format 2: Locket messages (role + content)
+        else if (msg.role === 'user' && msg.content) {
+            appendMessage('user', msg.content, false, isLocket, mediaType);
+        } else if (msg.role === 'assistant' && msg.content) {
+            appendMessage('bot', msg.content, false, isLocket, null);
+        }
+    });
+    
+    if (prepend && firstExisting) {
+        // appendMessage adds to the bottom - move the new nodes above the existing ones
+        const added = Array.from(chatWindow.children).slice(previousCount);
+        added.forEach(node => chatWindow.insertBefore(node, firstExisting));
+        chatWindow.scrollTop = chatWindow.scrollHeight - previousHeight + previousTop;
+    }
+}
+
+async function loadOlderHistory() {
+    if (!historyState || historyLoading) {
+        return;
+    }
+    historyLoading = true;
+    try {
+        let renderable = [];
+        while (renderable.length === 0 && HISTORY_MODES.some(mode => historyState.modes[mode].hasMore)) {
+            // Fetch the mode that limits how far back we can render
+            const pending = HISTORY_MODES.filter(mode => historyState.modes[mode].hasMore);
+            pending.sort((a, b) => (historyState.modes[b].cursor || '').localeCompare(historyState.modes[a].cursor || ''));
+            await fetchHistoryPage(pending[0]);
+            renderable = takeRenderableHistory();
+        }
+        if (renderable.length > 0) {
+            renderHistoryMessages(renderable, true);
+        }
+    } finally {
+        historyLoading = false;
+    }
+}
+
+chatWindow.addEventListener('scroll', () => {
+    if (chatWindow.scrollTop < 80) {
+        loadOlderHistory();
+    }
+});
+
 async function loadConversationHistory() {
     try {
         // Use authenticated username instead of session ID
@@ -1134,55 +1352,20 @@ async function loadConversationHistory() {
             return;
         }
         
-        // Load conversations from both modes for this user
-        const [sustainabilityResponse, personalAssistantResponse] = await Promise.all([
-            fetch(`/conversation/sustainability/${userForHistory}`).catch(() => ({ json: () => ({ messages: [] }) })),
-            fetch(`/conversation/personal-assistant/${userForHistory}`).catch(() => ({ json: () => ({ messages: [] }) }))
-        ]);
-        
-        const sustainabilityData = await sustainabilityResponse.json();
-        const personalAssistantData = await personalAssistantResponse.json();
-        
-        // Combine all messages from both modes
-        const allMessages = [];
-        
-        if (sustainabilityData.messages && sustainabilityData.messages.length > 0) {
-            allMessages.push(...sustainabilityData.messages.map(msg => ({ ...msg, mode: 'sustainability' })));
-            console.log(`Loaded ${sustainabilityData.messages.length} messages from sustainability mode`);
+        // Load the newest page of both modes for this user
+        resetHistoryState(userForHistory);
+        historyLoading = true;
+        try {
+            await Promise.all(HISTORY_MODES.map(mode => fetchHistoryPage(mode)));
+        } finally {
+            historyLoading = false;
         }
         
-        if (personalAssistantData.messages && personalAssistantData.messages.length > 0) {
-            allMessages.push(...personalAssistantData.messages.map(msg => ({ ...msg, mode: 'personal-assistant' })));
-            console.log(`Loaded ${personalAssistantData.messages.length} messages from personal-assistant mode`);
-        }
+        const messages = takeRenderableHistory();
         
-        if (allMessages.length > 0) {
-            // Sort messages by timestamp to get chronological order
-            allMessages.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
-            
-            console.log(`Displaying ${allMessages.length} messages in chronological order`);
-            
-            // Display all messages in chronological order
-            allMessages.forEach((msg, index) => {
-                // Check if this is a locket message
-                const isLocket = msg.locket === true;
-                const mediaType = msg.media_type || null;
-                
-                // Handle different message formats
-                // Format 1: Regular chat (user_message + bot_response)
-                if (msg.user_message) {
-                    appendMessage('user', msg.user_message, false, isLocket, mediaType);
-                    if (msg.bot_response) {
-                        appendMessage('bot', msg.bot_response, false, isLocket, null);
-                    }
-                }
-                // Format 2: Locket messages (role + content)
-                else if (msg.role === 'user' && msg.content) {
-                    appendMessage('user', msg.content, false, isLocket, mediaType);
-                } else if (msg.role === 'assistant' && msg.content) {
-                    appendMessage('bot', msg.content, false, isLocket, null);
-                }
-            });
+        if (messages.length > 0) {
+            console.log(`Displaying ${messages.length} messages in chronological order`);
+            renderHistoryMessages(messages, false);
             return true; // Found conversation history
         } else {
             console.log('No previous conversation history found');
@@ -1675,25 +1858,12 @@ chatForm.addEventListener('submit', async (e) => {
             sessionId
         });
         
-        // Add media data if available
-        if (currentMediaData) {
-            if (currentMediaType === 'image') {
-                requestData.image = currentMediaData;
-            } else if (currentMediaType === 'video') {
-                requestData.video = currentMediaData;
-                // Include optional video context if provided
-                if (videoContextInput && videoContextWrap && videoContextWrap.style.display !== 'none' && videoContextInput.value.trim()) {
-                    requestData.video_context = videoContextInput.value.trim();
-                }
-            }
+        // Include optional video context if provided
+        if (currentMediaData && currentMediaType === 'video' && videoContextInput && videoContextWrap && videoContextWrap.style.display !== 'none' && videoContextInput.value.trim()) {
+            requestData.video_context = videoContextInput.value.trim();
         }
         
-        const res = await fetch('/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(requestData)
-        });
-        const data = await res.json();
+        const data = await postChat(requestData, currentMediaType, currentMediaData);
         
         // Remove typing indicator
         chatWindow.removeChild(typingDiv);
@@ -2308,6 +2478,7 @@ loginBtn.addEventListener('click', async () => {
         
         if (response.ok && data.success) {
             authenticatedUsername = data.username;
+            storeSessionToken(data);
             showAuthMessage(authMessage, 'Login successful! Redirecting...', 'success');
             
             // Wait a moment then show welcome screen
@@ -2377,6 +2548,7 @@ registerBtn.addEventListener('click', async () => {
         
         if (response.ok && data.success) {
             authenticatedUsername = data.username;
+            storeSessionToken(data);
             showAuthMessage(registerMessage, 'Account created successfully! Redirecting...', 'success');
             
             // Wait a moment then show welcome screen
@@ -2463,6 +2635,8 @@ if (locketStatus) {
     locketStatus.addEventListener('click', () => {
         // Store username for locket control page
         sessionStorage.setItem('username', authenticatedUsername);
+        const headers = authHeaders(authenticatedUsername);
+        if (headers.Authorization) sessionStorage.setItem('session_token', sessionToken.token);
         window.open('/locket-control', '_blank');
     });
 }
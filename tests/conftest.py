@@ -0,0 +1,116 @@
+"""
+Shared test setup: a scratch working directory (the app keeps its data under ./memory),
+local stand-ins for the Gemini context cache and File API, and a fake Gemini transport so
+no test touches the network
+"""
+
+import os
+import sys
+import json
+import uuid
+import tempfile
+
+import pytest
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+os.environ["GEMINI_CONTEXT_CACHE"] = "local"
+os.environ["GEMINI_FILE_API"] = "local"
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("SQLITE_DATABASE_PATH", None)
+
+# Modules resolve memory/, templates/, static/ and personas/ against the working directory
+WORK_DIR = tempfile.mkdtemp(prefix="rile-tests-")
+for name in ("templates", "static", "personas"):
+    os.symlink(os.path.join(REPO_DIR, name), os.path.join(WORK_DIR, name))
+os.chdir(WORK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+# The user directory flushes logins at exit, when the working directory may be back in the repo
+from user_directory import user_directory  # noqa: E402
+user_directory.path = os.path.join(WORK_DIR, user_directory.path)
+
+
+def _decode_body(data) -> dict:
+    """JSON payload of a streamed request body (post_gemini sends an iterable of chunks)"""
+    if not isinstance(data, (bytes, str)):
+        data = b"".join(iter(data))
+    return json.loads(data)
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+        self.text = json.dumps(data)
+        self.headers = {}
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}: {self.text}")
+
+    def close(self):
+        pass
+
+
+class FakeGemini:
+    """Records generateContent calls and answers with `reply` (or `handler(url, payload)`)"""
+
+    def __init__(self):
+        self.calls = []
+        self.reply = "Test reply"
+        self.handler = None
+
+    def post(self, url, json=None, data=None, **kwargs):
+        payload = json if json is not None or data is None else _decode_body(data)
+        self.calls.append((url, payload))
+        if self.handler:
+            return self.handler(url, payload)
+        return FakeResponse({"candidates": [{"content": {"parts": [{"text": self.reply}]}}]})
+
+    def generate_calls(self):
+        return [payload for url, payload in self.calls if "generateContent" in url]
+
+
+@pytest.fixture(autouse=True)
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(requests, "post", lambda url, **kwargs: fake.post(url, **kwargs))
+    monkeypatch.setattr(requests.Session, "post", lambda self, url, **kwargs: fake.post(url, **kwargs))
+    monkeypatch.setattr(requests.Session, "head", lambda self, url, **kwargs: FakeResponse({}, 404))
+    return fake
+
+
+@pytest.fixture
+def username():
+    """A fresh user per test - the in-process indexes and caches are keyed by username"""
+    return f"user-{uuid.uuid4().hex[:10]}"
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh SQLite database in an empty working directory (nothing to import)"""
+    import database
+    import sqlite_storage
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sqlite_storage, "SQLITE_DATABASE_PATH", str(tmp_path / "data" / "assistant.db"))
+    monkeypatch.setattr(sqlite_storage, "_local", type(sqlite_storage._local)())
+    monkeypatch.setattr(database, "USE_SQLITE", True)
+    sqlite_storage.init_sqlite()
+    yield tmp_path
+    sqlite_storage.sqlite_connection().close()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    import app
+
+    with TestClient(app.app) as test_client:
+        yield test_client
@@ -0,0 +1,43 @@
+import gzip
+import re
+
+import assets
+
+
+def test_template_links_content_hashed_assets(client):
+    page = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert page.status_code == 200
+    assert page.headers["Cache-Control"] == "no-cache"
+    urls = re.findall(r'/assets/[\w./-]+\.(?:js|css)', page.text)
+    assert urls
+
+    asset = client.get(urls[0], headers={"Accept-Encoding": "identity"})
+    assert asset.status_code == 200
+    assert asset.headers["Cache-Control"] == assets.IMMUTABLE_CACHE_CONTROL
+
+
+def test_stale_or_unknown_hashes_are_not_served(client):
+    assert client.get("/assets/script.000000000000.js").status_code == 404
+    assert client.get("/assets/../app.py").status_code == 404
+
+
+def test_precompressed_variant_matches_the_file():
+    asset = assets.get_template("index.html")
+    encoding, body, etag = asset.negotiate("gzip, deflate")
+    assert encoding == "gzip"
+    assert gzip.decompress(body) == asset.variants["identity"]
+    assert etag.endswith('-gzip"')
+    assert asset.negotiate(None)[0] == "identity"
+
+
+def test_template_revalidates_with_etag(client):
+    page = client.get("/register-device")
+    assert client.get("/register-device", headers={"If-None-Match": page.headers["ETag"]}).status_code == 304
+
+
+def test_missing_template_answers_404(client, monkeypatch):
+    monkeypatch.setattr(assets, "TEMPLATES_DIR", "missing-templates")
+    monkeypatch.setattr(assets, "_templates", {})
+    response = client.get("/")
+    assert response.status_code == 404
+    assert "error" in response.json()
@@ -0,0 +1,61 @@
+import base64
+import os
+
+
+def media_parts(gemini):
+    """inline_data / file_data parts of the last chat request"""
+    payload = gemini.generate_calls()[0]
+    return [part for part in payload["contents"][-1]["parts"] if "text" not in part]
+
+
+def test_multipart_video_is_streamed_inline(client, gemini, username):
+    clip = os.urandom(4096)
+    response = client.post("/chat", data={"message": "what is this?", "username": username,
+                                          "mode": "personal-assistant"},
+                           files={"video": ("clip.webm", clip, "video/webm")})
+    assert response.status_code == 200
+    assert response.json()["reply"] == gemini.reply
+
+    [part] = media_parts(gemini)
+    assert part["inline_data"]["mime_type"] == "video/webm"
+    assert base64.b64decode(part["inline_data"]["data"]) == clip
+
+
+def test_raw_binary_body_with_fields_in_query(client, gemini, username):
+    clip = os.urandom(2048)
+    response = client.post("/chat", params={"message": "and this?", "username": username},
+                           content=clip, headers={"Content-Type": "video/mp4"})
+    assert response.status_code == 200
+    [part] = media_parts(gemini)
+    assert base64.b64decode(part["inline_data"]["data"]) == clip
+
+
+def test_json_data_url_still_accepted(client, gemini, username):
+    clip = os.urandom(1024)
+    data_url = "data:video/webm;base64," + base64.b64encode(clip).decode()
+    response = client.post("/chat", json={"message": "hi", "username": username, "video": data_url})
+    assert response.status_code == 200
+    [part] = media_parts(gemini)
+    assert base64.b64decode(part["inline_data"]["data"]) == clip
+
+
+def test_text_only_chat_has_no_media(client, gemini, username):
+    client.post("/chat", json={"message": "hello", "username": username})
+    assert media_parts(gemini) == []
+
+
+def test_wrapped_data_url_is_sent_without_line_breaks(client, gemini, username):
+    clip = os.urandom(300)
+    encoded = base64.b64encode(clip).decode()
+    data_url = "data:video/webm;base64," + "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    client.post("/chat", json={"message": "hi", "username": username, "video": data_url})
+    [part] = media_parts(gemini)
+    assert part["inline_data"]["data"] == encoded
+
+
+def test_malformed_data_url_is_dropped(client, gemini, username):
+    # Not base64 - and would otherwise be spliced into the request JSON verbatim
+    data_url = 'data:video/webm;base64,AAAA"}],"x":"'
+    response = client.post("/chat", json={"message": "hi", "username": username, "video": data_url})
+    assert response.status_code == 200
+    assert media_parts(gemini) == []
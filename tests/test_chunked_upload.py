@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import os
+
+import pytest
+
+import chunked_upload
+
+
+def start(client, data, **fields):
+    response = client.post("/api/uploads", json={"target": "chat", "size": len(data), "mime_type": "video/mp4",
+                                                 **fields})
+    assert response.status_code == 201
+    return response.json()["upload_id"]
+
+
+def test_upload_resumes_from_reported_offset(client, gemini, username):
+    data = os.urandom(300_000)
+    upload_id = start(client, data, username=username, sha256=hashlib.sha256(data).hexdigest())
+
+    first = client.put(f"/api/uploads/{upload_id}?offset=0", content=data[:100_000],
+                       headers={"X-Chunk-SHA256": hashlib.sha256(data[:100_000]).hexdigest()})
+    assert first.json()["offset"] == 100_000
+
+    # A retried chunk is rejected with the offset to resume from
+    duplicate = client.put(f"/api/uploads/{upload_id}?offset=0", content=data[:100_000])
+    assert duplicate.status_code == 409
+    assert duplicate.json()["offset"] == 100_000
+    assert client.get(f"/api/uploads/{upload_id}").json()["offset"] == 100_000
+
+    client.put(f"/api/uploads/{upload_id}?offset=100000", content=data[100_000:])
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={"message": "what is in the clip?"})
+    assert response.status_code == 200
+    assert response.json()["reply"] == gemini.reply
+
+    parts = gemini.generate_calls()[0]["contents"][-1]["parts"]
+    [media] = [part for part in parts if "inline_data" in part]
+    assert base64.b64decode(media["inline_data"]["data"]) == data
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+
+
+def test_corrupted_chunk_is_rejected(client):
+    upload_id = start(client, b"x" * 10)
+    response = client.put(f"/api/uploads/{upload_id}?offset=0", content=b"x" * 10,
+                          headers={"X-Chunk-SHA256": "00"})
+    assert response.status_code == 422
+    assert response.json()["offset"] == 0
+
+
+def test_incomplete_upload_cannot_be_finalized(client):
+    upload_id = start(client, b"x" * 10)
+    client.put(f"/api/uploads/{upload_id}?offset=0", content=b"x" * 4)
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={})
+    assert response.status_code == 409
+    assert response.json()["offset"] == 4
+
+
+def test_checksum_mismatch_discards_the_upload(client):
+    upload_id = start(client, b"x" * 10, sha256=hashlib.sha256(b"y" * 10).hexdigest())
+    client.put(f"/api/uploads/{upload_id}?offset=0", content=b"x" * 10)
+    assert client.post(f"/api/uploads/{upload_id}/finalize", json={}).status_code == 422
+    assert client.get(f"/api/uploads/{upload_id}").status_code == 404
+
+
+def test_malformed_finalize_body_answers_400_and_keeps_the_upload(client):
+    upload_id = start(client, b"x" * 10)
+    client.put(f"/api/uploads/{upload_id}?offset=0", content=b"x" * 10)
+
+    response = client.post(f"/api/uploads/{upload_id}/finalize", content=b"{not json",
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert client.post(f"/api/uploads/{upload_id}/finalize", content=b"[1, 2]").status_code == 400
+    assert client.get(f"/api/uploads/{upload_id}").json()["complete"] is True
+
+
+def test_esp32_upload_must_be_json(client):
+    response = client.post("/api/uploads", json={"target": "esp32", "size": 5, "mime_type": "application/json",
+                                                 "device_id": "cam-1"})
+    upload_id = response.json()["upload_id"]
+    client.put(f"/api/uploads/{upload_id}?offset=0", content=b"nope!")
+    assert client.post(f"/api/uploads/{upload_id}/finalize").status_code == 400
+
+
+@pytest.mark.parametrize("fields, status", [
+    ({"target": "elsewhere", "size": 10}, 400),
+    ({"size": 0}, 400),
+    ({"size": chunked_upload.CHUNKED_UPLOAD_MAX_BYTES + 1}, 413),
+])
+def test_invalid_uploads_are_refused(client, fields, status):
+    assert client.post("/api/uploads", json=fields).status_code == status
+
+
+def test_expired_uploads_are_cleaned_up(monkeypatch):
+    upload = chunked_upload.create_upload("chat", 10, "video/mp4")
+    monkeypatch.setattr(upload, "updated_at", 0)
+    chunked_upload.cleanup_expired_uploads()
+    assert not os.path.exists(upload.path)
+    with pytest.raises(chunked_upload.UploadError):
+        chunked_upload.get_upload(upload.upload_id)
+
+
+def test_esp32_upload_needs_a_device(client):
+    response = client.post("/api/uploads", json={"target": "esp32", "size": 5, "mime_type": "application/json"})
+    assert response.status_code == 400
+
+
+def test_esp32_upload_is_stored_for_the_tokens_device(client, monkeypatch):
+    import app
+    from session_tokens import issue_session_token
+
+    devices = []
+    monkeypatch.setattr(app, "get_device_username", lambda device_id, pool: devices.append(device_id))
+    body = b'{"device_id": "someone-elses-cam", "frames": [], "frame_count": 0}'
+    token = issue_session_token("alice", "cam-1")["token"]
+    response = client.post("/api/uploads", json={"target": "esp32", "size": len(body),
+                                                 "mime_type": "application/json"},
+                           headers={"Authorization": f"Bearer {token}"})
+    upload_id = response.json()["upload_id"]
+    client.put(f"/api/uploads/{upload_id}?offset=0", content=body)
+    client.post(f"/api/uploads/{upload_id}/finalize")
+    assert devices == ["cam-1"]
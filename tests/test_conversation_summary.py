@@ -0,0 +1,114 @@
+import pytest
+
+import database
+import sqlite_storage
+import conversation_summary
+from prompt_assembly import LOCKET_HISTORY_LIMIT
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """Record summarization prompts and run updates only when a test calls them"""
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return f"summary {len(prompts)}"
+
+    monkeypatch.setattr(conversation_summary, "_text_generator", generate)
+    monkeypatch.setattr(conversation_summary, "schedule_summary_update", lambda username, mode: None)
+    return prompts
+
+
+def save_turns(username, mode, count, prefix="turn"):
+    for number in range(count):
+        database.save_conversation("s", username, f"{prefix} {number}", f"reply {number}", mode=mode)
+
+
+def test_nothing_folded_inside_the_replayed_window(summarizer, username):
+    save_turns(username, "personal-assistant", LOCKET_HISTORY_LIMIT)
+    assert conversation_summary.update_summary(username, "personal-assistant") is False
+    assert summarizer == []
+
+
+def test_folds_complete_batches_older_than_the_window(summarizer, username):
+    batch = conversation_summary.SUMMARY_BATCH_SIZE
+    save_turns(username, "personal-assistant", LOCKET_HISTORY_LIMIT + 2 * batch + 3)
+
+    assert conversation_summary.update_summary(username, "personal-assistant") is True
+    stored = database.load_summary(username, "personal-assistant")
+    assert stored["summarized_count"] == 2 * batch
+    assert stored["summary"] == "summary 2"
+    # Each batch is folded into the summary written for the previous one
+    assert "turn 0" in summarizer[0] and f"turn {batch}" not in summarizer[0]
+    assert "EXISTING SUMMARY:\nsummary 1" in summarizer[1]
+
+
+def test_second_update_reads_only_unsummarized_turns(summarizer, username, monkeypatch):
+    batch = conversation_summary.SUMMARY_BATCH_SIZE
+    save_turns(username, "personal-assistant", LOCKET_HISTORY_LIMIT + batch)
+    conversation_summary.update_summary(username, "personal-assistant")
+    last_folded = database.load_conversation(username, "personal-assistant")["messages"][batch - 1]
+    assert database.load_summary(username, "personal-assistant")["summarized_until"] == last_folded["timestamp"]
+
+    save_turns(username, "personal-assistant", batch, prefix="later")
+    ranges = []
+    load_range = conversation_summary.load_conversation_range
+
+    def spy(user, mode, after, limit):
+        ranges.append((after, limit))
+        return load_range(user, mode, after, limit)
+
+    monkeypatch.setattr(conversation_summary, "load_conversation_range", spy)
+    assert conversation_summary.update_summary(username, "personal-assistant") is True
+    assert ranges == [(last_folded["timestamp"], batch)]
+    assert database.load_summary(username, "personal-assistant")["summarized_count"] == 2 * batch
+
+
+def test_window_is_shared_with_sustainability_turns(summarizer, username):
+    # Sustainability turns that are still replayed in personal-assistant prompts stay unfolded
+    batch = conversation_summary.SUMMARY_BATCH_SIZE
+    save_turns(username, "personal-assistant", LOCKET_HISTORY_LIMIT + batch)
+    save_turns(username, "sustainability", 5)
+
+    kept = conversation_summary.kept_recent_count(username, "sustainability")
+    assert kept == 5
+    assert conversation_summary.kept_recent_count(username, "personal-assistant") == LOCKET_HISTORY_LIMIT - 5
+    assert conversation_summary.update_summary(username, "personal-assistant") is True
+    assert database.load_summary(username, "personal-assistant")["summarized_count"] == batch
+
+
+def test_failed_generation_keeps_the_stored_summary(summarizer, username, monkeypatch):
+    monkeypatch.setattr(conversation_summary, "_text_generator", lambda prompt: None)
+    save_turns(username, "sustainability", LOCKET_HISTORY_LIMIT + conversation_summary.SUMMARY_BATCH_SIZE)
+    assert conversation_summary.update_summary(username, "sustainability") is False
+    assert database.load_summary(username, "sustainability") is None
+
+
+def test_folding_continues_after_older_turns_are_archived(summarizer, sqlite_db):
+    batch = conversation_summary.SUMMARY_BATCH_SIZE
+    save_turns("alice", "sustainability", LOCKET_HISTORY_LIMIT + batch)
+    assert conversation_summary.update_summary("alice", "sustainability") is True
+
+    # An archived month leaves the database: the oldest turns disappear
+    with sqlite_storage.sqlite_transaction() as conn:
+        conn.execute("DELETE FROM conversations WHERE user_message IN ('turn 0', 'turn 1', 'turn 2')")
+
+    save_turns("alice", "sustainability", batch, prefix="later")
+    assert conversation_summary.update_summary("alice", "sustainability") is True
+    # The next batch starts right after the last folded turn - nothing is skipped
+    assert f"turn {batch}\n" in summarizer[1] and f"turn {2 * batch - 1}\n" in summarizer[1]
+    assert f"turn {batch - 1}\n" not in summarizer[1]
+    assert database.load_summary("alice", "sustainability")["summarized_count"] == 2 * batch
+
+
+def test_summary_written_with_a_count_only_resumes_after_that_turn(summarizer, username):
+    batch = conversation_summary.SUMMARY_BATCH_SIZE
+    save_turns(username, "sustainability", LOCKET_HISTORY_LIMIT + 2 * batch)
+    database.save_summary(username, "sustainability", "older summary", batch)
+    stored = database.load_summary(username, "sustainability")
+    turns = database.load_conversation(username, "sustainability")["messages"]
+    assert stored["summarized_until"] == turns[batch - 1]["timestamp"]
+
+    assert conversation_summary.update_summary(username, "sustainability") is True
+    assert f"turn {batch}\n" in summarizer[0] and f"turn {batch - 1}\n" not in summarizer[0]
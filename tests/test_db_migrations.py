@@ -0,0 +1,88 @@
+import pytest
+
+import db_migrations
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def execute(self, statement, params=None):
+        statement = " ".join(statement.split())
+        if self.connection.fail_on and self.connection.fail_on in statement:
+            raise RuntimeError("statement failed")
+        self.connection.executed.append(statement)
+        if statement.startswith("SELECT 1 FROM schema_migrations"):
+            self.result = (1,) if params[0] in self.connection.applied else None
+        elif statement.startswith("INSERT INTO schema_migrations"):
+            self.connection.pending.append(params[0])
+        elif statement.startswith("SELECT MAX(version)"):
+            self.result = (max(self.connection.applied, default=None),)
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Records statements; schema_migrations rows become visible on commit"""
+
+    def __init__(self, applied=(), fail_on=None):
+        self.applied = set(applied)
+        self.pending = []
+        self.executed = []
+        self.fail_on = fail_on
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.applied.update(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+        self.rollbacks += 1
+
+
+def test_versions_are_unique_and_ascending():
+    versions = [version for version, _, _ in db_migrations.MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert db_migrations.LATEST_SCHEMA_VERSION == versions[-1]
+
+
+def test_fresh_database_gets_every_migration():
+    conn = FakeConnection()
+    assert db_migrations.apply_migrations(conn) == db_migrations.LATEST_SCHEMA_VERSION
+    assert conn.applied == {version for version, _, _ in db_migrations.MIGRATIONS}
+    locks = [statement for statement in conn.executed if "pg_advisory_xact_lock" in statement]
+    assert len(locks) == len(db_migrations.MIGRATIONS)
+    assert any(statement.startswith("CREATE INDEX IF NOT EXISTS idx_conversations_user_mode_ts")
+               for statement in conn.executed)
+
+
+def test_applied_migrations_are_skipped():
+    conn = FakeConnection(applied={version for version, _, _ in db_migrations.MIGRATIONS})
+    db_migrations.apply_migrations(conn)
+    assert not any(statement.startswith("CREATE INDEX IF NOT EXISTS idx_conversations_user_mode_ts")
+                   for statement in conn.executed)
+
+
+def test_failed_migration_is_rolled_back_and_stops_the_run():
+    conn = FakeConnection(applied={1}, fail_on="idx_conversations_user_mode_ts")
+    with pytest.raises(RuntimeError):
+        db_migrations.apply_migrations(conn)
+    assert conn.applied == {1}
+    assert conn.rollbacks == 1
+
+
+def test_hot_queries_have_composite_indexes():
+    statements = " ".join(" ".join(statement.split()) for _, _, migration in db_migrations.MIGRATIONS
+                          for statement in migration)
+    assert "ON conversations(username, mode, timestamp)" in statements
+    for name, query, params, index_name in db_migrations.EXPLAIN_QUERIES:
+        assert query.count("%s") == len(params), name
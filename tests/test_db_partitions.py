@@ -0,0 +1,198 @@
+import gzip
+import json
+import os
+from datetime import date
+
+import pytest
+
+import db_partitions
+
+
+class FakeCursor:
+    def __init__(self, conn, rows=()):
+        self.conn = conn
+        self.rows = rows
+        self.result = None
+
+    def execute(self, statement, params=None):
+        self.conn.executed.append(" ".join(statement.split()))
+        if "pg_inherits" in statement:
+            self.result = [(name,) for name in self.conn.partitions.get(params[0], [])]
+        elif "create_monthly_partition" in statement:
+            table, month = params
+            name = f"{table}_p{month:%Y%m}"
+            self.conn.partitions.setdefault(table, []).append(name)
+            self.result = [(name,)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, partitions=None, rows=()):
+        self.partitions = partitions or {}
+        self.rows = rows
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None, cursor_factory=None):
+        return FakeCursor(self, self.rows if name else ())
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_partitions, "PARTITION_ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def row(username, timestamp, mode="general", message="hi"):
+    return {"session_id": f"s-{timestamp}", "username": username, "mode": mode, "user_message": message,
+            "bot_response": "reply", "has_media": False, "media_type": None, "timestamp": timestamp,
+            "created_at": None, "channel": None}
+
+
+def test_add_months_crosses_years():
+    assert db_partitions._add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert db_partitions._add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+
+
+def test_partition_names_are_parsed_per_table():
+    assert db_partitions._partition_month("conversations", "conversations_p202403") == date(2024, 3, 1)
+    assert db_partitions._partition_month("conversations", "detailed_memories_p202403") is None
+    assert db_partitions._partition_month("conversations", "conversations_default") is None
+
+
+def test_ensure_partitions_only_creates_missing_months():
+    this_month = date.today().replace(day=1)
+    existing = f"conversations_p{this_month:%Y%m}"
+    conn = FakeConnection({"conversations": [existing]})
+    created = db_partitions.ensure_partitions(conn, months_ahead=1)
+    next_month = db_partitions._add_months(this_month, 1)
+    assert created == [f"conversations_p{next_month:%Y%m}",
+                       f"detailed_memories_p{this_month:%Y%m}", f"detailed_memories_p{next_month:%Y%m}"]
+    assert db_partitions.ensure_partitions(conn, months_ahead=1) == []
+
+
+def test_archive_partition_writes_one_file_per_user_and_drops_it(archive_dir):
+    rows = [row("alice", "2023-01-02T10:00:00"), row("alice", "2023-01-05T10:00:00"), row("bob", "2023-01-03T10:00:00")]
+    conn = FakeConnection(rows=rows)
+    count = db_partitions.archive_partition(conn, "conversations", "conversations_p202301", date(2023, 1, 1))
+    assert count == 3
+    month_dir = archive_dir / "conversations" / "2023-01"
+    assert sorted(os.listdir(month_dir)) == ["alice.jsonl.gz", "bob.jsonl.gz"]
+    with gzip.open(month_dir / "alice.jsonl.gz", "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["timestamp"] for line in f] == ["2023-01-02T10:00:00", "2023-01-05T10:00:00"]
+    assert 'DROP TABLE "conversations_p202301"' in conn.executed
+    assert conn.commits == 1
+
+
+def test_failed_archive_rolls_back_and_keeps_the_partition(archive_dir):
+    class FailingRows:
+        def __iter__(self):
+            yield row("alice", "2023-01-02T10:00:00")
+            raise RuntimeError("connection lost")
+
+    conn = FakeConnection(rows=FailingRows())
+    with pytest.raises(RuntimeError):
+        db_partitions.archive_partition(conn, "conversations", "conversations_p202301", date(2023, 1, 1))
+    assert conn.rollbacks == 1
+    assert not any("DROP TABLE" in statement for statement in conn.executed)
+    assert os.listdir(archive_dir / "conversations" / "2023-01") == []
+
+
+def test_archived_messages_are_paged_across_months(archive_dir):
+    assert db_partitions.has_archives() is False
+    for month, rows in (("2023-01", [row("alice", "2023-01-10T00:00:00"), row("alice", "2023-01-20T00:00:00")]),
+                        ("2023-02", [row("alice", "2023-02-10T00:00:00"),
+                                     row("alice", "2023-02-11T00:00:00", mode="sustainability")])):
+        conn = FakeConnection(rows=rows)
+        db_partitions.archive_partition(conn, "conversations", f"conversations_p{month.replace('-', '')}",
+                                        date(int(month[:4]), int(month[5:]), 1))
+    assert db_partitions.has_archives() is True
+
+    newest = db_partitions.load_archived_messages("alice", "general", limit=2)
+    assert [msg["timestamp"] for msg in newest] == ["2023-02-10T00:00:00", "2023-01-20T00:00:00"]
+    assert newest[0]["channel"] == "chat"
+
+    older = db_partitions.load_archived_messages("alice", "general", limit=10, before="2023-01-20T00:00:00")
+    assert [msg["timestamp"] for msg in older] == ["2023-01-10T00:00:00"]
+
+    newer = db_partitions.load_archived_messages("alice", "general", limit=10, after="2023-01-10T00:00:00")
+    assert [msg["timestamp"] for msg in newer] == ["2023-01-20T00:00:00", "2023-02-10T00:00:00"]
+
+    assert db_partitions.load_archived_messages("bob", "general", limit=10) == []
+
+
+def archive_month(table, month, rows):
+    conn = FakeConnection(rows=rows)
+    db_partitions.archive_partition(conn, table, f"{table}_p{month.replace('-', '')}",
+                                    date(int(month[:4]), int(month[5:]), 1))
+
+
+def memory_row(username, timestamp, session_id, mode=None):
+    memory = {"session_id": session_id, "username": username, "media_type": "image", "timestamp": timestamp,
+              "detailed_analysis": f"analysis {timestamp}", "extracted_memory": {}, "created_at": None}
+    if mode:
+        memory["mode"] = mode
+    return memory
+
+
+def test_archived_conversation_keeps_the_modes_turns_and_memories(archive_dir):
+    archive_month("conversations", "2023-01", [row("alice", "2023-01-10T00:00:00"),
+                                               row("alice", "2023-01-11T00:00:00", mode="sustainability")])
+    # The first memory was archived before detailed_memories had a mode column
+    archive_month("detailed_memories", "2023-01", [
+        memory_row("alice", "2023-01-09T23:59:59", "s-2023-01-10T00:00:00"),
+        memory_row("alice", "2023-01-10T23:59:59", "s-2023-01-11T00:00:00", mode="sustainability"),
+        memory_row("alice", "2023-01-12T00:00:00", "s-other", mode="general")])
+
+    archived = db_partitions.load_archived_conversation("alice", "general")
+    assert [msg["timestamp"] for msg in archived["messages"]] == ["2023-01-10T00:00:00"]
+    assert [mem["timestamp"] for mem in archived["detailed_memories"]] == ["2023-01-09T23:59:59",
+                                                                          "2023-01-12T00:00:00"]
+
+
+def test_full_history_load_includes_archived_months(archive_dir, monkeypatch):
+    import database
+    from contextlib import contextmanager
+    from datetime import datetime
+
+    class HistoryCursor:
+        connection = None
+
+        def execute(self, statement, params=None):
+            self.result = [] if "detailed_memories" in statement else [
+                {"user_message": "recent", "bot_response": "reply", "has_media": False, "media_type": None,
+                 "timestamp": datetime(2024, 6, 1), "session_id": "s", "channel": "chat"}]
+
+        def fetchall(self):
+            return self.result
+
+        def close(self):
+            pass
+
+    class HistoryConnection:
+        def cursor(self, cursor_factory=None):
+            return HistoryCursor()
+
+    monkeypatch.setattr(database, "db_connection", contextmanager(lambda: (yield HistoryConnection())))
+    archive_month("conversations", "2023-01", [row("alice", "2023-01-10T00:00:00", message="archived")])
+
+    conversation = database.load_conversation_db("alice", "general")
+    assert [msg["user_message"] for msg in conversation["messages"]] == ["archived", "recent"]
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import db_pool
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement, params=None):
+        self.connection.executed.append((statement, params))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.prepared = set()
+        self.executed = []
+        self.rollbacks = 0
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(db_pool.ConnectionPool):
+    def _connect(self):
+        return FakeConnection()
+
+
+def test_pool_is_bounded_and_times_out():
+    pool = FakePool("dsn", min_size=0, max_size=2, timeout=0.05)
+    first, second = pool.getconn(), pool.getconn()
+    assert first is not second
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_released_connection_wakes_a_waiter():
+    pool = FakePool("dsn", min_size=0, max_size=1, timeout=5)
+    conn = pool.getconn()
+    received = []
+    waiter = threading.Thread(target=lambda: received.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    waiter.join(5)
+    assert received == [conn]
+    assert pool.stats()["waits"] == 1
+
+
+def test_connection_with_open_transaction_is_rolled_back_on_release():
+    pool = FakePool("dsn", min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_closed_connection_is_replaced():
+    pool = FakePool("dsn", min_size=1, max_size=1)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = True
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert pool.stats()["discarded"] == 1
+
+
+def test_context_manager_rolls_back_and_releases_on_error():
+    pool = FakePool("dsn", min_size=0, max_size=1)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("query failed")
+    assert conn.rollbacks >= 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_statements_are_prepared_once_per_connection(monkeypatch):
+    monkeypatch.setitem(db_pool.PREPARED_STATEMENTS, "test_lookup",
+                        (["text", "integer"], "SELECT * FROM t WHERE a = $1 LIMIT $2"))
+    conn = FakeConnection()
+    cursor = conn.cursor()
+    db_pool.execute_prepared(cursor, "test_lookup", ("x", 5))
+    db_pool.execute_prepared(cursor, "test_lookup", ("y", 6))
+    statements = [statement for statement, _ in conn.executed]
+    assert statements == ["PREPARE test_lookup (text, integer) AS SELECT * FROM t WHERE a = $1 LIMIT $2",
+                          "EXECUTE test_lookup (%s, %s)", "EXECUTE test_lookup (%s, %s)"]
+
+
+def test_plain_connections_run_the_statement_directly(monkeypatch):
+    monkeypatch.setitem(db_pool.PREPARED_STATEMENTS, "test_lookup",
+                        (["text", "integer"], "SELECT * FROM t WHERE a = $1 LIMIT $2"))
+    conn = FakeConnection()
+    del conn.prepared
+    db_pool.execute_prepared(conn.cursor(), "test_lookup", ("x", 5))
+    assert conn.executed == [("SELECT * FROM t WHERE a = %s LIMIT %s", ("x", 5))]
+
+
+def test_warm_prepares_every_statement():
+    pool = FakePool("dsn", min_size=0, max_size=3)
+    assert pool.warm(2) == 2
+    conns = [pool.getconn(), pool.getconn()]
+    for conn in conns:
+        assert conn.prepared == set(db_pool.PREPARED_STATEMENTS)
@@ -0,0 +1,77 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import database
+import embedding_store
+
+
+def test_embeddings_are_normalized_and_deterministic():
+    vectors = embedding_store.embed_texts(["kitchen counter keys", "kitchen counter keys", ""])
+    assert vectors.shape == (3, embedding_store.EMBEDDING_DIM)
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+
+def test_similar_turn_ranks_first(username):
+    database.save_conversation("s", username, "I left my car keys on the kitchen counter", "ok",
+                               mode="personal-assistant")
+    database.save_conversation("s", username, "what should I cook tonight", "pasta",
+                               mode="personal-assistant")
+
+    results = embedding_store.search_similar(username, "where did I leave my key?", ["personal-assistant"])
+    assert results and "car keys" in results[0]["text"]
+    assert embedding_store.search_similar(username, "keys", ["sustainability"]) == []
+
+
+def test_first_save_is_not_appended_twice(username):
+    # The store is created and backfilled by the first save, which already includes that turn
+    database.save_conversation("s", username, "first message", "ok", mode="personal-assistant")
+    store = embedding_store.get_user_store(username)
+    assert len(store.rows) == len(store.latest) == 1
+
+
+def test_changed_document_supersedes_and_compacts(username):
+    database.save_conversation("s", username, "one", "ok", mode="personal-assistant")
+    store = embedding_store.get_user_store(username)
+    row = store.rows[0]
+
+    store.append([{**row}])
+    assert len(store.rows) == 1  # Same text - skipped
+    store.append([{**row, "text": "changed text"}])
+    assert len(store.latest) == 1
+    assert store.rows[store.latest[row["doc_id"]]]["text"] == "changed text"
+    assert len(store.rows) == 1  # Half the rows were stale - compacted
+
+
+def test_store_reopens_from_disk(username):
+    database.save_conversation("s", username, "the garden hose is in the shed", "ok", mode="personal-assistant")
+    rows = len(embedding_store.get_user_store(username).rows)
+    embedding_store._stores.pop(username)
+
+    store = embedding_store.get_user_store(username)
+    assert len(store.rows) == rows
+    assert embedding_store.search_similar(username, "garden hose", ["personal-assistant"])
+
+
+def test_failed_backfill_leaves_no_files(username, monkeypatch):
+    def fail(store):
+        raise RuntimeError("storage down")
+
+    monkeypatch.setattr(embedding_store, "_backfill", fail)
+    with pytest.raises(RuntimeError):
+        embedding_store.get_user_store(username)
+    store = embedding_store.UserEmbeddingStore(username)
+    assert not store.exists
+    assert username not in embedding_store._stores
+
+
+def test_evicted_store_in_use_is_not_opened_twice(username, monkeypatch):
+    monkeypatch.setattr(embedding_store, "EMBEDDING_MAX_USERS", 1)
+    database.save_conversation("s", username, "the bike pump is in the hall", "ok", mode="personal-assistant")
+    in_use = embedding_store.get_user_store(username)
+
+    embedding_store.get_user_store(f"{username}-other")  # Evicts the store above
+    assert username not in embedding_store._stores
+    assert embedding_store.get_user_store(username) is in_use
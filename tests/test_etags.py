@@ -0,0 +1,36 @@
+import database
+
+
+def test_conversation_answers_304_until_history_changes(client, username):
+    database.save_conversation("s", username, "hello", "hi", mode="personal-assistant")
+    url = f"/conversation/personal-assistant/{username}"
+
+    response = client.get(url)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    database.save_conversation("s", username, "again", "hi", mode="personal-assistant")
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_pages_have_their_own_etags(client, username):
+    database.save_conversation("s", username, "hello", "hi", mode="personal-assistant")
+    url = f"/conversation/personal-assistant/{username}"
+    assert client.get(url).headers["ETag"] != client.get(url, params={"limit": 1}).headers["ETag"]
+
+
+def test_personas_answer_304(client):
+    response = client.get("/personas")
+    assert response.status_code == 200
+    assert client.get("/personas", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    persona = client.get("/personas/chef_rile")
+    assert persona.json()["persona_name"]
+    assert client.get("/personas/chef_rile",
+                      headers={"If-None-Match": persona.headers["ETag"]}).status_code == 304
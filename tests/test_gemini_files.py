@@ -0,0 +1,84 @@
+import io
+import os
+import threading
+
+import pytest
+
+import gemini_files
+from media import MediaInput
+
+
+def video(data):
+    return MediaInput("video/mp4", file=io.BytesIO(data))
+
+
+@pytest.fixture
+def small_threshold(monkeypatch):
+    monkeypatch.setattr(gemini_files, "GEMINI_FILE_API_THRESHOLD", 1000)
+
+
+def test_small_media_stays_inline(small_threshold):
+    part = gemini_files.gemini_media_part(video(os.urandom(100)))
+    assert "inline_data" in part
+
+
+def test_large_media_is_uploaded_once_per_content(small_threshold, monkeypatch):
+    uploads = []
+    upload = gemini_files.LocalFileAPI.upload
+    monkeypatch.setattr(gemini_files.LocalFileAPI, "upload",
+                        lambda self, media, name: uploads.append(name) or upload(self, media, name))
+    data = os.urandom(5000)
+
+    first = gemini_files.gemini_media_part(video(data), "first")
+    second = gemini_files.gemini_media_part(video(data), "second")
+    assert first == second
+    assert first["file_data"]["file_uri"].startswith("local://files/")
+    assert uploads == ["first"]
+
+
+def test_concurrent_requests_share_one_upload(small_threshold, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    uploads = []
+    upload = gemini_files.LocalFileAPI.upload
+
+    def slow_upload(self, media, name):
+        uploads.append(name)
+        started.set()
+        release.wait(5)
+        return upload(self, media, name)
+
+    monkeypatch.setattr(gemini_files.LocalFileAPI, "upload", slow_upload)
+    data = os.urandom(5000)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gemini_files.upload_media(video(data))))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(uploads) == 1
+    assert len({entry["name"] for entry in results}) == 1
+    assert gemini_files._upload_locks == {}
+
+
+def test_failed_upload_falls_back_inline_and_drops_its_lock(small_threshold, monkeypatch):
+    def fail(self, media, name):
+        raise RuntimeError("upload failed")
+
+    monkeypatch.setattr(gemini_files.LocalFileAPI, "upload", fail)
+    part = gemini_files.gemini_media_part(video(os.urandom(5000)))
+    assert "inline_data" in part
+    assert gemini_files._upload_locks == {}
+
+
+def test_chat_references_large_video_by_file_uri(client, gemini, username, small_threshold):
+    response = client.post("/chat", data={"message": "what happens here?", "username": username,
+                                          "mode": "personal-assistant"},
+                           files={"video": ("clip.mp4", os.urandom(5000), "video/mp4")})
+    assert response.status_code == 200
+    parts = gemini.generate_calls()[0]["contents"][-1]["parts"]
+    assert any("file_data" in part for part in parts)
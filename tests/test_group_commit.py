@@ -0,0 +1,150 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import group_commit
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def execute(self, statement, params=None):
+        if self.pool.fail_rows and params in self.pool.fail_rows:
+            raise ValueError("bad row")
+        self.pool.single_rows.append(params)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+    def commit(self):
+        self.pool.commits += 1
+
+
+class FakePool:
+    def __init__(self, fail_batches=False, fail_rows=()):
+        self.fail_batches = fail_batches
+        self.fail_rows = list(fail_rows)
+        self.batches = []
+        self.single_rows = []
+        self.commits = 0
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+@pytest.fixture
+def fake_execute_values(monkeypatch):
+    def execute_values(cursor, statement, rows, page_size=None):
+        if cursor.pool.fail_batches:
+            raise ValueError("batch failed")
+        cursor.pool.batches.append((statement.split()[2], list(rows)))
+    monkeypatch.setattr(group_commit, "execute_values", execute_values, raising=False)
+
+
+def turn(index):
+    return (f"session-{index}", "alice", "general", f"message {index}", "reply", False, None,
+            "2024-01-01T00:00:00", "chat")
+
+
+def test_concurrent_turns_share_one_commit(fake_execute_values):
+    pool = FakePool()
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=200, max_rows=64)
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(writer.write(turn(i)))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert results == [True] * 8
+        assert pool.commits == 1
+        assert len(pool.batches[0][1]) == 8
+        assert writer.stats()["max_batch"] == 8
+    finally:
+        writer.close()
+
+
+def test_memories_are_inserted_in_the_same_transaction(fake_execute_values):
+    pool = FakePool()
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=1)
+    try:
+        memory = ("session-1", "alice", "image", "2024-01-01T00:00:00", "analysis", "memory")
+        assert writer.write(turn(1), memory) is True
+        assert [table for table, _ in pool.batches] == ["conversations", "detailed_memories"]
+        assert pool.commits == 1
+    finally:
+        writer.close()
+
+
+def test_batch_is_flushed_at_max_rows(fake_execute_values):
+    pool = FakePool()
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=10_000, max_rows=2)
+    try:
+        futures = [writer.submit(turn(i)) for i in range(2)]
+        assert [future.result(timeout=2) for future in futures] == [True, True]
+    finally:
+        writer.close()
+
+
+def test_failed_batch_retries_rows_individually(fake_execute_values):
+    pool = FakePool(fail_batches=True, fail_rows=[turn(2)])
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=100)
+    try:
+        committed = []
+        futures = [writer.submit(turn(i), on_commit=committed.append) for i in range(3)]
+        assert [future.result(timeout=2) for future in futures] == [True, True, False]
+        assert committed == [True, True, False]
+        assert pool.single_rows == [turn(0), turn(1)]
+        assert writer.stats()["failed_rows"] == 1
+    finally:
+        writer.close()
+
+
+def test_close_flushes_queued_rows_and_writes_later_ones_directly(fake_execute_values):
+    pool = FakePool()
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=10_000)
+    queued = writer.submit(turn(1))
+    writer.close()
+    assert queued.result(timeout=1) is True
+    assert writer.submit(turn(2)).result(timeout=1) is True
+    assert pool.single_rows == [turn(2)]
+
+
+def test_turn_still_queued_at_the_timeout_is_never_written(fake_execute_values, monkeypatch):
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT_WAIT_TIMEOUT", 0.05)
+    pool = FakePool()
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=10_000)
+    assert writer.write(turn(1)) is False
+    writer.close()
+    assert pool.batches == [] and pool.single_rows == []
+
+
+def test_turn_in_a_slow_flush_gets_the_flush_result(fake_execute_values, monkeypatch):
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT_WAIT_TIMEOUT", 0.05)
+    release = threading.Event()
+
+    class SlowPool(FakePool):
+        @contextmanager
+        def connection(self):
+            release.wait(5)
+            yield FakeConnection(self)
+
+    pool = SlowPool()
+    writer = group_commit.GroupCommitWriter(pool, delay_ms=1)
+    try:
+        threading.Timer(0.3, release.set).start()
+        assert writer.write(turn(1)) is True
+        assert pool.commits == 1
+    finally:
+        writer.close()
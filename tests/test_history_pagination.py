@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import database
+
+
+def save_turns(username, count, mode="personal-assistant"):
+    for number in range(count):
+        database.save_conversation("s", username, f"message {number}", f"reply {number}", mode=mode)
+
+
+def test_pages_walk_back_with_before_cursor(client, username):
+    save_turns(username, 7)
+
+    first = client.get(f"/conversation/personal-assistant/{username}", params={"limit": 3}).json()
+    assert [msg["user_message"] for msg in first["messages"]] == ["message 6", "message 5", "message 4"]
+    assert first["has_more"] is True
+
+    second = client.get(f"/conversation/personal-assistant/{username}",
+                        params={"limit": 3, "before": first["next_cursor"]}).json()
+    assert [msg["user_message"] for msg in second["messages"]] == ["message 3", "message 2", "message 1"]
+
+    last = client.get(f"/conversation/personal-assistant/{username}",
+                      params={"limit": 3, "before": second["next_cursor"]}).json()
+    assert [msg["user_message"] for msg in last["messages"]] == ["message 0"]
+    assert last["has_more"] is False
+    assert last["next_cursor"] is None
+
+
+def save_media_turns(username, count):
+    """Media turns whose memory is stamped just before the turn is saved, as /chat does"""
+    for number in range(count):
+        memory = {"timestamp": datetime.now().isoformat(), "media_type": "image",
+                  "detailed_analysis": f"analysis {number}", "extracted_memory": {}}
+        database.save_conversation(f"s{number}", username, f"message {number}", f"reply {number}",
+                                   has_media=True, media_type="image", mode="personal-assistant",
+                                   detailed_memory=memory)
+
+
+def page_memories(page):
+    return [memory["detailed_analysis"] for memory in page["detailed_memories"]]
+
+
+def test_each_memory_is_on_its_turns_page(client, username):
+    save_media_turns(username, 4)
+    url = f"/conversation/personal-assistant/{username}"
+
+    first = client.get(url, params={"limit": 2}).json()
+    assert page_memories(first) == ["analysis 3", "analysis 2"]
+    second = client.get(url, params={"limit": 2, "before": first["next_cursor"]}).json()
+    assert page_memories(second) == ["analysis 1", "analysis 0"]
+
+    newer = client.get(url, params={"limit": 10, "after": second["prev_cursor"]}).json()
+    assert page_memories(newer) == ["analysis 3", "analysis 2"]
+
+
+def test_after_cursor_returns_only_newer_turns(client, username):
+    save_turns(username, 2)
+    page = client.get(f"/conversation/personal-assistant/{username}", params={"limit": 10}).json()
+
+    database.save_conversation("s", username, "newest", "reply", mode="personal-assistant")
+    newer = client.get(f"/conversation/personal-assistant/{username}",
+                       params={"limit": 10, "after": page["prev_cursor"]}).json()
+    assert [msg["user_message"] for msg in newer["messages"]] == ["newest"]
+
+
+def test_without_paging_parameters_full_history_is_returned(client, username):
+    save_turns(username, 3, mode="sustainability")
+    body = client.get(f"/conversation/{username}").json()
+    assert [msg["user_message"] for msg in body["messages"]] == ["message 0", "message 1", "message 2"]
+    assert "has_more" not in body
+
+
+def test_page_size_is_capped(client, username):
+    import app
+
+    save_turns(username, 2)
+    body = client.get(f"/conversation/personal-assistant/{username}",
+                      params={"limit": app.MAX_HISTORY_PAGE_SIZE * 10}).json()
+    assert len(body["messages"]) == 2
+
+
+def test_invalid_mode_is_rejected(client, username):
+    assert "error" in client.get(f"/conversation/unknown/{username}").json()
@@ -0,0 +1,69 @@
+import io
+import os
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image
+
+import image_normalizer
+from media import MediaInput
+
+
+def encoded_image(size, mode="RGB"):
+    # Noise so the encoder can't shrink it to nothing
+    image = Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def image_media(data, mime_type="image/png"):
+    return MediaInput(mime_type, file=io.BytesIO(data))
+
+
+def test_large_image_is_downscaled_to_jpeg():
+    result = image_normalizer.normalize_image(image_media(encoded_image((2000, 1000))))
+    assert result.mime_type == "image/jpeg"
+    with Image.open(io.BytesIO(result.read_bytes())) as image:
+        assert max(image.size) == image_normalizer.IMAGE_MAX_DIMENSION
+        assert image.size[0] == 2 * image.size[1]
+
+
+def test_transparent_image_is_flattened():
+    result = image_normalizer.normalize_image(image_media(encoded_image((1200, 1200), mode="RGBA")))
+    with Image.open(io.BytesIO(result.read_bytes())) as image:
+        assert image.mode == "RGB"
+
+
+def test_small_image_is_sent_unchanged_when_reencoding_does_not_help():
+    output = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 30, 30)).save(output, format="PNG")  # Far smaller than any JPEG
+    media = image_media(output.getvalue())
+    assert image_normalizer.normalize_image(media) is media
+
+
+def test_results_are_cached_by_content(monkeypatch):
+    data = encoded_image((1000, 1000))
+    image_normalizer.normalize_image(image_media(data))
+
+    def fail(data):
+        raise AssertionError("re-encoded a cached image")
+
+    monkeypatch.setattr(image_normalizer, "normalize_image_bytes", fail)
+    assert image_normalizer.normalize_image(image_media(data)).mime_type == "image/jpeg"
+
+
+def test_undecodable_image_falls_back_to_original():
+    media = image_media(b"not an image")
+    assert image_normalizer.normalize_image(media) is media
+
+
+def test_other_media_types_pass_through():
+    media = MediaInput("image/gif", file=io.BytesIO(b"GIF89a"))
+    assert image_normalizer.normalize_image(media) is media
+
+
+def test_malformed_base64_falls_back_to_original():
+    media = MediaInput("image/png", base64_data="iVBORw0KGgo!!!!")
+    assert image_normalizer.normalize_image(media) is media
@@ -0,0 +1,61 @@
+import json
+import os
+
+import database
+
+
+def test_legacy_role_entries_fold_into_turns():
+    messages = [
+        {"user_message": "hi", "bot_response": "hello", "timestamp": "2024-01-01T09:00:00"},
+        {"role": "user", "content": "what is this?", "timestamp": "2024-01-01T10:00:00"},
+        {"role": "assistant", "content": "a mug", "timestamp": "2024-01-01T10:00:01"},
+        {"role": "user", "content": "unanswered", "timestamp": "2024-01-01T11:00:00"}
+    ]
+    converted, legacy = database.convert_legacy_locket_messages(messages)
+    assert legacy == 3
+    assert converted[0] is messages[0]
+    assert converted[1] == {"timestamp": "2024-01-01T10:00:00", "session_id": database.LEGACY_LOCKET_SESSION,
+                            "user_message": "what is this?", "bot_response": "a mug",
+                            "has_media": False, "media_type": None, "channel": "locket"}
+    assert converted[2]["user_message"] == "unanswered"
+    assert converted[2]["bot_response"] == ""
+
+
+def test_plain_turns_are_left_alone():
+    messages = [{"user_message": "hi", "bot_response": "hello"}]
+    assert database.convert_legacy_locket_messages(messages) == (messages, 0)
+
+
+def test_legacy_json_files_are_rewritten(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("memory/personal_assistant")
+    path = "memory/personal_assistant/alice.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"messages": [{"role": "user", "content": "where are my keys?"},
+                                {"role": "assistant", "content": "on the table"}]}, f)
+    assert database.convert_legacy_locket_files() == 1
+    with open(path, encoding="utf-8") as f:
+        messages = json.load(f)["messages"]
+    assert [(msg["user_message"], msg["bot_response"], msg["channel"]) for msg in messages] == [
+        ("where are my keys?", "on the table", "locket")]
+    assert database.convert_legacy_locket_files() == 0
+
+
+def test_locket_audio_turn_is_stored_as_one_tagged_turn(client, gemini, username):
+    gemini.reply = "Your keys are by the door."
+    response = client.post("/api/locket/upload-audio",
+                           data={"session_id": "locket-session", "username": username,
+                                 "transcript": "Where are my keys?"},
+                           files={"audio": ("audio.webm", b"\x00", "audio/webm")})
+    assert response.status_code == 200
+    assert response.json()["response"] == "Your keys are by the door."
+
+    messages = database.load_conversation(username, "personal-assistant")["messages"]
+    assert len(messages) == 1
+    turn = messages[0]
+    assert (turn["user_message"], turn["bot_response"], turn["channel"]) == (
+        "Where are my keys?", "Your keys are by the door.", "locket")
+    assert "role" not in turn
+
+    page = client.get(f"/conversation/personal-assistant/{username}").json()
+    assert page["messages"][0]["channel"] == "locket"
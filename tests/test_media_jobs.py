@@ -0,0 +1,108 @@
+import time
+import sqlite3
+import threading
+
+import pytest
+
+import media_jobs
+
+
+@pytest.fixture
+def jobs_db(tmp_path, monkeypatch):
+    """A fresh jobs database for the test"""
+    path = str(tmp_path / "jobs.db")
+    monkeypatch.setattr(media_jobs, "JOBS_DB_PATH", path)
+    monkeypatch.setattr(media_jobs, "_conn", None)
+    yield path
+    media_jobs._conn = None
+
+
+def job_row(path, job_id):
+    return sqlite3.connect(path).execute(
+        "SELECT status, attempts, last_error, next_run_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def test_enqueued_job_runs_on_a_worker(jobs_db):
+    done = threading.Event()
+    received = []
+    media_jobs.register_job_handler("test-echo", lambda payload: (received.append(payload), done.set()))
+
+    job_id = media_jobs.enqueue_job("test-echo", {"value": 42})
+    assert done.wait(5)
+    assert received == [{"value": 42}]
+    for _ in range(50):
+        if job_row(jobs_db, job_id)[0] == "done":
+            break
+        time.sleep(0.05)
+    assert job_row(jobs_db, job_id)[:2] == ("done", 1)
+
+
+def test_failed_job_is_retried_with_backoff(jobs_db, monkeypatch):
+    monkeypatch.setattr(media_jobs, "MEDIA_JOB_BACKOFF_SECONDS", 60)
+    with media_jobs._db_lock:
+        conn = media_jobs._get_conn()
+        job_id = conn.execute("""
+            INSERT INTO jobs (kind, payload, status, attempts, next_run_at, created_at, updated_at)
+            VALUES ('test-retry', '{}', 'running', 1, 0, 0, 0)
+        """).lastrowid
+        conn.commit()
+
+    before = time.time()
+    media_jobs._finish_job({"id": job_id, "kind": "test-retry", "attempts": 1}, "boom")
+    status, attempts, error, next_run_at = job_row(jobs_db, job_id)
+    assert (status, attempts, error) == ("pending", 2, "boom")
+    assert next_run_at >= before + 120  # Second retry waits twice the base delay
+
+
+def test_job_fails_permanently_after_max_attempts(jobs_db):
+    with media_jobs._db_lock:
+        conn = media_jobs._get_conn()
+        job_id = conn.execute("""
+            INSERT INTO jobs (kind, payload, status, attempts, next_run_at, created_at, updated_at)
+            VALUES ('test-retry', '{}', 'running', ?, 0, 0, 0)
+        """, (media_jobs.MEDIA_JOB_MAX_ATTEMPTS - 1,)).lastrowid
+        conn.commit()
+
+    media_jobs._finish_job({"id": job_id, "kind": "test-retry", "attempts": media_jobs.MEDIA_JOB_MAX_ATTEMPTS - 1}, "boom")
+    assert job_row(jobs_db, job_id)[0] == "failed"
+
+
+def test_interrupted_jobs_are_requeued_on_open(jobs_db):
+    conn = sqlite3.connect(jobs_db)
+    media_jobs._conn = None
+    media_jobs._get_conn()  # Creates the table
+    media_jobs._conn = None
+    # Far in the future so no running worker claims it during the test
+    conn.execute("""
+        INSERT INTO jobs (kind, payload, status, attempts, next_run_at, created_at, updated_at)
+        VALUES ('test-interrupted', '{}', 'running', 0, ?, 0, 0)
+    """, (time.time() + 3600,))
+    conn.commit()
+
+    media_jobs._get_conn()
+    assert conn.execute("SELECT status FROM jobs WHERE kind = 'test-interrupted'").fetchone() == ("pending",)
+
+
+def test_workers_start_with_the_app(client):
+    import app
+
+    assert media_jobs._workers
+    assert "media_jobs" in app.startup_timings
+
+
+@pytest.mark.parametrize("status_code, queued", [(200, 1), (500, 0)])
+def test_extraction_is_queued_only_for_an_answered_media_turn(client, gemini, username, monkeypatch,
+                                                              status_code, queued):
+    import app
+    from conftest import FakeResponse
+
+    extractions = []
+    monkeypatch.setattr(app, "queue_media_memory_extraction", lambda *args: extractions.append(args))
+    gemini.handler = lambda url, payload: FakeResponse(
+        {"candidates": [{"content": {"parts": [{"text": "A red bike"}]}}]} if status_code == 200
+        else {"error": "overloaded"}, status_code)
+    response = client.post("/chat", data={"message": "what is this?", "username": username,
+                                          "mode": "personal-assistant"},
+                           files={"image": ("photo.png", b"not really a png", "image/png")})
+    assert response.status_code == 200
+    assert len(extractions) == queued
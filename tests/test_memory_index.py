@@ -0,0 +1,63 @@
+import database
+import memory_index
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert memory_index.tokenize("Where do I put my keys, a B?") == ["put", "keys"]
+
+
+def test_bm25_ranks_matching_document_first():
+    index = memory_index.UserMemoryIndex()
+    index.add("a", "the car keys are on the kitchen counter", "personal-assistant", "turn", "t1")
+    index.add("b", "dinner recipe with rice", "personal-assistant", "turn", "t2")
+    index.add("c", "keys keys keys", "sustainability", "turn", "t3")
+
+    results = index.search("where are my keys", 5, ["personal-assistant"])
+    assert [result["doc_id"] for result in results] == ["a"]
+    assert index.search("keys", 5, ["personal-assistant"], exclude_timestamps={"t1"}) == []
+
+
+def test_re_adding_a_document_replaces_it():
+    index = memory_index.UserMemoryIndex()
+    index.add("a", "old words", "sustainability", "turn", "t1")
+    index.add("a", "new text", "sustainability", "turn", "t1")
+    assert index.search("old", 5, ["sustainability"]) == []
+    assert len(index.docs) == 1
+
+
+def test_saved_turns_are_searchable(username):
+    database.save_conversation("s", username, "my passport is in the desk drawer", "Noted!", mode="personal-assistant")
+    memory_index.get_user_index(username)
+    database.save_conversation("s", username, "the umbrella is by the door", "Got it", mode="personal-assistant")
+
+    assert memory_index.search_memories(username, "passport", ["personal-assistant"])
+    assert memory_index.search_memories(username, "umbrella", ["personal-assistant"])
+    assert memory_index.search_memories(username, "umbrella", ["sustainability"]) == []
+
+
+def test_turns_saved_during_a_build_are_replayed(username, monkeypatch):
+    database.save_conversation("s", username, "first turn", "ok", mode="personal-assistant")
+    build = memory_index._build_index
+
+    def build_with_concurrent_save(user):
+        index = build(user)
+        # Saved after the storage scan, before the index is published
+        database.save_conversation("s", user, "bicycle in the garage", "ok", mode="personal-assistant")
+        return index
+
+    monkeypatch.setattr(memory_index, "_build_index", build_with_concurrent_save)
+    memory_index.get_user_index(username)
+    assert memory_index.search_memories(username, "bicycle", ["personal-assistant"])
+    assert username not in memory_index._building
+
+
+def test_memories_are_indexed_under_their_own_mode(username):
+    memory = {"timestamp": "2026-01-01T10:00:00", "media_type": "image",
+              "detailed_analysis": "a red bicycle leaning on a fence", "extracted_memory": {}}
+    database.save_conversation("pa-session", username, "look", "nice bike", True, "image",
+                               "personal-assistant", memory)
+    database.save_conversation("sus-session", username, "recycling", "ok", mode="sustainability")
+
+    index = memory_index.get_user_index(username)
+    assert index.docs[memory_index.memory_doc_id(memory["timestamp"])]["mode"] == "personal-assistant"
+    assert memory_index.search_memories(username, "bicycle fence", ["sustainability"]) == []
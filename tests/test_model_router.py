@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import model_router as model_router_module
+from model_router import (DEFAULT_ROUTES, GEMINI_CAPABLE_MODEL, GEMINI_FAST_MODEL, ModelRouter,
+                          contents_tokens, load_routes)
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(DEFAULT_ROUTES)
+
+
+def text_payload(text):
+    return {"contents": [{"role": "user", "parts": [{"text": text}]}]}
+
+
+@pytest.mark.parametrize("channel, media_type, tokens, personas, name, model", [
+    ("locket", "image", 100, None, "locket-vision", GEMINI_CAPABLE_MODEL),
+    ("locket", None, 100, None, "locket-text", GEMINI_FAST_MODEL),
+    ("esp32", "video", 100, None, "esp32-video", GEMINI_CAPABLE_MODEL),
+    ("esp32", None, 100, None, "esp32-text", GEMINI_FAST_MODEL),
+    ("chat", "image", 100, None, "chat-image", GEMINI_CAPABLE_MODEL),
+    ("chat", None, 100, ["tech_rile"], "chat-text-reasoning", GEMINI_CAPABLE_MODEL),
+    ("chat", None, 100, ["chef_rile"], "chat-text-short", GEMINI_FAST_MODEL),
+    ("chat", None, 5000, ["tech_rile"], "chat-text-reasoning", GEMINI_CAPABLE_MODEL),
+    ("chat", None, 5000, ["chef_rile"], "default", GEMINI_CAPABLE_MODEL),
+    ("transcription", None, 100, None, "transcription", GEMINI_FAST_MODEL),
+])
+def test_default_routes(router, channel, media_type, tokens, personas, name, model):
+    route = router.select(channel, media_type, tokens, personas)
+    assert (route["name"], route["model"]) == (name, model)
+
+
+def test_route_settings_become_generation_config(router):
+    route = router.select("esp32")
+    assert route["generation_config"] == {"temperature": 0.7, "maxOutputTokens": 500,
+                                          "thinkingConfig": {"thinkingBudget": 0}}
+
+
+def test_caller_generation_config_wins(router):
+    payload = router.apply({"contents": [], "generationConfig": {"temperature": 0.2}}, router.select("esp32"))
+    assert payload["generationConfig"]["temperature"] == 0.2
+    assert payload["generationConfig"]["maxOutputTokens"] == 500
+
+
+def test_disabled_router_uses_the_capable_model(router, monkeypatch):
+    monkeypatch.setattr(model_router_module, "MODEL_ROUTER_ENABLED", False)
+    assert router.select("locket")["model"] == GEMINI_CAPABLE_MODEL
+
+
+def test_contents_tokens_ignore_media():
+    payload = text_payload("x" * 400)
+    payload["contents"][0]["parts"].append({"inline_data": {"mime_type": "image/png", "data": "y" * 4000}})
+    assert contents_tokens(payload) == 100
+
+
+def test_latency_stats_per_route(router):
+    route = router.select("locket")
+    for seconds in (0.1, 0.2, 0.3):
+        router.record(route, seconds)
+    router.record(route, 1.0, ok=False)
+    latency = router.stats()["latency"]["locket-text"]
+    assert latency["requests"] == 4 and latency["errors"] == 1
+    assert latency["p50_ms"] == 300.0
+    assert latency["avg_ms"] == 400.0
+
+
+def test_routes_file_replaces_the_defaults(tmp_path):
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps([{"name": "everything-fast", "model": "fast"}]))
+    assert load_routes(str(path)) == [{"name": "everything-fast", "model": "fast"}]
+    path.write_text(json.dumps({"not": "a list"}))
+    assert load_routes(str(path)) is DEFAULT_ROUTES
+    assert load_routes(str(tmp_path / "missing.json")) is DEFAULT_ROUTES
+
+
+def test_chat_requests_are_routed_and_recorded(client, gemini, username):
+    assert client.post("/chat", json={"message": "hi", "username": username}).status_code == 200
+    url, payload = next((url, payload) for url, payload in gemini.calls
+                        if payload["contents"][-1]["parts"][0]["text"].endswith(f"({username}): hi"))
+    assert GEMINI_FAST_MODEL in url
+    assert payload["generationConfig"]["maxOutputTokens"] == 1024
+    stats = client.get("/debug/model-routes").json()
+    assert stats["latency"]["chat-text-short"]["requests"] >= 1
+
+
+def test_short_tech_turn_gets_the_reasoning_route(client, gemini, username):
+    message = "How do I fix my laptop wifi driver"
+    assert client.post("/chat", json={"message": message, "username": username,
+                                      "mode": "personal-assistant"}).status_code == 200
+    url, payload = next((url, payload) for url, payload in gemini.calls
+                        if payload["contents"][-1]["parts"][0]["text"].endswith(message))
+    assert GEMINI_CAPABLE_MODEL in url
+    assert payload["generationConfig"]["thinkingConfig"]["thinkingBudget"] == 1024
+    assert client.get("/debug/model-routes").json()["latency"]["chat-text-reasoning"]["requests"] >= 1
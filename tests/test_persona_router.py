@@ -0,0 +1,74 @@
+import pytest
+
+import app
+import persona_router as persona_router_module
+from persona_router import PersonaRouter, stem
+
+PERSONAS = {
+    "chef": {"description": "Cooking and recipes", "keywords": ["recipe", "dinner", "bake", "ingredients"]},
+    "money": {"description": "Budgeting and savings", "keywords": ["budget", "savings", "invest", "tax"]},
+    "garden": {"description": "Gardening help", "keywords": ["plants", "soil", "compost", "seeds"]}
+}
+
+
+@pytest.fixture
+def router():
+    router = PersonaRouter()
+    router.train(PERSONAS, signature="test")
+    return router
+
+
+def test_stem_shares_features_between_word_forms():
+    assert stem("recipes") == stem("recipe") == "recipe"
+    assert stem("budgeting") == stem("budget") == "budget"
+    assert stem("dishes") == "dish"
+    assert stem("class") == "class"
+
+
+def test_clear_message_routes_to_one_persona(router):
+    assert router.route("Any recipe ideas for dinner?") == ["chef"]
+    ranked = router.classify("Any recipe ideas for dinner?")
+    assert ranked[0][0] == "chef"
+    assert abs(sum(probability for _, probability in ranked) - 1) < 1e-9
+
+
+def test_mixed_message_keeps_two_personas_sorted(router):
+    assert router.route("dinner recipe on a budget to grow savings") == ["chef", "money"]
+
+
+def test_unknown_words_fall_back_to_the_full_prompt(router):
+    assert router.route("hello there") is None
+    stats = router.stats()
+    assert stats["fallbacks"] == 1
+    assert stats["personas"] == ["chef", "garden", "money"]
+
+
+def test_low_confidence_falls_back(router, monkeypatch):
+    monkeypatch.setattr(persona_router_module, "PERSONA_ROUTER_MIN_CONFIDENCE", 1.01)
+    assert router.route("recipe for dinner") is None
+
+
+def test_disabled_router_always_falls_back(router, monkeypatch):
+    monkeypatch.setattr(persona_router_module, "PERSONA_ROUTER_ENABLED", False)
+    assert router.route("recipe for dinner") is None
+
+
+def test_persona_files_route_everyday_questions():
+    assert app.route_personas("Give me a recipe for vegetable curry for dinner") == ["chef_rile"]
+    assert app.route_personas("How do I fix my laptop wifi driver") == ["tech_rile"]
+    assert app.route_personas("What's up?") is None
+
+
+def test_routed_prompts_share_the_rules_prefix():
+    assistant_personas = {key: value for key, value in app.load_all_personas().items()
+                          if key != "sustainability_rile"}
+    rules = app.personal_assistant_rules(assistant_personas)
+    full = app.build_personal_assistant_prompt()
+    chef = app.build_personal_assistant_prompt(["chef_rile"])
+    assert full.startswith(rules) and chef.startswith(rules)
+    assert "ROUTED PERSONAS" in chef
+    assert "CHEF RILE BEHAVIORAL RUBRIC" in chef
+    assert "TECH RILE BEHAVIORAL RUBRIC" not in chef
+    assert "TECH RILE BEHAVIORAL RUBRIC" in full
+    assert len(chef) * 2 < len(full)
+    assert app.get_personal_assistant_prompt(["chef_rile"]) is app.get_personal_assistant_prompt(["chef_rile"])
@@ -0,0 +1,74 @@
+import database
+from prompt_assembly import append_turn, assemble_request, history_contents
+
+
+def test_same_role_turns_are_merged():
+    contents = []
+    append_turn(contents, "user", [{"text": "first"}])
+    append_turn(contents, "user", [{"text": "second"}, {"inline_data": {"mime_type": "image/jpeg"}}])
+    append_turn(contents, "model", [{"text": "answer"}])
+    assert contents == [
+        {"role": "user", "parts": [{"text": "first\n\nsecond"}, {"inline_data": {"mime_type": "image/jpeg"}}]},
+        {"role": "model", "parts": [{"text": "answer"}]}
+    ]
+
+
+def test_history_becomes_alternating_turns_with_notes():
+    contents = history_contents([
+        {"user_message": "look at this", "bot_response": "a bike", "has_media": True, "media_type": "image"},
+        {"user_message": "", "bot_response": "unprompted"},
+        {"user_message": "thanks", "bot_response": "", "channel": "locket"}
+    ])
+    assert [content["role"] for content in contents] == ["user", "model", "user"]
+    assert contents[0]["parts"][0]["text"] == "look at this (with image)"
+    assert contents[1]["parts"][0]["text"] == "a bike\n\nunprompted"
+    assert contents[2]["parts"][0]["text"] == "thanks (via camera locket)"
+
+
+def test_request_ends_with_the_current_user_turn(username):
+    for index in range(3):
+        database.save_conversation(f"session-{index}", username, f"question {index}", f"answer {index}",
+                                   mode="sustainability")
+    payload = assemble_request(username, "sustainability", "new question",
+                               media_parts=[{"inline_data": {"mime_type": "image/png", "data": ""}}],
+                               user_block="USER BLOCK", history_instructions="Use the history",
+                               instructions="Be brief", notes=["[note]"],
+                               generation_config={"temperature": 0.5})
+    contents = payload["contents"]
+    assert [content["role"] for content in contents] == ["user", "model"] * 3 + ["user"]
+    assert contents[0]["parts"][0]["text"] == "question 0"
+    final_text = contents[-1]["parts"][0]["text"]
+    assert final_text == (f"USER BLOCK\n\nUse the history\n\nBe brief\n\n"
+                          f"Current user ({username}): new question\n\n[note]")
+    assert contents[-1]["parts"][1] == {"inline_data": {"mime_type": "image/png", "data": ""}}
+    assert payload["generationConfig"] == {"temperature": 0.5}
+    assert "systemInstruction" not in payload
+
+
+def test_history_prefix_is_stable_between_requests(username):
+    database.save_conversation("session-1", username, "first", "reply", mode="sustainability")
+    one = assemble_request(username, "sustainability", "question one")
+    two = assemble_request(username, "sustainability", "question two")
+    assert one["contents"][:-1] == two["contents"][:-1]
+    assert one["contents"][-1] != two["contents"][-1]
+
+
+def test_history_instructions_only_with_history(username):
+    payload = assemble_request(username, "sustainability", "hello", history_instructions="Use the history")
+    assert payload["contents"] == [{"role": "user", "parts": [{"text": f"Current user ({username}): hello"}]}]
+
+
+def test_personal_assistant_also_replays_sustainability_turns(username):
+    database.save_conversation("s1", username, "compost tips?", "use browns", mode="sustainability")
+    database.save_conversation("s2", username, "plan my day", "sure", mode="personal-assistant")
+    payload = assemble_request(username, "personal-assistant", "and tomorrow?")
+    texts = [part["text"] for content in payload["contents"] for part in content["parts"]]
+    assert texts[:4] == ["compost tips?", "use browns", "plan my day", "sure"]
+
+
+def test_history_limit_keeps_the_newest_turns(username):
+    for index in range(4):
+        database.save_conversation(f"s{index}", username, f"question {index}", f"answer {index}",
+                                   mode="sustainability")
+    payload = assemble_request(username, "sustainability", "next", history_limit=2)
+    assert payload["contents"][0]["parts"][0]["text"] == "question 2"
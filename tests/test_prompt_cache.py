@@ -0,0 +1,99 @@
+import threading
+import time
+
+from prompt_cache import LocalCacheBackend, PromptCacheManager
+
+PROMPT = "You are a helpful assistant. " * 400  # Above PROMPT_CACHE_MIN_TOKENS
+MODEL = "gemini-test"
+
+
+class SlowBackend(LocalCacheBackend):
+    """Local backend whose create blocks until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.creates = 0
+
+    def create(self, model, system_text, display_name, ttl_seconds):
+        self.creates += 1
+        self.release.wait(5)
+        return super().create(model, system_text, display_name, ttl_seconds)
+
+
+class FailingBackend(LocalCacheBackend):
+    def create(self, model, system_text, display_name, ttl_seconds):
+        raise RuntimeError("cachedContents unavailable")
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_request_goes_inline_while_the_cache_is_registered():
+    backend = SlowBackend()
+    manager = PromptCacheManager(backend)
+    started = time.perf_counter()
+    assert manager.cached_content(MODEL, PROMPT) is None
+    assert manager.cached_content(MODEL, PROMPT) is None
+    assert time.perf_counter() - started < 1
+    assert wait_for(lambda: backend.creates == 1)
+
+    backend.release.set()
+    assert wait_for(lambda: manager.cached_content(MODEL, PROMPT) is not None)
+    assert backend.creates == 1
+    assert manager.stats()["creates"] == 1
+
+
+def test_apply_sends_the_prompt_inline_until_cached():
+    manager = PromptCacheManager(LocalCacheBackend())
+    payload = manager.apply({"contents": []}, MODEL, PROMPT)
+    assert payload["systemInstruction"]["parts"][0]["text"] == PROMPT
+    assert wait_for(lambda: manager.cached_content(MODEL, PROMPT) is not None)
+    payload = manager.apply({"contents": []}, MODEL, PROMPT)
+    assert payload["cachedContent"].startswith("cachedContents/")
+    assert "systemInstruction" not in payload
+
+
+def test_wait_blocks_until_registered():
+    manager = PromptCacheManager(LocalCacheBackend())
+    name = manager.cached_content(MODEL, PROMPT, wait=True)
+    assert name.startswith("cachedContents/")
+    assert manager.cached_content(MODEL, PROMPT) == name
+
+
+def test_expiring_cache_keeps_its_name_while_refreshed():
+    backend = LocalCacheBackend()
+    manager = PromptCacheManager(backend, ttl_seconds=100, refresh_seconds=200)
+    name = manager.cached_content(MODEL, PROMPT, wait=True)
+    # Always within refresh_seconds of expiry: every call extends in the background but keeps the name
+    assert manager.cached_content(MODEL, PROMPT) == name
+    assert wait_for(lambda: manager.stats()["refreshes"] >= 1)
+    assert manager.stats()["creates"] == 1
+
+
+def test_small_prompts_are_never_cached():
+    manager = PromptCacheManager(LocalCacheBackend())
+    assert manager.cached_content(MODEL, "short prompt", wait=True) is None
+
+
+def test_failure_sends_inline_until_retry():
+    manager = PromptCacheManager(FailingBackend())
+    assert manager.cached_content(MODEL, PROMPT, wait=True) is None
+    assert manager.stats()["failures"] == 1
+    # Within the retry window nothing is submitted again
+    assert manager.cached_content(MODEL, PROMPT) is None
+    assert manager.stats()["failures"] == 1
+
+
+def test_rejected_cache_falls_back_inline():
+    manager = PromptCacheManager(LocalCacheBackend())
+    name = manager.cached_content(MODEL, PROMPT, wait=True)
+    payload = {"contents": [], "cachedContent": name}
+    assert manager.fall_back_inline(payload) is True
+    assert payload["systemInstruction"]["parts"][0]["text"] == PROMPT
+    assert "cachedContent" not in payload
+    assert manager.fall_back_inline({"contents": []}) is False
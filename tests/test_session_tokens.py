@@ -0,0 +1,86 @@
+import pytest
+
+import session_tokens
+from session_tokens import (SessionTokenError, authenticate_request, issue_session_token,
+                            verify_session_token)
+
+
+def test_token_round_trip_carries_user_and_device():
+    issued = issue_session_token("alice", "cam-1", ttl_seconds=60)
+    claims = verify_session_token(issued["token"])
+    assert claims == {"username": "alice", "device_id": "cam-1", "expires_at": issued["expires_at"]}
+
+
+def test_tampered_token_is_rejected():
+    other_payload = issue_session_token("mallory")["token"].split(".")[0]
+    signature = issue_session_token("alice")["token"].split(".")[1]
+    with pytest.raises(SessionTokenError, match="Invalid"):
+        verify_session_token(f"{other_payload}.{signature}")
+    with pytest.raises(SessionTokenError, match="Invalid"):
+        verify_session_token("not-a-token")
+
+
+@pytest.mark.parametrize("token", ["pä.signature", "payload.sïgnature"])
+def test_non_ascii_token_is_invalid(token):
+    with pytest.raises(SessionTokenError, match="Invalid") as error:
+        verify_session_token(token)
+    assert error.value.status_code == 401
+
+
+def test_expired_token_is_rejected():
+    token = issue_session_token("alice", ttl_seconds=-1)["token"]
+    with pytest.raises(SessionTokenError, match="expired") as error:
+        verify_session_token(token)
+    assert error.value.status_code == 401
+
+
+def test_token_is_read_from_header_before_fields():
+    header_token = issue_session_token("alice")["token"]
+    claims = authenticate_request({"authorization": f"Bearer {header_token}"}, {"token": "ignored"})
+    assert claims["username"] == "alice"
+    field_token = issue_session_token("bob")["token"]
+    assert authenticate_request({}, {"token": field_token})["username"] == "bob"
+
+
+def test_token_of_another_user_or_device_is_forbidden():
+    token = issue_session_token("alice", "cam-1")["token"]
+    with pytest.raises(SessionTokenError) as error:
+        authenticate_request({}, {"token": token}, username="bob")
+    assert error.value.status_code == 403
+    with pytest.raises(SessionTokenError) as error:
+        authenticate_request({}, {"token": token}, device_id="cam-2")
+    assert error.value.status_code == 403
+
+
+def test_requests_without_token_pass_unless_required(monkeypatch):
+    assert authenticate_request({}, {}) is None
+    monkeypatch.setattr(session_tokens, "REQUIRE_SESSION_TOKEN", True)
+    with pytest.raises(SessionTokenError, match="required"):
+        authenticate_request({}, {})
+
+
+def test_login_token_authenticates_chat(client, username):
+    registered = client.post("/api/auth/register", json={"username": username, "password": "secret1"}).json()
+    assert verify_session_token(registered["token"])["username"] == username
+
+    token = client.post("/api/auth/login", json={"username": username, "password": "secret1"}).json()["token"]
+    response = client.post("/chat", json={"message": "hi", "mode": "sustainability"},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    forbidden = client.post("/chat", json={"message": "hi", "username": "someone-else", "token": token})
+    assert forbidden.status_code == 403
+
+
+def test_device_token_authenticates_heartbeat(client, username):
+    client.post("/api/auth/register", json={"username": username, "password": "secret1"})
+    device_id = f"cam-{username}"
+    registered = client.post("/api/esp32/register", json={"device_id": device_id, "username": username,
+                                                           "password": "secret1"}).json()
+    token = registered["token"]
+
+    heartbeat = client.post("/api/esp32/heartbeat", json={"device_id": device_id, "token": token})
+    assert heartbeat.json()["success"] is True
+
+    wrong_device = client.post("/api/esp32/heartbeat", json={"device_id": "cam-other", "token": token})
+    assert wrong_device.status_code == 403
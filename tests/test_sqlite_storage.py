@@ -0,0 +1,143 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+import sqlite_storage
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def save_turns(username, count, mode="sustainability"):
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    for index in range(count):
+        assert database.save_conversation_sqlite(f"session-{index}", username, f"message {index}", f"reply {index}",
+                                                 mode=mode, timestamp=start + timedelta(minutes=index))
+
+
+def test_init_creates_the_latest_schema_and_is_idempotent(sqlite_db):
+    conn = sqlite_storage.sqlite_connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == sqlite_storage.SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(conversations)")]
+    assert "channel" in columns
+    assert sqlite_storage.init_sqlite() == sqlite_storage.SCHEMA_VERSION
+
+
+def test_transaction_rolls_back_on_error(sqlite_db):
+    with pytest.raises(RuntimeError):
+        with sqlite_storage.sqlite_transaction() as conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+            raise RuntimeError("abort")
+    assert sqlite_storage.sqlite_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+
+def test_history_pages_use_timestamp_cursors(sqlite_db):
+    save_turns("alice", 5)
+    save_turns("bob", 2)
+    first = database.load_conversation_page("alice", "sustainability", limit=2)
+    assert [msg["user_message"] for msg in first["messages"]] == ["message 4", "message 3"]
+    assert first["has_more"] is True
+
+    second = database.load_conversation_page("alice", "sustainability", limit=2, before=first["next_cursor"])
+    assert [msg["user_message"] for msg in second["messages"]] == ["message 2", "message 1"]
+
+    newer = database.load_conversation_page("alice", "sustainability", limit=10, after=second["prev_cursor"])
+    assert [msg["user_message"] for msg in newer["messages"]] == ["message 4", "message 3"]
+    assert database.count_conversation_turns("alice", "sustainability") == 5
+
+
+def test_history_pages_keep_each_memory_with_its_turn(sqlite_db):
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    for index in range(4):
+        turn_time = start + timedelta(minutes=index)
+        # Stamped while the turn is handled, a moment before the turn is saved
+        memory = {"media_type": "image", "timestamp": (turn_time - timedelta(seconds=1)).isoformat(),
+                  "detailed_analysis": f"analysis {index}", "extracted_memory": {}}
+        database.save_conversation_sqlite(f"session-{index}", "alice", f"message {index}", "reply",
+                                          has_media=True, media_type="image", mode="personal-assistant",
+                                          detailed_memory=memory, timestamp=turn_time)
+
+    first = database.load_conversation_page("alice", "personal-assistant", limit=2)
+    assert [m["detailed_analysis"] for m in first["detailed_memories"]] == ["analysis 3", "analysis 2"]
+    second = database.load_conversation_page("alice", "personal-assistant", limit=2, before=first["next_cursor"])
+    assert [m["detailed_analysis"] for m in second["detailed_memories"]] == ["analysis 1", "analysis 0"]
+    newer = database.load_conversation_page("alice", "personal-assistant", limit=10, after=second["prev_cursor"])
+    assert [m["detailed_analysis"] for m in newer["detailed_memories"]] == ["analysis 3", "analysis 2"]
+
+
+def test_history_query_uses_the_user_mode_index(sqlite_db):
+    plan = sqlite_storage.sqlite_connection().execute("""
+        EXPLAIN QUERY PLAN SELECT * FROM conversations
+        WHERE username = ? AND mode = ? ORDER BY timestamp DESC LIMIT 10
+    """, ("alice", "sustainability")).fetchall()
+    assert any("idx_conversations_user_mode_ts" in row["detail"] for row in plan)
+
+
+def test_memories_are_loaded_by_mode_through_their_index(sqlite_db):
+    for index, mode in enumerate(("personal-assistant", "sustainability")):
+        memory = {"media_type": "image", "timestamp": f"2024-01-01T10:00:0{index}",
+                  "detailed_analysis": f"{mode} analysis", "extracted_memory": {}}
+        database.save_conversation_sqlite(f"session-{index}", "alice", "look", "reply", has_media=True,
+                                          media_type="image", mode=mode, detailed_memory=memory)
+    memories = database.load_conversation("alice", "personal-assistant")["detailed_memories"]
+    assert [memory["detailed_analysis"] for memory in memories] == ["personal-assistant analysis"]
+
+    plan = sqlite_storage.sqlite_connection().execute("""
+        EXPLAIN QUERY PLAN SELECT media_type, timestamp, detailed_analysis, extracted_memory
+        FROM detailed_memories WHERE username = ? AND mode = ? ORDER BY timestamp ASC
+    """, ("alice", "personal-assistant")).fetchall()
+    assert any("idx_detailed_memories_user_mode_ts" in row["detail"] for row in plan)
+
+
+def test_users_and_summaries_round_trip(sqlite_db):
+    assert database.register_user("alice", "secret")["success"] is True
+    assert database.register_user("alice", "other")["error"] == "Username already exists"
+    assert database.verify_login("alice", "secret")["success"] is True
+    assert database.verify_login("alice", "wrong")["success"] is False
+    assert database.check_username_exists("alice") is True
+
+    assert database.save_summary("alice", "sustainability", "Talked about compost", 12) is True
+    summary = database.load_summary("alice", "sustainability")
+    assert summary["summary"] == "Talked about compost"
+    assert summary["summarized_count"] == 12
+
+
+def test_new_database_imports_the_json_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_json("memory/users.json", {"alice": {"password_hash": database.hash_password("secret"),
+                                               "created_at": "2024-01-01T00:00:00"}})
+    write_json("memory/summaries/alice.json", {"sustainability": {"summary": "Earlier", "summarized_count": 3}})
+    write_json("memory/sustainability/alice.json", {
+        "messages": [
+            {"session_id": "s1", "user_message": "hi", "bot_response": "hello", "timestamp": "2024-01-01T10:00:00"},
+            {"session_id": "s2", "user_message": "photo", "bot_response": "nice", "has_media": True,
+             "media_type": "image", "timestamp": "2024-01-01T11:00:00"},
+            {"role": "system", "content": "not a turn"}
+        ],
+        "detailed_memories": [{"media_type": "image", "timestamp": "2024-01-01T10:59:59",
+                               "detailed_analysis": "a bike", "extracted_memory": {"objects": ["bike"]}}]
+    })
+    monkeypatch.setattr(sqlite_storage, "SQLITE_DATABASE_PATH", str(tmp_path / "assistant.db"))
+    monkeypatch.setattr(sqlite_storage, "_local", type(sqlite_storage._local)())
+    sqlite_storage.init_sqlite()
+    conn = sqlite_storage.sqlite_connection()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 2
+        memory = conn.execute("SELECT session_id, extracted_memory FROM detailed_memories").fetchone()
+        assert memory["session_id"] == "s2"
+        assert json.loads(memory["extracted_memory"]) == {"objects": ["bike"]}
+
+        # Importing again only adds what is missing
+        counts = sqlite_storage.import_json_storage()
+        assert counts["conversations"] == 0
+        assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 2
+    finally:
+        conn.close()
@@ -0,0 +1,47 @@
+import time
+import asyncio
+
+import pytest
+
+import app
+import database
+
+
+def test_every_phase_is_timed_before_the_first_request(client):
+    timings = client.get("/debug/startup").json()
+    for phase in ("database", "device_cache", "db_connections", "media_jobs", "personas",
+                  "persona_router", "prompt_cache", "assets", "gemini_connection", "total"):
+        assert phase in timings
+    assert timings["total"] >= timings["database"]
+    assert database._initialized is True
+
+
+def test_init_database_is_idempotent(client):
+    assert database.init_database() is None
+    assert database._initialized is True
+
+
+def test_optional_phase_failure_is_recorded_and_ignored():
+    def broken():
+        raise RuntimeError("warm-up failed")
+
+    assert asyncio.run(app.run_startup_phase("broken_phase", broken)) is None
+    assert "broken_phase" in app.startup_timings
+
+
+def test_required_phase_failure_aborts_startup():
+    def broken():
+        raise RuntimeError("schema failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(app.run_startup_phase("broken_required", broken, required=True))
+    assert "broken_required" in app.startup_timings
+
+
+def test_independent_phases_run_in_parallel():
+    async def run():
+        started = time.perf_counter()
+        await asyncio.gather(*(app.run_startup_phase(f"sleep_{index}", time.sleep, 0.2) for index in range(3)))
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 0.5
@@ -0,0 +1,72 @@
+import json
+import os
+
+import pytest
+
+import database
+from user_directory import UserDirectory, write_json_atomic
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return UserDirectory(str(tmp_path / "users.json"), flush_interval=3600)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_file_is_read_once(tmp_path):
+    path = tmp_path / "users.json"
+    path.write_text(json.dumps({"alice": {"password_hash": "x"}}))
+    directory = UserDirectory(str(path), flush_interval=3600)
+    assert directory.exists("alice")
+    path.write_text("{}")
+    assert directory.get("alice") == {"password_hash": "x"}
+    assert directory.count() == 1
+
+
+def test_registration_is_persisted_right_away(directory):
+    assert directory.add("alice", {"password_hash": "x"}) is True
+    assert directory.add("alice", {"password_hash": "y"}) is False
+    assert read(directory.path) == {"alice": {"password_hash": "x"}}
+    assert directory.stats()["writes"] == 1
+
+
+def test_logins_are_coalesced_until_the_flush(directory):
+    directory.add("alice", {"password_hash": "x"})
+    directory.record_login("alice", "2024-01-01T10:00:00")
+    directory.record_login("alice", "2024-01-01T11:00:00")
+    assert "last_login" not in read(directory.path)["alice"]
+    assert directory.stats()["dirty"] is True
+    assert directory.stats()["coalesced_logins"] == 1
+
+    directory.flush()
+    assert read(directory.path)["alice"]["last_login"] == "2024-01-01T11:00:00"
+    assert directory.stats()["writes"] == 2
+    directory.flush()
+    assert directory.stats()["writes"] == 2
+
+
+def test_get_returns_a_copy(directory):
+    directory.add("alice", {"password_hash": "x"})
+    directory.get("alice")["password_hash"] = "changed"
+    assert directory.get("alice")["password_hash"] == "x"
+
+
+def test_failed_atomic_write_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_json_atomic(path, {"alice": {}})
+    with pytest.raises(TypeError):
+        write_json_atomic(path, {"bob": object()})
+    assert read(path) == {"alice": {}}
+    assert os.listdir(tmp_path) == ["users.json"]
+
+
+def test_json_backend_auth_goes_through_the_directory(username):
+    assert database.register_user(username, "secret")["success"] is True
+    assert database.check_username_exists(username) is True
+    assert database.verify_login(username, "secret")["success"] is True
+    assert database.verify_login(username, "wrong")["success"] is False
+    assert database.register_user(username, "again")["success"] is False
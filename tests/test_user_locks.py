@@ -0,0 +1,45 @@
+import threading
+
+import database
+from user_locks import user_write_lock
+
+
+def test_same_user_always_gets_the_same_reentrant_lock():
+    lock = user_write_lock("alice")
+    assert user_write_lock("alice") is lock
+    with lock:
+        assert lock.acquire(blocking=False)
+        lock.release()
+
+
+def test_other_users_are_not_blocked():
+    users = [f"user-{index}" for index in range(20)]
+    other = next(user for user in users if user_write_lock(user) is not user_write_lock("alice"))
+    acquired = []
+
+    def write_other():
+        with user_write_lock(other):
+            acquired.append(other)
+
+    with user_write_lock("alice"):
+        thread = threading.Thread(target=write_other)
+        thread.start()
+        thread.join(2)
+        assert acquired == [other]
+
+
+def test_concurrent_json_saves_for_one_user_keep_every_turn(username):
+    def save(index):
+        database.save_conversation(f"session-{index}", username, f"message {index}", "reply",
+                                   mode="sustainability")
+
+    threads = [threading.Thread(target=save, args=(index,)) for index in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    messages = database.load_conversation(username, "sustainability")["messages"]
+    assert sorted(msg["user_message"] for msg in messages) == sorted(f"message {index}" for index in range(10))
+    timestamps = [msg["timestamp"] for msg in messages]
+    assert timestamps == sorted(timestamps)
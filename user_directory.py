@@ -0,0 +1,145 @@
+"""
+User Directory Module
+In-memory user table for the JSON backend: users.json is read once and every auth
+check is a dict lookup. Registrations are persisted atomically (temp file + rename);
+last_login updates only mark the table dirty and are flushed together every
+USER_DIRECTORY_FLUSH_SECONDS (and at exit) instead of rewriting the file per login
+"""
+
+import os
+import json
+import atexit
+import tempfile
+import threading
+from typing import Optional, Dict
+
+# Configuration
+MEMORY_DIR = "memory"
+USERS_FILE = os.path.join(MEMORY_DIR, "users.json")
+USER_DIRECTORY_FLUSH_SECONDS = float(os.environ.get("USER_DIRECTORY_FLUSH_SECONDS", "30"))
+
+
+def write_json_atomic(path: str, data, **dump_kwargs):
+    """Write JSON to a temp file in the same directory, fsync it and rename it over path,
+    so readers and crashes only ever see the old or the new file, never half of one"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class UserDirectory:
+    """users.json loaded once, indexed by username"""
+
+    def __init__(self, path: str = USERS_FILE, flush_interval: float = USER_DIRECTORY_FLUSH_SECONDS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._users: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+        # Metrics
+        self._writes = 0
+        self._coalesced_logins = 0
+
+    def _load(self) -> Dict[str, Dict]:
+        """Caller holds the lock"""
+        if self._users is None:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self._users = json.load(f)
+            else:
+                self._users = {}
+            print(f"[INFO] Loaded user directory: {len(self._users)} users")
+        return self._users
+
+    def _persist(self):
+        """Caller holds the lock"""
+        write_json_atomic(self.path, self._users, indent=2)
+        self._dirty = False
+        self._writes += 1
+
+    def get(self, username: str) -> Optional[Dict]:
+        with self._lock:
+            user = self._load().get(username)
+            return dict(user) if user else None
+
+    def exists(self, username: str) -> bool:
+        with self._lock:
+            return username in self._load()
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+    def add(self, username: str, record: Dict) -> bool:
+        """Insert a new user and persist right away - False if the name is taken"""
+        with self._lock:
+            users = self._load()
+            if username in users:
+                return False
+            users[username] = record
+            try:
+                self._persist()
+            except Exception:
+                del users[username]
+                raise
+            return True
+
+    def record_login(self, username: str, timestamp: str):
+        """Update last_login in memory; written by the next periodic flush"""
+        with self._lock:
+            user = self._load().get(username)
+            if user is None:
+                return
+            user["last_login"] = timestamp
+            if self._dirty:
+                self._coalesced_logins += 1
+            self._dirty = True
+            self._start_flusher()
+
+    def flush(self):
+        """Write pending last_login updates (no-op when nothing changed)"""
+        with self._lock:
+            if self._dirty and self._users is not None:
+                try:
+                    self._persist()
+                except Exception as e:
+                    print(f"[ERROR] Failed to flush user directory: {e}")
+
+    def _start_flusher(self):
+        """Caller holds the lock"""
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="user-directory-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        stop = threading.Event()
+        while not stop.wait(self.flush_interval):
+            self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "users": len(self._users) if self._users is not None else None,
+                "dirty": self._dirty,
+                "writes": self._writes,
+                "coalesced_logins": self._coalesced_logins,
+                "flush_seconds": self.flush_interval
+            }
+
+
+user_directory = UserDirectory()
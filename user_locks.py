@@ -0,0 +1,25 @@
+"""
+User Locks Module
+Per-user write serialization: writes for one user run one at a time, writes for
+different users run in parallel. Locks are striped (a fixed array indexed by a hash of
+the username) so memory stays bounded however many users there are; two users only
+share a lock when they hash to the same stripe.
+
+Threading locks rather than asyncio locks, because storage is written from the event
+loop, the request thread pool and the background job / summary threads alike.
+"""
+
+import os
+import zlib
+import threading
+
+# Configuration
+USER_LOCK_STRIPES = int(os.environ.get("USER_LOCK_STRIPES", "256"))
+
+# Re-entrant so a dispatcher and the backend function it calls can both hold it
+_stripes = [threading.RLock() for _ in range(max(1, USER_LOCK_STRIPES))]
+
+
+def user_write_lock(username: str) -> threading.RLock:
+    """Lock that orders writes for this user - use as `with user_write_lock(username): ...`"""
+    return _stripes[zlib.crc32((username or "").encode("utf-8")) % len(_stripes)]